@@ -1,4 +1,4 @@
-from stix2 import Bundle, CustomObject
+from stix2 import CustomObject
 from stix2.properties import (
     EnumProperty,
     ListProperty,
@@ -9,6 +9,14 @@ from stix2.properties import (
 from stix2.v21 import _STIXBase21
 from typing import List
 
+# the bundle helpers work on stix2 bundles and records.FlowBundle alike, and live with the records so that
+# the default parsing path never imports stix2
+from attack_flow_extension.records import (  # noqa: F401
+    get_flows_from_stix_bundle,
+    get_single_flow_object_by_id,
+    index_flow_objects,
+)
+
 
 @CustomObject(
     "attack-flow",
@@ -78,6 +86,7 @@ class AttackAction(_STIXBase21):
     Represents an attack action.
 
     Attributes:
+        technique_id (str): The ATT&CK ID of the action's technique.
         technique_ref (str): The technique reference of the action.
         effect_refs (list): A list of effect references of the action.
     """
@@ -94,6 +103,15 @@ class AttackAction(_STIXBase21):
             return None
         return self.technique_ref
 
+    def get_technique_id(self) -> str | None:
+        """
+        Returns the ATT&CK ID of the action's technique.
+
+        Returns:
+            str: The ATT&CK ID, e.g. T1059.001.
+        """
+        return self.get("technique_id")
+
     def get_effect_refs(self) -> List[str]:
         """
         Returns the effect references of the action.
@@ -263,45 +281,4 @@ class AttackOperator(_STIXBase21):
         return self.operator == "OR"
 
 
-def get_flows_from_stix_bundle(bundle: Bundle) -> List[AttackFlow]:
-    """
-    Get the attack flow object from a STIX bundle.
-
-    Args:
-        bundle (Bundle): The STIX bundle.
-
-    Returns:
-        AttackFlow: The attack flow object.
-    """
-    flows: List[AttackFlow] = []
-    for obj in bundle.objects:
-        if obj.type == "attack-flow":
-            flows.append(obj)
-    return flows
-
-
-def get_single_flow_object_by_id(
-    flow_id: str, flow_bundle: Bundle
-) -> AttackAction | AttackOperator | AttackCondition:
-    """
-    Retrieves a single flow object by its ID from a given flow bundle.
-
-    Args:
-        flow_id (str): The ID of the flow object to retrieve.
-        flow_bundle (Bundle): The flow bundle containing the flow objects.
-
-    Returns:
-        AttackAction | AttackOperator | AttackCondition: The flow object with the specified ID.
-
-    Raises:
-        ValueError: If no object or more than one object with the specified ID is found.
-    """
-    candidate_objects = flow_bundle.get_obj(flow_id)
-    if len(candidate_objects) != 1:
-        raise ValueError(
-            f"Expected to find exactly one object with id {flow_id}, but found {len(candidate_objects)}, {candidate_objects}"
-        )
-    return candidate_objects[0]
-
-
 # TODO add a funciton to look up object from the flow
@@ -0,0 +1,403 @@
+"""
+Lightweight records for the attack flow objects the converter reads.
+
+stix2.parse builds and validates a full STIX object for every entry of a flow export, assets, processes and
+notes included, although the conversion only ever reads a handful of fields of the attack-flow,
+attack-action, attack-operator and attack-condition objects. parse_flow_bundle decodes the JSON once and
+keeps just those objects, as __slots__ records exposing the same attributes, item access and helper methods
+as the stix2 classes in flow.py. Required fields are still checked, but values are not validated against
+the STIX specification, which is what main.read_flow_file(strict=True) is for.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, List, Union, cast
+
+
+class FlowRecord:
+    """
+    Base class of the records, supporting the mapping style access the converter uses on stix2 objects.
+
+    A field that was missing from the export is None, and is reported as absent by `in` and get.
+
+    Attributes:
+        id (str): The STIX identifier of the object.
+        type (str): The STIX type of the object.
+    """
+
+    __slots__ = ("id",)
+    type = ""
+
+    def __init__(self, stix_id: str):
+        self.id = stix_id
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, None) if isinstance(key, str) else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and getattr(self, key, None) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Returns a field of the object.
+
+        Args:
+            key (str): The name of the field.
+            default (Any): What to return if the object does not have the field.
+
+        Returns:
+            Any: The value of the field, or default.
+        """
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id!r})"
+
+
+class AttackFlowRecord(FlowRecord):
+    """
+    An attack-flow object, see flow.AttackFlow.
+
+    Attributes:
+        name (str): The name of the flow.
+        description (str | None): The description of the flow.
+        start_refs (list[str]): The actions and conditions the flow starts from.
+    """
+
+    __slots__ = ("name", "description", "start_refs")
+    type = "attack-flow"
+
+    def __init__(
+        self,
+        stix_id: str,
+        name: str,
+        start_refs: List[str],
+        description: str | None = None,
+    ):
+        super().__init__(stix_id)
+        self.name = name
+        self.description = description
+        self.start_refs = start_refs
+
+    def get_starting_points(self) -> List[str]:
+        """
+        Returns the start references of the flow.
+
+        Returns:
+            list: A list of start references.
+        """
+        return self.start_refs
+
+
+class AttackActionRecord(FlowRecord):
+    """
+    An attack-action object, see flow.AttackAction.
+
+    Attributes:
+        name (str): The name of the action.
+        description (str | None): The description of the action.
+        technique_id (str | None): The ATT&CK ID of the technique, e.g. T1059.001.
+        technique_ref (str | None): The STIX identifier of the attack pattern.
+        effect_refs (list[str] | None): The objects the action leads to.
+    """
+
+    __slots__ = ("name", "description", "technique_id", "technique_ref", "effect_refs")
+    type = "attack-action"
+
+    def __init__(
+        self,
+        stix_id: str,
+        name: str,
+        description: str | None = None,
+        technique_id: str | None = None,
+        technique_ref: str | None = None,
+        effect_refs: List[str] | None = None,
+    ):
+        super().__init__(stix_id)
+        self.name = name
+        self.description = description
+        self.technique_id = technique_id
+        self.technique_ref = technique_ref
+        self.effect_refs = effect_refs
+
+    def get_technique_ref(self) -> str | None:
+        """
+        Returns the technique reference of the action.
+
+        Returns:
+            str: The technique reference.
+        """
+        return self.technique_ref
+
+    def get_technique_id(self) -> str | None:
+        """
+        Returns the ATT&CK ID of the action's technique.
+
+        Returns:
+            str: The ATT&CK ID, e.g. T1059.001.
+        """
+        return self.technique_id
+
+    def get_effect_refs(self) -> List[str]:
+        """
+        Returns the effect references of the action.
+
+        Returns:
+            list: A list of effect references.
+        """
+        return self.effect_refs or []
+
+    def get_attack_pattern_id(self) -> str | None:
+        """
+        Returns the attack pattern of the action.
+
+        Returns:
+            str: The attack pattern.
+        """
+        return self.technique_ref
+
+
+class AttackOperatorRecord(FlowRecord):
+    """
+    An attack-operator object, see flow.AttackOperator.
+
+    Attributes:
+        operator (str): "AND" or "OR".
+        effect_refs (list[str] | None): The objects the operator leads to.
+    """
+
+    __slots__ = ("operator", "effect_refs")
+    type = "attack-operator"
+
+    def __init__(
+        self, stix_id: str, operator: str, effect_refs: List[str] | None = None
+    ):
+        super().__init__(stix_id)
+        self.operator = operator
+        self.effect_refs = effect_refs
+
+    def is_and(self) -> bool:
+        """
+        Returns whether the operator is an AND operator.
+
+        Returns:
+            bool: True if the operator is an AND operator, False otherwise.
+        """
+        return self.operator == "AND"
+
+    def is_or(self) -> bool:
+        """
+        Returns whether the operator is an OR operator.
+
+        Returns:
+            bool: True if the operator is an OR operator, False otherwise.
+        """
+        return self.operator == "OR"
+
+
+class AttackConditionRecord(FlowRecord):
+    """
+    An attack-condition object, see flow.AttackCondition.
+
+    Attributes:
+        description (str): The description of the condition.
+        on_true_refs (list[str] | None): The objects that follow when the condition holds.
+        on_false_refs (list[str] | None): The objects that follow when it does not.
+    """
+
+    __slots__ = ("description", "on_true_refs", "on_false_refs")
+    type = "attack-condition"
+
+    def __init__(
+        self,
+        stix_id: str,
+        description: str,
+        on_true_refs: List[str] | None = None,
+        on_false_refs: List[str] | None = None,
+    ):
+        super().__init__(stix_id)
+        self.description = description
+        self.on_true_refs = on_true_refs
+        self.on_false_refs = on_false_refs
+
+
+class FlowBundle:
+    """
+    The attack flow objects of a flow export, standing in for the stix2.Bundle parsed from it.
+
+    Attributes:
+        id (str): The STIX identifier of the bundle.
+        objects (list[FlowRecord]): The attack flow objects, in bundle order.
+    """
+
+    __slots__ = ("id", "objects")
+
+    def __init__(self, stix_id: str, objects: List[FlowRecord]):
+        self.id = stix_id
+        self.objects = objects
+
+    def get_obj(self, stix_id: str) -> List[FlowRecord]:
+        """
+        Returns the objects with an ID, like stix2.Bundle.get_obj.
+
+        Args:
+            stix_id (str): The STIX identifier to look for.
+
+        Returns:
+            list[FlowRecord]: The objects with that ID.
+        """
+        return [obj for obj in self.objects if obj.id == stix_id]
+
+
+def _record(obj: dict[str, Any]) -> FlowRecord | None:
+    """
+    Build the record of one decoded object, None for the types the converter does not read.
+
+    Raises:
+        KeyError: If a required field is missing.
+    """
+    object_type = obj.get("type")
+    if object_type == "attack-action":
+        return AttackActionRecord(
+            obj["id"],
+            obj["name"],
+            obj.get("description"),
+            obj.get("technique_id"),
+            obj.get("technique_ref"),
+            obj.get("effect_refs"),
+        )
+    if object_type == "attack-operator":
+        return AttackOperatorRecord(obj["id"], obj["operator"], obj.get("effect_refs"))
+    if object_type == "attack-condition":
+        return AttackConditionRecord(
+            obj["id"],
+            obj["description"],
+            obj.get("on_true_refs"),
+            obj.get("on_false_refs"),
+        )
+    if object_type == "attack-flow":
+        return AttackFlowRecord(
+            obj["id"], obj["name"], obj["start_refs"], obj.get("description")
+        )
+    return None
+
+
+def parse_flow_bundle(data: dict[str, Any]) -> FlowBundle:
+    """
+    Build the records of the attack flow objects in a decoded flow export.
+
+    Args:
+        data (dict[str, Any]): The decoded JSON of the export.
+
+    Returns:
+        FlowBundle: The attack-flow, attack-action, attack-operator and attack-condition objects.
+
+    Raises:
+        ValueError: If the data is not a bundle, or an attack flow object lacks a required field.
+    """
+    if not isinstance(data, dict) or data.get("type") != "bundle":
+        raise ValueError("Expected a STIX bundle")
+    records = []
+    for obj in data.get("objects", []):
+        try:
+            record = _record(obj)
+        except KeyError as error:
+            raise ValueError(
+                f"{obj.get('type')} {obj.get('id')} is missing the required field {error}"
+            ) from error
+        if record is not None:
+            records.append(record)
+    return FlowBundle(data.get("id", ""), records)
+
+
+if TYPE_CHECKING:
+    import stix2
+
+    from attack_flow_extension.flow import (
+        AttackAction,
+        AttackCondition,
+        AttackFlow,
+        AttackOperator,
+    )
+
+    # the bundle helpers below take the export parsed by stix2 or into records alike
+    AnyBundle = Union[stix2.Bundle, FlowBundle]
+    AnyAttackFlow = Union[AttackFlow, AttackFlowRecord]
+    FlowNode = Union[
+        AttackAction,
+        AttackOperator,
+        AttackCondition,
+        AttackActionRecord,
+        AttackOperatorRecord,
+        AttackConditionRecord,
+    ]
+
+
+def get_flows_from_stix_bundle(bundle: AnyBundle) -> List[AnyAttackFlow]:
+    """
+    Get the attack flow object from a STIX bundle.
+
+    Args:
+        bundle (AnyBundle): The stix2.Bundle or FlowBundle.
+
+    Returns:
+        List[AnyAttackFlow]: The attack flow objects.
+    """
+    flows: List[AnyAttackFlow] = []
+    for obj in bundle.objects:
+        if obj.type == "attack-flow":
+            flows.append(cast("AnyAttackFlow", obj))
+    return flows
+
+
+def index_flow_objects(bundle: AnyBundle) -> dict[str, List[Any]]:
+    """
+    Index the objects of a STIX bundle by ID.
+
+    Building the index once replaces a scan of the whole bundle for every lookup, and the same index
+    can be shared by every attack flow in the bundle.
+
+    Args:
+        bundle (AnyBundle): The stix2.Bundle or FlowBundle.
+
+    Returns:
+        dict[str, List[Any]]: The objects with each ID, in bundle order.
+    """
+    index: dict[str, List[Any]] = {}
+    for obj in bundle.objects:
+        index.setdefault(obj["id"], []).append(obj)
+    return index
+
+
+def get_single_flow_object_by_id(
+    flow_id: str,
+    flow_bundle: AnyBundle,
+    object_index: dict[str, List[Any]] | None = None,
+) -> FlowNode:
+    """
+    Retrieves a single flow object by its ID from a given flow bundle.
+
+    Args:
+        flow_id (str): The ID of the flow object to retrieve.
+        flow_bundle (AnyBundle): The stix2.Bundle or FlowBundle containing the flow objects.
+        object_index (dict[str, List[Any]] | None): An index from index_flow_objects, avoids scanning the bundle.
+
+    Returns:
+        FlowNode: The attack action, operator or condition with the specified ID.
+
+    Raises:
+        ValueError: If no object or more than one object with the specified ID is found.
+    """
+    if object_index is not None:
+        candidate_objects = object_index.get(flow_id, [])
+    else:
+        candidate_objects = flow_bundle.get_obj(flow_id)
+    if len(candidate_objects) != 1:
+        raise ValueError(
+            f"Expected to find exactly one object with id {flow_id}, but found {len(candidate_objects)}, {candidate_objects}"
+        )
+    return cast("FlowNode", candidate_objects[0])
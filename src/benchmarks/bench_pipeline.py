@@ -0,0 +1,284 @@
+"""
+End-to-end benchmark of the conversion stages on synthetic flows, with a regression check.
+
+Every stage of both conversion paths is timed and its peak memory measured with tracemalloc, on flows of
+increasing size from benchmarks.synthetic and with the probabilities of a synthetic ATT&CK bundle:
+
+    networkx path   read_flow_file, convert_attack_flow_to_nx, make_nx_graph_more_readable,
+                    flow_nx_to_pgmpy, pgmpy_to_unbbayes_hugin
+    compact path    compact.from_attack_flow, layered_positions, write_compact_net,
+                    assembly.assemble_network
+
+Times are the fastest of --repeat runs without tracing, peaks come from one more, traced run. --output saves
+the results as JSON; given such a file as --baseline, the benchmark exits with status 1 if a stage got more
+than --threshold times slower or hungrier than in the baseline.
+
+Run from the src directory:
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import main
+from attack_flow_extension import records
+from benchmarks import synthetic
+from flow_network import assembly, compact
+from flow_network import layout as flow_layout
+from hugin_net import writer as hugin_writer
+from stix_probability import cache
+
+# stages faster or smaller than this are too noisy to flag
+MIN_SECONDS = 0.005
+MIN_PEAK_BYTES = 1 << 20
+
+
+def measure(stage: Callable[[], Any], repeat: int) -> tuple[Any, float, int]:
+    """
+    Run a stage repeatedly for its time, then once under tracemalloc for its peak memory.
+
+    Args:
+        stage (Callable[[], Any]): The stage.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        tuple[Any, float, int]: The result of the stage, its fastest time in seconds and its peak allocation in bytes.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_stages(
+    flow_file: str,
+    probability_db: Any,
+    repeat: int,
+    legacy: bool,
+) -> list[tuple[str, float, int]]:
+    """
+    Measure every stage of the conversion of one flow file.
+
+    Args:
+        flow_file (str): The flow export.
+        probability_db (Any): The probability database.
+        repeat (int): The number of timed runs per stage.
+        legacy (bool): Whether to measure the networkx/pgmpy path as well.
+
+    Returns:
+        list[tuple[str, float, int]]: The name, time in seconds and peak bytes of every stage.
+    """
+    measurements = []
+
+    def stage(name: str, function: Callable[[], Any]) -> Any:
+        result, seconds, peak = measure(function, repeat)
+        measurements.append((name, seconds, peak))
+        return result
+
+    flow_bundle = stage("read_flow_file", lambda: main.read_flow_file(flow_file))
+    attack_flow = records.get_flows_from_stix_bundle(flow_bundle)[0]
+    object_index = records.index_flow_objects(flow_bundle)
+
+    if legacy:
+        graph = stage(
+            "convert_attack_flow_to_nx",
+            lambda: main.convert_attack_flow_to_nx(
+                attack_flow, flow_bundle, object_index
+            ),
+        )
+        graph = stage(
+            "make_nx_graph_more_readable",
+            lambda: main.make_nx_graph_more_readable(graph),
+        )
+        model = stage(
+            "flow_nx_to_pgmpy", lambda: main.flow_nx_to_pgmpy(graph, probability_db)
+        )
+        stage("pgmpy_to_unbbayes_hugin", lambda: main.pgmpy_to_unbbayes_hugin(model))
+
+    compact_flow = stage(
+        "compact.from_attack_flow",
+        lambda: compact.from_attack_flow(attack_flow, flow_bundle, object_index),
+    )
+    compact_flow.positions = stage(
+        "layered_positions", lambda: flow_layout.layered_positions(compact_flow)
+    )
+
+    def write_compact() -> str:
+        buffer = io.StringIO()
+        hugin_writer.write_compact_net(
+            compact_flow,
+            compact.node_probabilities(compact_flow, probability_db),
+            buffer,
+        )
+        return buffer.getvalue()
+
+    stage("write_compact_net", write_compact)
+    stage(
+        "assembly.assemble_network",
+        lambda: assembly.assemble_network(
+            compact_flow, compact.node_probabilities(compact_flow, probability_db)
+        ),
+    )
+    return measurements
+
+
+def find_regressions(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    threshold: float,
+) -> list[str]:
+    """
+    Compare results with a baseline from an earlier run.
+
+    Args:
+        results (list[dict[str, Any]]): The results of this run.
+        baseline (list[dict[str, Any]]): The results of the baseline run.
+        threshold (float): How many times slower or larger a stage may get.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    previous = {(row["nodes"], row["stage"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row["nodes"], row["stage"]))
+        if before is None:
+            continue
+        if (
+            row["seconds"] > MIN_SECONDS
+            and row["seconds"] > threshold * before["seconds"]
+        ):
+            regressions.append(
+                f"{row['stage']} on {row['nodes']} nodes took {row['seconds']:.3f}s, "
+                f"{row['seconds'] / before['seconds']:.1f}x the baseline"
+            )
+        if (
+            row["peak_bytes"] > MIN_PEAK_BYTES
+            and row["peak_bytes"] > threshold * before["peak_bytes"]
+        ):
+            regressions.append(
+                f"{row['stage']} on {row['nodes']} nodes peaked at {row['peak_bytes'] / 2**20:.1f} MiB, "
+                f"{row['peak_bytes'] / before['peak_bytes']:.1f}x the baseline"
+            )
+    return regressions
+
+
+def main_benchmark() -> None:
+    """
+    Measure the stages on flows of increasing size, print one row per stage and check for regressions.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=0,
+        help="layers per flow, 0 for the square root of the size",
+    )
+    parser.add_argument("--max_fan_in", type=int, default=3)
+    parser.add_argument("--operator_fraction", type=float, default=0.1)
+    parser.add_argument("--and_fraction", type=float, default=0.5)
+    parser.add_argument("--condition_fraction", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=1000,
+        help="largest size the networkx/pgmpy path is measured on",
+    )
+    parser.add_argument("--output", type=str, help="save the results as JSON")
+    parser.add_argument("--baseline", type=str, help="results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.5,
+        help="how many times slower or larger than the baseline a stage may get",
+    )
+    args = parser.parse_args()
+    # main imports these on demand, load them now so the first stage using them is not charged for it,
+    # see bench_startup for the import times
+    import networkx  # noqa: F401
+    import pgmpy.models  # noqa: F401
+
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        attack_bundle = synthetic.generate_attack_bundle(
+            synthetic.AttackShape(seed=args.seed)
+        )
+        attack_file = os.path.join(work_dir, "attack.json")
+        with open(attack_file, "w", encoding="utf-8") as file:
+            json.dump(attack_bundle, file)
+        probability_db, seconds, peak = measure(
+            lambda: cache.compute_probability_database(attack_file), args.repeat
+        )
+        results.append(
+            {
+                "nodes": 0,
+                "stage": "compute_probability_database",
+                "seconds": seconds,
+                "peak_bytes": peak,
+            }
+        )
+        techniques = synthetic.attack_techniques(attack_bundle)
+        for size in args.sizes:
+            shape = synthetic.FlowShape(
+                nodes=size,
+                depth=args.depth or max(1, round(size**0.5)),
+                max_fan_in=args.max_fan_in,
+                operator_fraction=args.operator_fraction,
+                and_fraction=args.and_fraction,
+                condition_fraction=args.condition_fraction,
+                seed=args.seed,
+            )
+            flow_file = os.path.join(work_dir, f"flow-{size}.json")
+            with open(flow_file, "w", encoding="utf-8") as file:
+                json.dump(synthetic.generate_flow_bundle(shape, techniques), file)
+            for stage, seconds, peak in run_stages(
+                flow_file, probability_db, args.repeat, size <= args.legacy_max
+            ):
+                results.append(
+                    {
+                        "nodes": size,
+                        "stage": stage,
+                        "seconds": seconds,
+                        "peak_bytes": peak,
+                    }
+                )
+
+    print(f"{'nodes':>6} {'stage':<30} {'seconds':>9} {'peak MiB':>9}")
+    for row in results:
+        print(
+            f"{row['nodes']:>6} {row['stage']:<30} {row['seconds']:>9.4f} "
+            f"{row['peak_bytes'] / 2**20:>9.2f}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = find_regressions(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,262 @@
+"""
+Startup-time regression benchmark for the command line modes of main.py.
+
+pgmpy pulls in torch, scikit-learn, scipy and statsmodels, and mitreattack, stix2 and NetworkX are not free
+either, so main.py only imports them in the modes that use them. This benchmark runs every mode in a fresh
+interpreter under `python -X importtime`, reports the wall time and the total import time of the run with the
+most expensive top-level imports, and fails if a mode imports a package it should not need or goes over its
+import-time budget.
+
+The conversion modes need an ATT&CK bundle, without one only --help is measured. The probability cache is
+filled by a first, unmeasured run, so the conversion modes measure the cached path.
+
+Run from the src directory:
+    python -m benchmarks.bench_startup --attack_stix enterprise-attack.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+EXAMPLE_FLOW = (
+    Path(__file__).resolve().parents[2]
+    / "examples"
+    / "flow_exports"
+    / "Cobalt Kitty Campaign.json"
+)
+
+# packages that only the query, strict parsing or uncached modes may import
+HEAVY = ("pgmpy", "networkx", "stix2", "mitreattack", "torch", "sklearn", "scipy")
+
+
+@dataclass
+class Mode:
+    """
+    A command line mode of main.py.
+
+    Attributes:
+        name (str): The name the mode is reported under.
+        args (list[str]): The arguments of main.py, {flow_file}, {flow_dir}, {attack_stix}, {cache_dir} and
+            {output_dir} are filled in.
+        forbidden (tuple[str, ...]): The top-level packages the mode must not import.
+        budget_ms (float): The most time the imports of the mode may take.
+        needs_attack (bool): Whether the mode needs an ATT&CK bundle.
+    """
+
+    name: str
+    args: list[str]
+    forbidden: tuple[str, ...] = HEAVY
+    budget_ms: float = 1000
+    needs_attack: bool = True
+
+
+CONVERT = ["--attack_stix", "{attack_stix}", "--cache_dir", "{cache_dir}"]
+
+MODES = [
+    Mode("help", ["--help"], needs_attack=False),
+    Mode(
+        "convert",
+        ["--flow_file", "{flow_file}", "--output_file", "{output_dir}/flow.net"]
+        + CONVERT,
+    ),
+    Mode(
+        "batch",
+        ["--flow_dir", "{flow_dir}", "--output_dir", "{output_dir}", "--jobs", "1"]
+        + CONVERT,
+    ),
+    Mode(
+        "strict",
+        [
+            "--flow_file",
+            "{flow_file}",
+            "--output_file",
+            "{output_dir}/strict.net",
+            "--strict_flow",
+        ]
+        + CONVERT,
+        forbidden=tuple(package for package in HEAVY if package != "stix2"),
+    ),
+    Mode(
+        "query",
+        ["--flow_file", "{flow_file}", "--query"] + CONVERT,
+        forbidden=(),
+        budget_ms=10000,
+    ),
+]
+
+
+@dataclass
+class ImportProfile:
+    """
+    The imports of one run, parsed from the -X importtime report.
+
+    Attributes:
+        wall (float): The wall time of the run in seconds.
+        cumulative_us (dict[str, int]): The cumulative import time of every top-level import.
+        packages (set[str]): The top-level package of every module imported, nested imports included.
+    """
+
+    wall: float
+    cumulative_us: dict[str, int] = field(default_factory=dict)
+    packages: set[str] = field(default_factory=set)
+
+    @property
+    def total_ms(self) -> float:
+        """
+        The time spent importing, in milliseconds.
+        """
+        return sum(self.cumulative_us.values()) / 1000
+
+
+def parse_importtime(report: str, wall: float) -> ImportProfile:
+    """
+    Parse the report `python -X importtime` writes to stderr.
+
+    Every line reads "import time: self [us] | cumulative | imported package", nested imports being indented
+    in the last column, so the cumulative times of the unindented lines add up to the whole import time.
+
+    Args:
+        report (str): The stderr of the run.
+        wall (float): The wall time of the run in seconds.
+
+    Returns:
+        ImportProfile: The imports of the run.
+    """
+    profile = ImportProfile(wall)
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        columns = line[len("import time:") :].split("|")
+        if len(columns) != 3 or not columns[1].strip().isdigit():
+            # the header line
+            continue
+        module = columns[2].rstrip()
+        name = module.strip()
+        profile.packages.add(name.split(".")[0])
+        if module[1:] == name:
+            profile.cumulative_us[name] = profile.cumulative_us.get(name, 0) + int(
+                columns[1]
+            )
+    return profile
+
+
+def run_mode(mode: Mode, values: dict[str, str]) -> ImportProfile:
+    """
+    Run main.py in one mode under -X importtime.
+
+    Args:
+        mode (Mode): The mode.
+        values (dict[str, str]): The values of the placeholders in the arguments.
+
+    Returns:
+        ImportProfile: The imports of the run.
+
+    Raises:
+        RuntimeError: If main.py fails.
+    """
+    command = [sys.executable, "-X", "importtime", "main.py"] + [
+        argument.format(**values) for argument in mode.args
+    ]
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        raise RuntimeError(f"{mode.name} failed: " + "\n".join(errors[-5:]))
+    return parse_importtime(result.stderr, wall)
+
+
+def main() -> None:
+    """
+    Measure every mode, print one row per mode and exit with status 1 on a regression.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--attack_stix", type=str, help="ATT&CK bundle for the conversion modes"
+    )
+    parser.add_argument("--flow_file", type=str, default=str(EXAMPLE_FLOW))
+    parser.add_argument(
+        "--modes", nargs="+", choices=[mode.name for mode in MODES], default=None
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per mode, the fastest one is reported",
+    )
+    parser.add_argument(
+        "--budget_scale",
+        type=float,
+        default=1.0,
+        help="multiply every import-time budget, for slower machines",
+    )
+    parser.add_argument("--top", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = [
+        mode
+        for mode in MODES
+        if (args.modes is None or mode.name in args.modes)
+        and (args.attack_stix or not mode.needs_attack)
+    ]
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        flow_dir = Path(work_dir) / "flows"
+        output_dir = Path(work_dir) / "out"
+        flow_dir.mkdir()
+        output_dir.mkdir()
+        with open(args.flow_file, "r", encoding="utf-8") as file:
+            flow_bundle = json.load(file)
+        # stix2 rejects the bundle level spec_version the ATT&CK Flow builder writes, which --strict_flow parses
+        flow_bundle.pop("spec_version", None)
+        flow_file = flow_dir / "flow.json"
+        flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+        values = {
+            "flow_file": str(flow_file),
+            "flow_dir": str(flow_dir),
+            "attack_stix": args.attack_stix or "",
+            "cache_dir": str(Path(work_dir) / "cache"),
+            "output_dir": str(output_dir),
+        }
+        if args.attack_stix:
+            # fill the probability cache, the modes measure the cached path
+            run_mode(MODES[1], values)
+
+        print(f"{'mode':<8} {'wall s':>7} {'import ms':>10}  slowest imports")
+        for mode in modes:
+            profile = min(
+                (run_mode(mode, values) for _ in range(args.repeat)),
+                key=lambda run: run.total_ms,
+            )
+            slowest = sorted(profile.cumulative_us.items(), key=lambda item: -item[1])[
+                : args.top
+            ]
+            print(
+                f"{mode.name:<8} {profile.wall:>7.2f} {profile.total_ms:>10.1f}  "
+                + ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in slowest)
+            )
+            imported = sorted(profile.packages.intersection(mode.forbidden))
+            if imported:
+                failures.append(f"{mode.name} imports {', '.join(imported)}")
+            budget = mode.budget_ms * args.budget_scale
+            if profile.total_ms > budget:
+                failures.append(
+                    f"{mode.name} spends {profile.total_ms:.0f}ms importing, over its {budget:.0f}ms budget"
+                )
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
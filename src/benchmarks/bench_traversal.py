@@ -0,0 +1,173 @@
+"""
+Benchmark for convert_attack_flow_to_nx on large, machine-generated attack flows.
+
+The generated flows are layered DAGs where every node has several children in the next layer, so
+most nodes are shared by several parents (diamonds). The legacy traversal scanned the bundle for
+every lookup and re-expanded shared nodes, so it is only run on the smaller sizes for comparison.
+
+Run from the src directory:
+    python -m benchmarks.bench_traversal
+"""
+
+import argparse
+import random
+import time
+import uuid
+from typing import Any, Callable
+
+import networkx as nx
+import stix2
+
+from attack_flow_extension import flow, records
+from main import convert_attack_flow_to_nx
+
+SPEC = {"spec_version": "2.1"}
+
+
+def _stix_id(rng: random.Random, object_type: str) -> str:
+    """
+    Make a reproducible STIX id from the random generator.
+    """
+    return f"{object_type}--{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+
+
+def generate_layered_flow(
+    nodes: int, width: int = 50, fan_out: int = 3, seed: int = 0
+) -> dict[str, Any]:
+    """
+    Generate an ATT&CK Flow bundle shaped as a layered DAG.
+
+    Args:
+        nodes (int): The number of action, operator and condition nodes.
+        width (int): The number of nodes per layer.
+        fan_out (int): The number of children of every node outside the last layer.
+        seed (int): The random seed.
+
+    Returns:
+        dict[str, Any]: The bundle as decoded JSON.
+    """
+    rng = random.Random(seed)
+    kinds = rng.choices(
+        ["attack-action", "attack-operator", "attack-condition"],
+        weights=[8, 1, 1],
+        k=nodes,
+    )
+    ids = [_stix_id(rng, kind) for kind in kinds]
+    layers = [ids[start : start + width] for start in range(0, nodes, width)]
+    objects: list[dict[str, Any]] = []
+    for depth, layer in enumerate(layers):
+        following = layers[depth + 1] if depth + 1 < len(layers) else []
+        for node_id in layer:
+            kind = node_id.split("--")[0]
+            children = rng.sample(following, min(fan_out, len(following)))
+            obj: dict[str, Any] = {"type": kind, "id": node_id, **SPEC}
+            if kind == "attack-action":
+                obj["name"] = f"Action {node_id[-6:]}"
+                if children:
+                    obj["effect_refs"] = children
+            elif kind == "attack-operator":
+                obj["operator"] = rng.choice(["AND", "OR"])
+                if children:
+                    obj["effect_refs"] = children
+            else:
+                obj["description"] = f"Condition {node_id[-6:]}"
+                if children:
+                    obj["on_true_refs"] = children
+            objects.append(obj)
+    # start from the actions of the first layer so every start ref is valid
+    start_refs = [
+        node_id for node_id in layers[0] if node_id.startswith("attack-action")
+    ]
+    flow_obj = {
+        "type": "attack-flow",
+        "id": _stix_id(rng, "attack-flow"),
+        "name": f"Generated flow with {nodes} nodes",
+        "scope": "incident",
+        "start_refs": start_refs,
+        **SPEC,
+    }
+    return {
+        "type": "bundle",
+        "id": _stix_id(rng, "bundle"),
+        "objects": [flow_obj, *objects],
+    }
+
+
+def legacy_convert_attack_flow_to_nx(
+    attack_flow: "records.AnyAttackFlow", flow_bundle: stix2.Bundle
+) -> nx.DiGraph:
+    """
+    The traversal before the id index: a list used as a queue, a bundle scan per lookup and no visited set.
+    """
+    G = nx.DiGraph()
+    queue = []
+    for starting_node in attack_flow.get_starting_points():
+        G.add_node(starting_node, object=flow_bundle.get_obj(starting_node)[0])
+        queue.append(starting_node)
+    while queue:
+        node = queue.pop(0)
+        node_obj = flow_bundle.get_obj(node)[0]
+        children = []
+        if "effect_refs" in node_obj:
+            children = node_obj["effect_refs"]
+        elif "on_true_refs" in node_obj:
+            children = node_obj["on_true_refs"]
+        for child in children:
+            if child not in queue:
+                G.add_node(child, object=flow_bundle.get_obj(child)[0])
+                queue.append(child)
+            G.add_edge(node, child)
+    return G
+
+
+def _time(function: Callable[[], nx.DiGraph]) -> tuple[float, nx.DiGraph]:
+    """
+    Run a traversal and return its wall time and result.
+    """
+    start = time.perf_counter()
+    graph = function()
+    return time.perf_counter() - start, graph
+
+
+def main() -> None:
+    """
+    Time the traversal on flows of increasing size and print one row per size.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000, 20000]
+    )
+    parser.add_argument(
+        "--legacy_max",
+        type=int,
+        default=2000,
+        help="largest size the legacy traversal is run on",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'nodes':>7} {'edges':>7} {'indexed s':>10} {'us/(n+e)':>9} {'legacy s':>9}"
+    )
+    for size in args.sizes:
+        bundle = stix2.parse(
+            generate_layered_flow(size, seed=args.seed), allow_custom=True
+        )
+        attack_flow = flow.get_flows_from_stix_bundle(bundle)[0]
+        elapsed, graph = _time(lambda: convert_attack_flow_to_nx(attack_flow, bundle))
+        work = graph.number_of_nodes() + graph.number_of_edges()
+        legacy = "-"
+        if size <= args.legacy_max:
+            legacy_elapsed, legacy_graph = _time(
+                lambda: legacy_convert_attack_flow_to_nx(attack_flow, bundle)
+            )
+            assert set(legacy_graph.edges) == set(graph.edges)
+            legacy = f"{legacy_elapsed:.3f}"
+        print(
+            f"{graph.number_of_nodes():>7} {graph.number_of_edges():>7} "
+            f"{elapsed:>10.3f} {elapsed / work * 1e6:>9.2f} {legacy:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Seeded generators of synthetic ATT&CK Flow exports and ATT&CK bundles.
+
+The repository only ships two example flows, both small, so the generators produce inputs of any size with
+the shape under control. FlowShape sets the number of nodes, the number of layers they are spread over, the
+fan-in of each node, and which fraction of the nodes are AND/OR operators or conditions. Every action uses a
+technique of an ATT&CK bundle, normally one made by generate_attack_bundle: a small bundle in the layout of
+the MITRE release, with techniques and sub-techniques, campaigns, groups and software using them, and
+mitigations. Both loaders read it, so whole conversions can be run without downloading ATT&CK.
+
+The same shape and seed always give the same bundle, byte for byte once dumped.
+"""
+
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+CREATED = "2020-01-01T00:00:00.000Z"
+
+# the years campaign activity is spread over
+FIRST_YEAR = 2015
+LAST_YEAR = 2024
+
+
+@dataclass
+class AttackShape:
+    """
+    The size of a synthetic ATT&CK bundle.
+
+    Attributes:
+        techniques (int): The number of techniques, not counting sub-techniques.
+        subtechniques (int): The number of sub-techniques, spread over the techniques.
+        campaigns (int): The number of campaigns.
+        groups (int): The number of groups (intrusion sets).
+        software (int): The number of software, half malware and half tools.
+        mitigations (int): The number of mitigations (courses of action).
+        uses (int): The number of techniques each campaign, group and software uses.
+        mitigates (int): The number of techniques each mitigation mitigates.
+        seed (int): The random seed.
+    """
+
+    techniques: int = 50
+    subtechniques: int = 50
+    campaigns: int = 20
+    groups: int = 10
+    software: int = 10
+    mitigations: int = 20
+    uses: int = 10
+    mitigates: int = 5
+    seed: int = 0
+
+
+@dataclass
+class FlowShape:
+    """
+    The shape of a synthetic attack flow.
+
+    Attributes:
+        nodes (int): The number of action, operator and condition nodes.
+        depth (int): The number of layers, every node of a layer has its parents on the layer above.
+        max_fan_in (int): The most parents a node has, operators having at least two.
+        operator_fraction (float): The fraction of the nodes below the first layer that are operators.
+        and_fraction (float): The fraction of the operators that are AND, the others being OR.
+        condition_fraction (float): The fraction of the nodes below the first layer that are conditions.
+        seed (int): The random seed.
+    """
+
+    nodes: int = 1000
+    depth: int = 20
+    max_fan_in: int = 3
+    operator_fraction: float = 0.1
+    and_fraction: float = 0.5
+    condition_fraction: float = 0.1
+    seed: int = 0
+
+
+def _stix_id(rng: random.Random, object_type: str) -> str:
+    """
+    Make a reproducible STIX id from the random generator.
+    """
+    return f"{object_type}--{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+
+
+def _attack_object(
+    rng: random.Random, object_type: str, name: str, external_id: str | None = None
+) -> dict[str, Any]:
+    """
+    Make an ATT&CK object with the fields both ATT&CK loaders expect.
+    """
+    obj: dict[str, Any] = {
+        "type": object_type,
+        "id": _stix_id(rng, object_type),
+        "created": CREATED,
+        "modified": CREATED,
+        "name": name,
+    }
+    if external_id is not None:
+        obj["external_references"] = [
+            {"source_name": "mitre-attack", "external_id": external_id}
+        ]
+    return obj
+
+
+def _relationship(
+    rng: random.Random, relationship_type: str, source_ref: str, target_ref: str
+) -> dict[str, Any]:
+    """
+    Make a relationship between two ATT&CK objects.
+    """
+    return {
+        "type": "relationship",
+        "id": _stix_id(rng, "relationship"),
+        "created": CREATED,
+        "modified": CREATED,
+        "relationship_type": relationship_type,
+        "source_ref": source_ref,
+        "target_ref": target_ref,
+    }
+
+
+def generate_attack_bundle(shape: AttackShape | None = None) -> dict[str, Any]:
+    """
+    Generate a small ATT&CK bundle in the layout of the MITRE enterprise-attack release.
+
+    Sub-techniques are numbered after their parent (T1000.001) and linked to it by a subtechnique-of
+    relationship. Campaigns have first and last seen dates between FIRST_YEAR and LAST_YEAR.
+
+    Args:
+        shape (AttackShape | None): The size of the bundle, defaults to AttackShape().
+
+    Returns:
+        dict[str, Any]: The bundle as decoded JSON.
+
+    Raises:
+        ValueError: If the bundle would have no technique.
+    """
+    shape = shape or AttackShape()
+    if shape.techniques < 1:
+        raise ValueError("The bundle needs at least one technique")
+    rng = random.Random(shape.seed)
+    objects: list[dict[str, Any]] = []
+    relationships: list[dict[str, Any]] = []
+
+    techniques = [
+        _attack_object(rng, "attack-pattern", f"Technique {n}", f"T{1000 + n}")
+        for n in range(shape.techniques)
+    ]
+    objects.extend(techniques)
+    sub_counts = [0] * shape.techniques
+    for n in range(shape.subtechniques):
+        parent_index = rng.randrange(shape.techniques)
+        sub_counts[parent_index] += 1
+        parent = techniques[parent_index]
+        parent_id = parent["external_references"][0]["external_id"]
+        subtechnique = _attack_object(
+            rng,
+            "attack-pattern",
+            f"{parent['name']}: Variant {sub_counts[parent_index]}",
+            f"{parent_id}.{sub_counts[parent_index]:03d}",
+        )
+        subtechnique["x_mitre_is_subtechnique"] = True
+        objects.append(subtechnique)
+        relationships.append(
+            _relationship(rng, "subtechnique-of", subtechnique["id"], parent["id"])
+        )
+    patterns = [obj["id"] for obj in objects]
+
+    users = []
+    for n in range(shape.campaigns):
+        campaign = _attack_object(rng, "campaign", f"Campaign {n}", f"C{n:04d}")
+        first = rng.randint(FIRST_YEAR, LAST_YEAR)
+        last = rng.randint(first, LAST_YEAR)
+        campaign["first_seen"] = f"{first}-01-01T00:00:00.000Z"
+        campaign["last_seen"] = f"{last}-12-31T00:00:00.000Z"
+        users.append(campaign)
+    users.extend(
+        _attack_object(rng, "intrusion-set", f"Group {n}", f"G{n:04d}")
+        for n in range(shape.groups)
+    )
+    for n in range(shape.software):
+        software_type = "malware" if n % 2 == 0 else "tool"
+        software = _attack_object(rng, software_type, f"Software {n}", f"S{n:04d}")
+        # STIX 2.0 requires labels on software
+        software["labels"] = [software_type]
+        users.append(software)
+    objects.extend(users)
+    for user in users:
+        for pattern in rng.sample(patterns, min(shape.uses, len(patterns))):
+            relationships.append(_relationship(rng, "uses", user["id"], pattern))
+
+    for n in range(shape.mitigations):
+        mitigation = _attack_object(
+            rng, "course-of-action", f"Mitigation {n}", f"M{1000 + n}"
+        )
+        objects.append(mitigation)
+        for pattern in rng.sample(patterns, min(shape.mitigates, len(patterns))):
+            relationships.append(
+                _relationship(rng, "mitigates", mitigation["id"], pattern)
+            )
+
+    return {
+        "type": "bundle",
+        "id": _stix_id(rng, "bundle"),
+        "spec_version": "2.0",
+        "objects": objects + relationships,
+    }
+
+
+def attack_techniques(attack_bundle: dict[str, Any]) -> list[tuple[str, str]]:
+    """
+    List the techniques of an ATT&CK bundle that flows can use.
+
+    Args:
+        attack_bundle (dict[str, Any]): The decoded ATT&CK bundle.
+
+    Returns:
+        list[tuple[str, str]]: The STIX id and ATT&CK ID of every attack pattern with an ATT&CK ID.
+    """
+    techniques = []
+    for obj in attack_bundle["objects"]:
+        if obj["type"] != "attack-pattern":
+            continue
+        for reference in obj.get("external_references", []):
+            if reference.get("source_name") == "mitre-attack":
+                techniques.append((obj["id"], reference["external_id"]))
+    return techniques
+
+
+def generate_flow_bundle(
+    shape: FlowShape | None = None, techniques: list[tuple[str, str]] | None = None
+) -> dict[str, Any]:
+    """
+    Generate an ATT&CK Flow export with one attack flow of the given shape.
+
+    The nodes are spread evenly over shape.depth layers. The first layer holds the actions the flow starts
+    from, and every other node gets between one and shape.max_fan_in parents on the layer above, so every node
+    is reachable from the start. Conditions continue on their true branch.
+
+    Args:
+        shape (FlowShape | None): The shape of the flow, defaults to FlowShape().
+        techniques (list[tuple[str, str]] | None): The (STIX id, ATT&CK ID) of the techniques the actions use,
+            see attack_techniques. Defaults to the techniques of generate_attack_bundle().
+
+    Returns:
+        dict[str, Any]: The export as decoded JSON.
+
+    Raises:
+        ValueError: If the shape is invalid.
+    """
+    shape = shape or FlowShape()
+    if shape.nodes < 1 or not 1 <= shape.depth <= shape.nodes:
+        raise ValueError("A flow needs at least one node and one node per layer")
+    if shape.max_fan_in < 1:
+        raise ValueError("max_fan_in must be at least 1")
+    if shape.operator_fraction + shape.condition_fraction > 1:
+        raise ValueError("The operator and condition fractions add up to more than 1")
+    if techniques is None:
+        techniques = attack_techniques(generate_attack_bundle())
+    rng = random.Random(shape.seed)
+
+    sizes = [
+        shape.nodes // shape.depth + (layer < shape.nodes % shape.depth)
+        for layer in range(shape.depth)
+    ]
+    layers: list[list[dict[str, Any]]] = []
+    for layer, size in enumerate(sizes):
+        nodes = []
+        for _ in range(size):
+            draw = rng.random()
+            if layer > 0 and draw < shape.operator_fraction:
+                kind = "attack-operator"
+            elif (
+                layer > 0 and draw < shape.operator_fraction + shape.condition_fraction
+            ):
+                kind = "attack-condition"
+            else:
+                kind = "attack-action"
+            node: dict[str, Any] = {
+                "type": kind,
+                "spec_version": "2.1",
+                "id": _stix_id(rng, kind),
+                "created": CREATED,
+                "modified": CREATED,
+            }
+            if kind == "attack-action":
+                technique_ref, technique_id = rng.choice(techniques)
+                node["name"] = f"Action {technique_id}"
+                node["technique_id"] = technique_id
+                node["technique_ref"] = technique_ref
+            elif kind == "attack-operator":
+                node["operator"] = "AND" if rng.random() < shape.and_fraction else "OR"
+            else:
+                node["description"] = f"Condition {node['id'][-6:]}"
+            nodes.append(node)
+        layers.append(nodes)
+
+    for above, below in zip(layers, layers[1:]):
+        for node in below:
+            low = 2 if node["type"] == "attack-operator" else 1
+            fan_in = rng.randint(low, max(low, shape.max_fan_in))
+            for parent in rng.sample(above, min(fan_in, len(above))):
+                refs = (
+                    "on_true_refs"
+                    if parent["type"] == "attack-condition"
+                    else "effect_refs"
+                )
+                parent.setdefault(refs, []).append(node["id"])
+
+    flow_obj = {
+        "type": "attack-flow",
+        "spec_version": "2.1",
+        "id": _stix_id(rng, "attack-flow"),
+        "created": CREATED,
+        "modified": CREATED,
+        "name": f"Synthetic flow {shape.nodes}x{shape.depth} seed {shape.seed}",
+        "scope": "incident",
+        "start_refs": [node["id"] for node in layers[0]],
+    }
+    return {
+        "type": "bundle",
+        "id": _stix_id(rng, "bundle"),
+        "objects": [flow_obj, *(node for layer in layers for node in layer)],
+    }
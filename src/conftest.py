@@ -0,0 +1,50 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+
+import pytest
+
+from benchmarks import synthetic
+from stix_probability import cache
+
+
+@pytest.fixture(scope="session")
+def synthetic_attack_file(tmp_path_factory):
+    """
+    The default synthetic ATT&CK bundle, written once per test session.
+    """
+    attack_file = tmp_path_factory.mktemp("synthetic") / "attack.json"
+    attack_file.write_text(
+        json.dumps(synthetic.generate_attack_bundle()), encoding="utf-8"
+    )
+    return attack_file
+
+
+@pytest.fixture(scope="session")
+def synthetic_probability_db(synthetic_attack_file):
+    """
+    The probability database of the synthetic ATT&CK bundle, computed without a cache.
+    """
+    return cache.load_probability_database(str(synthetic_attack_file), None)
+
+
+@pytest.fixture(scope="session")
+def write_synthetic_flow(synthetic_attack_file):
+    """
+    Write synthetic flow exports using the techniques of the synthetic ATT&CK bundle.
+
+    The fixture is a function taking the synthetic.FlowShape of the flow and the path to write it to, and
+    returning the bundle it wrote.
+    """
+    techniques = synthetic.attack_techniques(
+        json.loads(synthetic_attack_file.read_text(encoding="utf-8"))
+    )
+
+    def write(shape, path):
+        flow_bundle = synthetic.generate_flow_bundle(shape, techniques)
+        path.write_text(json.dumps(flow_bundle), encoding="utf-8")
+        return flow_bundle
+
+    return write
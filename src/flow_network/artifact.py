@@ -0,0 +1,224 @@
+"""
+Compiled flow networks, stored in a binary file that is memory-mapped back.
+
+A Hugin NET file has to be parsed again before it can be queried, and it does not keep what the conversion
+knew about the flow, so querying an already converted flow meant converting it again. write_artifact stores
+an assembled network (see assembly.FlowNetwork) instead: the structure, CPD and node kind arrays, the node
+ids, labels and techniques, and the ATT&CK data the probabilities came from.
+
+The file starts with a fixed prefix (magic, format version and header length) and a JSON header holding the
+strings and the dtype, shape and offset of every array. The arrays follow the header, each aligned to
+ALIGNMENT bytes, so CompiledArtifact maps the file read-only and wraps every array around the mapping
+without reading or copying it. Processes opening the same file share its pages, and a CompiledArtifact sent
+to a worker process is pickled as its path, so the worker maps the file too instead of receiving a copy.
+The NET file is derived from the arrays on demand, see CompiledArtifact.write_net.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+from typing import Any, BinaryIO, TextIO
+
+import numpy as np
+
+from attack_flow_extension import records
+from flow_network import compact
+from flow_network.assembly import FlowNetwork
+from hugin_net import writer as hugin_writer
+
+MAGIC = b"ATKRISK\x00"
+FORMAT_VERSION = 1
+# magic, format version and header length, all little endian
+_PREFIX = struct.Struct("<8sII")
+# arrays start at multiples of this, which suits any dtype and cache lines
+ALIGNMENT = 64
+
+# the arrays of a network, by the attribute of CompactFlow or FlowNetwork holding them
+_FLOW_ARRAYS = (
+    "parent_offsets",
+    "parents",
+    "child_offsets",
+    "children",
+    "kinds",
+    "techniques",
+)
+_NETWORK_ARRAYS = ("cpd_offsets", "cpd_values", "order")
+
+
+def _padding(position: int) -> bytes:
+    """
+    Get the zero bytes that bring a file position to the next multiple of ALIGNMENT.
+    """
+    return bytes(-position % ALIGNMENT)
+
+
+def write_artifact(
+    file: BinaryIO,
+    network: FlowNetwork,
+    attack_flow: Any,
+    attack: dict[str, str],
+) -> int:
+    """
+    Write a compiled network.
+
+    Args:
+        file (BinaryIO): The output file, opened for binary writing.
+        network (FlowNetwork): The validated network, see assembly.assemble_network.
+        attack_flow (Any): The attack-flow object the network was built from.
+        attack (dict[str, str]): The ATT&CK data the probabilities were computed from, e.g. the bundle, its
+            hash and the probability model.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        ValueError: If the network was not validated.
+    """
+    if network.order is None:
+        raise ValueError("Only validated networks can be compiled")
+    compact_flow = network.flow
+    arrays = {name: getattr(compact_flow, name) for name in _FLOW_ARRAYS}
+    arrays.update((name, getattr(network, name)) for name in _NETWORK_ARRAYS)
+    if compact_flow.positions is not None:
+        arrays["positions"] = compact_flow.positions
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        # every dtype is stored little endian, whatever the machine writing it
+        arrays[name] = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        layout[name] = {
+            "dtype": arrays[name].dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes + len(_padding(offset + array.nbytes))
+    header = json.dumps(
+        {
+            "attack": attack,
+            "flow": {
+                "id": attack_flow.id,
+                "name": attack_flow.get("name", ""),
+                "description": attack_flow.get("description"),
+                "start_refs": list(attack_flow.get("start_refs", [])),
+            },
+            "ids": compact_flow.ids,
+            "labels": compact_flow.labels,
+            "technique_ids": compact_flow.technique_ids,
+            "technique_external_ids": compact_flow.technique_external_ids,
+            "arrays": layout,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    written = file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+    written += file.write(header)
+    written += file.write(_padding(written))
+    for array in arrays.values():
+        written += file.write(memoryview(array).cast("B"))
+        written += file.write(_padding(written))
+    return written
+
+
+class CompiledArtifact:
+    """
+    A compiled network mapped read-only from its file.
+
+    Attributes:
+        path (str): The file.
+        attack (dict[str, str]): The ATT&CK data the probabilities were computed from.
+        attack_flow (records.AttackFlowRecord): The attack-flow object the network was built from.
+        network (FlowNetwork): The network, its arrays backed by the mapping.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map a compiled network.
+
+        Args:
+            path (str): The file written by write_artifact.
+
+        Raises:
+            ValueError: If the file is not a compiled network of this format version.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            # the mapping stays valid after the file is closed
+            self._mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mapping) < _PREFIX.size:
+            raise ValueError(f"{path} is not a compiled network")
+        magic, version, header_length = _PREFIX.unpack_from(self._mapping)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled network")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} is a compiled network of format {version}, expected {FORMAT_VERSION}"
+            )
+        start = _PREFIX.size
+        header = json.loads(self._mapping[start : start + header_length])
+        start += header_length
+        start += len(_padding(start))
+        arrays = {}
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(
+                self._mapping, dtype=dtype, count=count, offset=start + entry["offset"]
+            ).reshape(entry["shape"])
+
+        flow_data = header["flow"]
+        self.attack: dict[str, str] = header["attack"]
+        self.attack_flow = records.AttackFlowRecord(
+            flow_data["id"],
+            flow_data["name"],
+            flow_data["start_refs"],
+            flow_data["description"],
+        )
+        compact_flow = compact.CompactFlow(
+            ids=header["ids"],
+            parent_offsets=arrays["parent_offsets"],
+            parents=arrays["parents"],
+            child_offsets=arrays["child_offsets"],
+            children=arrays["children"],
+            kinds=arrays["kinds"],
+            techniques=arrays["techniques"],
+            technique_ids=header["technique_ids"],
+            technique_external_ids=header["technique_external_ids"],
+            labels=header["labels"],
+            positions=arrays.get("positions"),
+        )
+        self.network = FlowNetwork(
+            compact_flow, arrays["cpd_offsets"], arrays["cpd_values"], arrays["order"]
+        )
+
+    def __reduce__(self) -> tuple[Any, tuple[str]]:
+        # worker processes map the file themselves rather than receiving a copy of the arrays
+        return CompiledArtifact, (self.path,)
+
+    def node_probabilities(self) -> np.ndarray:
+        """
+        Get P(true) of every action and condition from the CPDs, like compact.node_probabilities.
+
+        Returns:
+            np.ndarray: The probability of each node, the first entry of the true row of its CPD.
+        """
+        network = self.network
+        true_rows = network.cpd_offsets[:-1] + np.diff(network.cpd_offsets) // 2
+        kinds = network.flow.kinds
+        return np.where(
+            (kinds == compact.KIND_ACTION) | (kinds == compact.KIND_CONDITION),
+            network.cpd_values[true_rows],
+            compact.CONDITION_PROBABILITY,
+        )
+
+    def write_net(self, file: TextIO) -> None:
+        """
+        Write the network in the Hugin NET format, the same text converting the flow writes.
+
+        Args:
+            file (TextIO): The output file.
+        """
+        hugin_writer.write_compact_net(
+            self.network.flow, self.node_probabilities(), file
+        )
@@ -0,0 +1,401 @@
+"""
+Bulk assembly of the Bayesian networks of compact flows.
+
+Building a pgmpy network creates a TabularCPD per node, and check_model then revalidates every CPD's
+normalization and parents one node at a time, although the CPDs of a flow are normalized by construction.
+FlowNetwork builds every CPD of a flow at once instead: the tables are blocks of one flat array, each in
+pgmpy's (states x parent configurations) layout, generated from the kinds, probabilities and in-degrees of
+the nodes with a few vector operations. FlowNetwork.validate checks them in one pass as well: every block
+has the size its node's parents call for (all nodes are binary), all values are probabilities, every column
+sums to one and the graph is acyclic.
+
+The inference engines (inference.CompiledNetwork, polytree.PolytreeEvaluator and sampling.ForwardSampler)
+read their tables through network_tables, which accepts either a FlowNetwork or a pgmpy network, so queries
+and mitigation rankings never build pgmpy objects. FlowNetwork.to_bayesian_network builds the pgmpy network
+for the features that need one.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List
+
+import numpy as np
+
+from flow_network import compact
+from instrumentation import stages
+
+if TYPE_CHECKING:
+    from pgmpy.models import BayesianNetwork
+
+# the CPD of a node with this many parents has 2 ** 26 entries (512 MiB), inference.DEFAULT_MAX_TABLE_ENTRIES,
+# the most the junction tree compiles in total; wider nodes have to be divorced with max_fan_in
+MAX_PARENTS = 25
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenate the index ranges [start, start + count) of every start and count.
+    """
+    ends = np.cumsum(counts)
+    return np.repeat(starts - (ends - counts), counts) + np.arange(
+        ends[-1] if len(ends) else 0
+    )
+
+
+def _columns(in_degrees: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Enumerate the parent configurations (CPD columns) of every node.
+
+    Args:
+        in_degrees (np.ndarray): The number of parents of each node.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The number of columns of each node, and the node and the index
+        within its CPD of every column.
+    """
+    columns = np.left_shift(1, in_degrees.astype(np.int64))
+    column_nodes = np.repeat(np.arange(len(in_degrees)), columns)
+    return (
+        columns,
+        column_nodes,
+        _ranges(np.zeros(len(in_degrees), dtype=np.int64), columns),
+    )
+
+
+def topological_order(structure: compact.FlowStructure) -> np.ndarray:
+    """
+    Sort the nodes of a flow topologically, in the order nx.topological_sort gives for its pgmpy network.
+
+    NetworkX peels the graph in generations of nodes whose parents are all in earlier generations, and appends
+    a child to the next generation when its last parent in the current one is processed, visiting children in
+    index order. Each generation is computed here with a handful of vector operations.
+
+    Args:
+        structure (compact.FlowStructure): The flow graph.
+
+    Returns:
+        np.ndarray: Every node, parents before children.
+
+    Raises:
+        ValueError: If the graph has a cycle.
+    """
+    remaining = structure.in_degrees().astype(np.int64)
+    frontier = np.flatnonzero(remaining == 0)
+    generations = []
+    while frontier.size:
+        generations.append(frontier)
+        counts = np.diff(structure.child_offsets)[frontier]
+        children = structure.children[
+            _ranges(structure.child_offsets[frontier].astype(np.int64), counts)
+        ]
+        np.subtract.at(remaining, children, 1)
+        reached, inverse = np.unique(children, return_inverse=True)
+        last_parent = np.full(reached.size, -1)
+        np.maximum.at(last_parent, inverse, np.repeat(np.arange(frontier.size), counts))
+        ready = remaining[reached] == 0
+        frontier = reached[ready][np.argsort(last_parent[ready], kind="stable")]
+    order = np.concatenate(generations) if generations else np.empty(0, np.intp)
+    if len(order) != structure.num_nodes:
+        raise ValueError("The flow graph has a cycle")
+    return order
+
+
+@dataclass
+class NetworkTables:
+    """
+    The CPDs of a network in the form the inference engines read them.
+
+    Attributes:
+        variables (list[str]): The nodes of the network.
+        cardinality (list[int]): The number of states of each node.
+        scopes (list[list[int]]): The variables of each node's CPD, the node first and then its parents, in
+            pgmpy's order.
+        values (list[np.ndarray]): Each node's CPD in pgmpy's (states x parent configurations) layout.
+        order (list[int]): The nodes in topological order.
+        labels (list[str]): The label of each node, e.g. "Action: Phishing".
+        index (dict[str, int]): The position of each node in variables.
+    """
+
+    variables: List[str]
+    cardinality: List[int]
+    scopes: List[List[int]]
+    values: List[np.ndarray]
+    order: List[int]
+    labels: List[str]
+    index: dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.index = {name: position for position, name in enumerate(self.variables)}
+
+    def terminal_nodes(self) -> List[str]:
+        """
+        Get the nodes without children, in the order of variables.
+        """
+        has_children = np.zeros(len(self.variables), dtype=bool)
+        for scope in self.scopes:
+            has_children[scope[1:]] = True
+        return [self.variables[var] for var in np.flatnonzero(~has_children)]
+
+
+@dataclass(eq=False)
+class FlowNetwork:
+    """
+    The Bayesian network of a compact flow, with every CPD in one flat array.
+
+    Attributes:
+        flow (compact.CompactFlow): The flow graph.
+        cpd_offsets (np.ndarray): The CPD of node i is cpd_values[cpd_offsets[i]:cpd_offsets[i + 1]].
+        cpd_values (np.ndarray): Every CPD, each flattened from pgmpy's (states x parent configurations) layout.
+        order (np.ndarray | None): The nodes in topological order, set by validate.
+    """
+
+    flow: compact.CompactFlow
+    cpd_offsets: np.ndarray
+    cpd_values: np.ndarray
+    order: np.ndarray | None = None
+    _tables: NetworkTables | None = field(default=None, init=False, repr=False)
+    _model: BayesianNetwork | None = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def from_compact_flow(
+        cls, compact_flow: compact.CompactFlow, probabilities: np.ndarray
+    ) -> "FlowNetwork":
+        """
+        Build the CPDs of every node at once, with the values compact.cpd_values gives each of them.
+
+        Args:
+            compact_flow (compact.CompactFlow): The flow graph.
+            probabilities (np.ndarray): The probabilities from compact.node_probabilities.
+
+        Returns:
+            FlowNetwork: The network, not validated yet.
+
+        Raises:
+            ValueError: If a node has more than MAX_PARENTS parents.
+        """
+        in_degrees = compact_flow.in_degrees()
+        if len(in_degrees) and in_degrees.max() > MAX_PARENTS:
+            node = int(np.argmax(in_degrees))
+            raise ValueError(
+                f"{compact_flow.ids[node]} has {in_degrees[node]} parents, divorce them with max_fan_in"
+            )
+        columns, column_nodes, column_index = _columns(in_degrees)
+        cpd_offsets = np.zeros(compact_flow.num_nodes + 1, dtype=np.int64)
+        np.cumsum(2 * columns, out=cpd_offsets[1:])
+
+        kinds = compact_flow.kinds[column_nodes]
+        gate = (in_degrees[column_nodes] > 0) & (
+            (kinds == compact.KIND_AND) | (kinds == compact.KIND_OR)
+        )
+        # actions and conditions are true with their probability whatever their parents, lone operators are a
+        # fair coin, AND is true only in the last column (every parent true) and OR in all but the first
+        constant = np.where(
+            (kinds == compact.KIND_ACTION) | (kinds == compact.KIND_CONDITION),
+            probabilities[column_nodes],
+            compact.CONDITION_PROBABILITY,
+        )
+        true = np.where(
+            gate,
+            np.where(
+                kinds == compact.KIND_AND,
+                column_index == columns[column_nodes] - 1,
+                column_index != 0,
+            ),
+            constant,
+        )
+        cpd_values = np.empty(int(cpd_offsets[-1]), dtype=np.float64)
+        false_positions = cpd_offsets[column_nodes] + column_index
+        cpd_values[false_positions] = 1 - true
+        cpd_values[false_positions + columns[column_nodes]] = true
+        return cls(compact_flow, cpd_offsets, cpd_values)
+
+    def cpd(self, node: int) -> np.ndarray:
+        """
+        Get a view of the CPD of a node, in pgmpy's (states x parent configurations) layout.
+        """
+        return self.cpd_values[
+            self.cpd_offsets[node] : self.cpd_offsets[node + 1]
+        ].reshape(2, -1)
+
+    def validate(self) -> None:
+        """
+        Check every CPD at once and sort the nodes topologically, like pgmpy's check_model.
+
+        Raises:
+            ValueError: If a node has no CPD or one without a column per configuration of its parents, holds
+            values outside [0, 1] or a column not summing to one, or if the graph has a cycle.
+        """
+        ids = self.flow.ids
+        if len(self.cpd_offsets) != self.flow.num_nodes + 1:
+            raise ValueError("Every node needs exactly one CPD")
+        in_degrees = self.flow.in_degrees()
+        columns, column_nodes, column_index = _columns(in_degrees)
+        wrong_size = np.flatnonzero(np.diff(self.cpd_offsets) != 2 * columns)
+        if wrong_size.size:
+            node = int(wrong_size[0])
+            raise ValueError(
+                f"The CPD of {ids[node]} does not match its {in_degrees[node]} binary parents"
+            )
+        if not np.all((self.cpd_values >= 0) & (self.cpd_values <= 1)):
+            raise ValueError("CPD values must be probabilities")
+        false_positions = self.cpd_offsets[column_nodes] + column_index
+        sums = (
+            self.cpd_values[false_positions]
+            + self.cpd_values[false_positions + columns[column_nodes]]
+        )
+        unnormalized = np.flatnonzero(~np.isclose(sums, 1, atol=0.01))
+        if unnormalized.size:
+            raise ValueError(
+                f"The CPD of {ids[column_nodes[unnormalized[0]]]} does not sum to 1"
+            )
+        self.order = topological_order(self.flow)
+
+    def tables(self) -> NetworkTables:
+        """
+        Get the CPDs for the inference engines, the values being views of cpd_values.
+
+        Returns:
+            NetworkTables: The tables, built once per network.
+        """
+        if self._tables is None:
+            if self.order is None:
+                self.validate()
+            assert self.order is not None
+            self._tables = NetworkTables(
+                self.flow.ids,
+                [2] * self.flow.num_nodes,
+                [
+                    [node, *self.flow.parents_of(node).tolist()]
+                    for node in range(self.flow.num_nodes)
+                ],
+                [self.cpd(node) for node in range(self.flow.num_nodes)],
+                self.order.tolist(),
+                list(self.flow.labels),
+            )
+        return self._tables
+
+    def actions_by_technique(self) -> dict[tuple[str, str | None], List[str]]:
+        """
+        Group the action nodes by the technique they use, see mitigation.actions_by_technique.
+
+        Returns:
+            dict[tuple[str, str | None], list[str]]: The action nodes of each technique, keyed by its entry of
+            technique_ids and the ATT&CK ID given with it, as ProbabilityDatabase.resolve_technique takes them.
+        """
+        actions: dict[tuple[str, str | None], List[str]] = {}
+        for node in np.flatnonzero(self.flow.kinds == compact.KIND_ACTION).tolist():
+            technique = int(self.flow.techniques[node])
+            if technique != compact.NO_TECHNIQUE:
+                actions.setdefault(
+                    (
+                        self.flow.technique_ids[technique],
+                        self.flow.technique_external_ids[technique],
+                    ),
+                    [],
+                ).append(self.flow.ids[node])
+        return actions
+
+    def to_bayesian_network(self) -> BayesianNetwork:
+        """
+        Build the pgmpy network, for the features that need pgmpy objects.
+
+        The nodes get their label and position like make_nx_graph_more_readable gives them, and the graph
+        attribute "actions_by_technique" holds the action nodes of every technique, see actions_by_technique.
+        The CPDs are not checked again, validate already did.
+
+        Returns:
+            BayesianNetwork: The network, built once and then reused.
+        """
+        if self._model is not None:
+            return self._model
+        import networkx as nx
+        from pgmpy.factors.discrete import TabularCPD
+        from pgmpy.models import BayesianNetwork
+
+        compact_flow = self.flow
+        ids = compact_flow.ids
+        with stages.stage("build_pgmpy_network") as counts:
+            counts.update(stages.flow_counts(compact_flow))
+            graph = nx.DiGraph()
+            for node, name in enumerate(ids):
+                attributes = {"label": f'"{compact_flow.labels[node]}"'}
+                if compact_flow.positions is not None:
+                    x, y = compact_flow.positions[node]
+                    attributes["position"] = f"({x},{y})"
+                graph.add_node(name, **attributes)
+            parents, children = compact_flow.edge_arrays()
+            graph.add_edges_from(
+                (ids[parent], ids[child])
+                for parent, child in zip(parents.tolist(), children.tolist())
+            )
+            model = BayesianNetwork(graph)
+            model.graph["actions_by_technique"] = self.actions_by_technique()
+            cpds = []
+            for node, name in enumerate(ids):
+                node_parents = [ids[parent] for parent in compact_flow.parents_of(node)]
+                cpds.append(
+                    TabularCPD(
+                        name,
+                        2,
+                        self.cpd(node),
+                        evidence=node_parents or None,
+                        evidence_card=[2] * len(node_parents) or None,
+                    )
+                )
+            model.add_cpds(*cpds)
+        self._model = model
+        return model
+
+
+def assemble_network(
+    compact_flow: compact.CompactFlow, probabilities: np.ndarray
+) -> FlowNetwork:
+    """
+    Build and validate the network of a flow without pgmpy.
+
+    Args:
+        compact_flow (compact.CompactFlow): The flow graph.
+        probabilities (np.ndarray): The probabilities from compact.node_probabilities.
+
+    Returns:
+        FlowNetwork: The network.
+
+    Raises:
+        ValueError: If the network is invalid.
+    """
+    with stages.stage("build_network") as counts:
+        counts.update(stages.flow_counts(compact_flow))
+        network = FlowNetwork.from_compact_flow(compact_flow, probabilities)
+    with stages.stage("check_model") as counts:
+        counts.update(stages.flow_counts(compact_flow))
+        network.validate()
+    return network
+
+
+def network_tables(model: BayesianNetwork | FlowNetwork) -> NetworkTables:
+    """
+    Get the CPDs of a network for the inference engines.
+
+    Args:
+        model (BayesianNetwork | FlowNetwork): The network, every node must have a CPD.
+
+    Returns:
+        NetworkTables: The tables.
+    """
+    if isinstance(model, FlowNetwork):
+        return model.tables()
+    # a pgmpy network is already a NetworkX graph, so this import is free at this point
+    import networkx as nx
+
+    variables = list(model.nodes())
+    index = {name: position for position, name in enumerate(variables)}
+    cpds = {cpd.variable: cpd for cpd in model.get_cpds()}
+    return NetworkTables(
+        variables,
+        [int(cpds[name].variable_card) for name in variables],
+        [[index[var] for var in cpds[name].variables] for name in variables],
+        [cpds[name].get_values() for name in variables],
+        [index[name] for name in nx.topological_sort(model)],
+        [model.nodes[name].get("label", "").strip('"') for name in variables],
+    )
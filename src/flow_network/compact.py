@@ -0,0 +1,525 @@
+"""
+Compact, array-backed attack flow graphs.
+
+The conversion used to carry an nx.DiGraph with the whole STIX object of every node attached, which costs
+several dictionaries per node and keeps every object of the export alive until the network is written.
+CompactFlow keeps what the conversion needs in flat arrays instead: nodes are integers, the parents and
+children of every node are stored in CSR form (an offsets array into one array of node indices), and the
+kind of each node and the technique of each action are one small integer per node. Techniques are indices
+into a per-flow table of attack pattern ids, so the ATT&CK probabilities are looked up once per technique.
+The table keeps the ATT&CK ID (technique_id) of each technique next to its STIX id, so actions exported with
+only an ATT&CK ID, or with the STIX id of another release, still find their technique.
+
+Building, divorcing, laying out and writing a flow all work on these arrays, and the CPDs are generated
+from them on demand (in bulk by assembly.FlowNetwork for inference). NetworkX and pgmpy are only needed by
+the adapters at the end of this module, for callers that want NetworkX graphs or pgmpy networks, so they are
+imported by those adapters.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Iterable, List
+
+import numpy as np
+
+from attack_flow_extension import records
+from stix_probability import weights
+
+if TYPE_CHECKING:
+    import networkx as nx
+    from pgmpy.models import BayesianNetwork
+
+# node kinds
+KIND_ACTION = 0
+KIND_CONDITION = 1
+KIND_AND = 2
+KIND_OR = 3
+
+# technique index of nodes without a technique, which is also the last entry of a technique probability table
+NO_TECHNIQUE = -1
+
+# the probability flow_nx_to_pgmpy gives conditions and lone operators
+CONDITION_PROBABILITY = 0.5
+
+
+def _csr(
+    num_nodes: int, sources: np.ndarray, targets: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Group the targets of edges by source, each group sorted by node index.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The offsets (num_nodes + 1 entries) and the grouped targets.
+    """
+    order = np.lexsort((targets, sources))
+    offsets = np.zeros(num_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+    return offsets, targets[order].astype(np.int32)
+
+
+@dataclass(eq=False)
+class FlowStructure:
+    """
+    The nodes and edges of a flow graph, in CSR form.
+
+    Attributes:
+        ids (list[str]): The STIX id of each node, nodes are indices into this list.
+        parent_offsets (np.ndarray): The parents of node i are parents[parent_offsets[i]:parent_offsets[i + 1]].
+        parents (np.ndarray): The parents of every node, each node's sorted by index.
+        child_offsets (np.ndarray): The children of node i are children[child_offsets[i]:child_offsets[i + 1]].
+        children (np.ndarray): The children of every node, each node's sorted by index.
+    """
+
+    ids: List[str]
+    parent_offsets: np.ndarray
+    parents: np.ndarray
+    child_offsets: np.ndarray
+    children: np.ndarray
+
+    @staticmethod
+    def csr_arrays(
+        num_nodes: int, sources: Iterable[int], targets: Iterable[int]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Build the CSR arrays of a list of edges, dropping duplicate edges.
+
+        Args:
+            num_nodes (int): The number of nodes.
+            sources (Iterable[int]): The parent of each edge.
+            targets (Iterable[int]): The child of each edge.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: parent_offsets, parents, child_offsets and
+            children.
+        """
+        edges = np.unique(
+            np.column_stack(
+                (
+                    np.fromiter(sources, dtype=np.int64),
+                    np.fromiter(targets, dtype=np.int64),
+                )
+            ).reshape(-1, 2),
+            axis=0,
+        )
+        parent_offsets, parents = _csr(num_nodes, edges[:, 1], edges[:, 0])
+        child_offsets, children = _csr(num_nodes, edges[:, 0], edges[:, 1])
+        return parent_offsets, parents, child_offsets, children
+
+    @classmethod
+    def from_networkx(cls, graph: nx.DiGraph) -> "FlowStructure":
+        """
+        Get the structure of a NetworkX graph, node ids are the string form of its nodes.
+
+        Args:
+            graph (nx.DiGraph): The graph.
+
+        Returns:
+            FlowStructure: The structure, nodes in the order of the graph.
+        """
+        index = {node: position for position, node in enumerate(graph.nodes)}
+        arrays = cls.csr_arrays(
+            len(index),
+            (index[parent] for parent, _ in graph.edges),
+            (index[child] for _, child in graph.edges),
+        )
+        return cls([str(node) for node in graph.nodes], *arrays)
+
+    @property
+    def num_nodes(self) -> int:
+        """
+        The number of nodes.
+        """
+        return len(self.ids)
+
+    @property
+    def num_edges(self) -> int:
+        """
+        The number of edges.
+        """
+        return len(self.parents)
+
+    def parents_of(self, node: int) -> np.ndarray:
+        """
+        Get the parents of a node, sorted by index.
+        """
+        return self.parents[self.parent_offsets[node] : self.parent_offsets[node + 1]]
+
+    def children_of(self, node: int) -> np.ndarray:
+        """
+        Get the children of a node, sorted by index.
+        """
+        return self.children[self.child_offsets[node] : self.child_offsets[node + 1]]
+
+    def in_degrees(self) -> np.ndarray:
+        """
+        Get the number of parents of every node.
+        """
+        return np.diff(self.parent_offsets)
+
+    def out_degrees(self) -> np.ndarray:
+        """
+        Get the number of children of every node.
+        """
+        return np.diff(self.child_offsets)
+
+    def edge_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get every edge, grouped by child.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The parent and the child of each edge.
+        """
+        children = np.repeat(
+            np.arange(self.num_nodes, dtype=np.int32), self.in_degrees()
+        )
+        return self.parents, children
+
+
+@dataclass(eq=False)
+class CompactFlow(FlowStructure):
+    """
+    An attack flow graph with what its network needs of every node.
+
+    Attributes:
+        kinds (np.ndarray): The kind of each node, one of the KIND_ constants.
+        techniques (np.ndarray): The index into technique_ids of each node's technique, NO_TECHNIQUE if none.
+        technique_ids (list[str]): The attack pattern STIX ids used by the flow, or the ATT&CK ID of techniques
+            given without one.
+        technique_external_ids (list[str | None]): The ATT&CK ID given with each of technique_ids, if any.
+        labels (list[str]): The label of each node, e.g. "Action: Phishing".
+        positions (np.ndarray | None): The (x, y) position of each node, None if the flow was not laid out.
+    """
+
+    kinds: np.ndarray
+    techniques: np.ndarray
+    technique_ids: List[str]
+    technique_external_ids: List[str | None]
+    labels: List[str]
+    positions: np.ndarray | None = None
+
+    def technique_of(self, node: int) -> str | None:
+        """
+        Get the attack pattern STIX id of a node's technique, or its ATT&CK ID if it was given without one.
+        """
+        technique = int(self.techniques[node])
+        return None if technique == NO_TECHNIQUE else self.technique_ids[technique]
+
+
+def _describe(flow_obj: Any) -> tuple[int, str, tuple[str, str | None] | None]:
+    """
+    Get the kind, label and technique of a flow object, the technique being its entry of technique_ids
+    (technique_ref, or technique_id without one) and technique_id.
+
+    Raises:
+        ValueError: If the object is not an action, operator or condition, or the operator is unknown.
+    """
+    if flow_obj.type == "attack-action":
+        technique_id = flow_obj.get_technique_id()
+        technique = flow_obj.get_attack_pattern_id() or technique_id
+        return (
+            KIND_ACTION,
+            f"Action: {flow_obj.name}",
+            None if technique is None else (technique, technique_id),
+        )
+    if flow_obj.type == "attack-operator":
+        if flow_obj.is_and():
+            return KIND_AND, f"Operator: {flow_obj.operator}", None
+        if flow_obj.is_or():
+            return KIND_OR, f"Operator: {flow_obj.operator}", None
+        raise ValueError("Unknown operator type")
+    if flow_obj.type == "attack-condition":
+        return KIND_CONDITION, f"Condition: {flow_obj.description}", None
+    raise ValueError("Unknown node type")
+
+
+def _compact_flow(
+    ids: List[str], objects: List[Any], edges: List[tuple[int, int]]
+) -> CompactFlow:
+    """
+    Build a CompactFlow from the flow object of every node and the edges between them.
+    """
+    kinds = np.empty(len(ids), dtype=np.uint8)
+    techniques = np.full(len(ids), NO_TECHNIQUE, dtype=np.int32)
+    technique_index: dict[tuple[str, str | None], int] = {}
+    labels = []
+    for node, flow_obj in enumerate(objects):
+        kind, label, technique = _describe(flow_obj)
+        kinds[node] = kind
+        labels.append(label)
+        if technique is not None:
+            techniques[node] = technique_index.setdefault(
+                technique, len(technique_index)
+            )
+    arrays = FlowStructure.csr_arrays(
+        len(ids), (edge[0] for edge in edges), (edge[1] for edge in edges)
+    )
+    return CompactFlow(
+        ids,
+        *arrays,
+        kinds,
+        techniques,
+        [technique for technique, _ in technique_index],
+        [technique_id for _, technique_id in technique_index],
+        labels,
+    )
+
+
+def from_attack_flow(
+    attack_flow: records.AnyAttackFlow,
+    flow_bundle: Any,
+    object_index: dict[str, List[Any]] | None = None,
+) -> CompactFlow:
+    """
+    Traverse an attack flow breadth first into a CompactFlow, like main.convert_attack_flow_to_nx.
+
+    Nodes are numbered in the order they are discovered, which is the node order of the NetworkX graph.
+
+    Args:
+        attack_flow (records.AnyAttackFlow): The attack flow.
+        flow_bundle (Any): The stix2.Bundle or records.FlowBundle containing it.
+        object_index (dict[str, List[Any]] | None): The id index of the bundle, see records.index_flow_objects.
+
+    Returns:
+        CompactFlow: The flow graph.
+
+    Raises:
+        ValueError: If a referenced object is missing or ambiguous, or of an unknown type.
+    """
+    if object_index is None:
+        object_index = records.index_flow_objects(flow_bundle)
+    index: dict[str, int] = {}
+    objects: List[Any] = []
+    edges: List[tuple[int, int]] = []
+
+    def discover(node_id: str) -> int:
+        if node_id not in index:
+            index[node_id] = len(objects)
+            objects.append(
+                records.get_single_flow_object_by_id(node_id, flow_bundle, object_index)
+            )
+        return index[node_id]
+
+    for starting_node in attack_flow.get_starting_points():
+        discover(starting_node)
+    # the objects list doubles as the queue, nodes are expanded in the order they were discovered
+    head = 0
+    while head < len(objects):
+        node_obj = objects[head]
+        if "effect_refs" in node_obj:
+            children = node_obj["effect_refs"]
+        elif "on_false_refs" in node_obj:
+            # TODO handle false_refs, conditions with a false branch are treated as terminal for now
+            children = []
+        else:
+            children = node_obj.get("on_true_refs", [])
+        for child in children:
+            edges.append((head, discover(child)))
+        head += 1
+    return _compact_flow(list(index), objects, edges)
+
+
+def from_networkx(graph: nx.DiGraph) -> CompactFlow:
+    """
+    Build a CompactFlow from a NetworkX flow graph whose nodes hold their flow object under "object".
+
+    Args:
+        graph (nx.DiGraph): The graph, e.g. from main.convert_attack_flow_to_nx or divorce.divorce_parents.
+
+    Returns:
+        CompactFlow: The flow graph, nodes in the order of the graph.
+    """
+    index = {node: position for position, node in enumerate(graph.nodes)}
+    return _compact_flow(
+        [str(node) for node in graph.nodes],
+        [node_data["object"] for _, node_data in graph.nodes(data=True)],
+        [(index[parent], index[child]) for parent, child in graph.edges],
+    )
+
+
+def resolve_techniques(
+    compact_flow: CompactFlow, probability_db: weights.ProbabilityDatabase
+) -> tuple[np.ndarray, List[str]]:
+    """
+    Look every technique of a flow up in the probability database once, see ProbabilityDatabase.resolve_technique.
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+
+    Returns:
+        tuple[np.ndarray, list[str]]: The probability and resolution level of each entry of technique_ids, followed
+        by those of actions without a technique.
+    """
+    probabilities = []
+    levels = []
+    for technique_ref, technique_id in zip(
+        compact_flow.technique_ids, compact_flow.technique_external_ids
+    ):
+        technique, level = probability_db.resolve_technique(technique_ref, technique_id)
+        probabilities.append(
+            weights.UNKNOWN_TECHNIQUE_PROBABILITY
+            if technique is None
+            else technique.probability
+        )
+        levels.append(level)
+    # actions without a technique get the probability of an unknown one
+    probabilities.append(
+        probability_db.get_probability_for_technique(weights.StixId(""))
+    )
+    levels.append(weights.NO_TECHNIQUE)
+    return np.array(probabilities, dtype=np.float64), levels
+
+
+def node_probabilities(
+    compact_flow: CompactFlow, probability_db: weights.ProbabilityDatabase
+) -> np.ndarray:
+    """
+    Get P(true) of every action and condition, looking each technique up once.
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+
+    Returns:
+        np.ndarray: The probability of each node, 0.5 for conditions and operators.
+    """
+    table, _ = resolve_techniques(compact_flow, probability_db)
+    return np.where(
+        compact_flow.kinds == KIND_ACTION,
+        table[compact_flow.techniques],
+        CONDITION_PROBABILITY,
+    )
+
+
+def technique_coverage(
+    compact_flow: CompactFlow, probability_db: weights.ProbabilityDatabase
+) -> dict[str, int]:
+    """
+    Count the actions of a flow by how their technique was found in the probability database.
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+
+    Returns:
+        dict[str, int]: The number of actions at each of weights.RESOLUTION_LEVELS.
+    """
+    _, levels = resolve_techniques(compact_flow, probability_db)
+    # NO_TECHNIQUE (-1) counts in the last bin, like it indexes the last entry of the probability table
+    actions = np.bincount(
+        compact_flow.techniques[compact_flow.kinds == KIND_ACTION] % len(levels),
+        minlength=len(levels),
+    )
+    coverage = dict.fromkeys(weights.RESOLUTION_LEVELS, 0)
+    for level, count in zip(levels, actions.tolist()):
+        coverage[level] += count
+    return coverage
+
+
+def cpd_values(
+    compact_flow: CompactFlow, node: int, probabilities: np.ndarray
+) -> np.ndarray:
+    """
+    Build the CPD of a node, with the same values flow_nx_to_pgmpy gives it.
+
+    Actions and conditions are true with their probability whatever their parents, operators are
+    deterministic AND/OR gates over their parents (or a fair coin if they have none).
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+        node (int): The node.
+        probabilities (np.ndarray): The probabilities from node_probabilities.
+
+    Returns:
+        np.ndarray: The CPD values in pgmpy layout, the node's own axis first followed by one axis per parent.
+    """
+    num_parents = int(
+        compact_flow.parent_offsets[node + 1] - compact_flow.parent_offsets[node]
+    )
+    kind = compact_flow.kinds[node]
+    values = np.empty((2,) * (num_parents + 1))
+    if kind in (KIND_ACTION, KIND_CONDITION) or num_parents == 0:
+        probability = (
+            probabilities[node]
+            if kind in (KIND_ACTION, KIND_CONDITION)
+            else CONDITION_PROBABILITY
+        )
+        values[0] = 1 - probability
+        values[1] = probability
+        return values
+    if kind == KIND_AND:
+        # true only when every parent is true
+        values[1] = 0
+        values[1][(1,) * num_parents] = 1
+    else:
+        # true when any parent is true
+        values[1] = 1
+        values[1][(0,) * num_parents] = 0
+    values[0] = 1 - values[1]
+    return values
+
+
+def terminal_nodes(compact_flow: CompactFlow) -> List[str]:
+    """
+    Get the ids of the nodes without children.
+    """
+    return [
+        compact_flow.ids[node]
+        for node in np.flatnonzero(compact_flow.out_degrees() == 0)
+    ]
+
+
+def to_networkx(compact_flow: CompactFlow) -> nx.DiGraph:
+    """
+    Build a NetworkX graph of a flow, labelled and positioned like make_nx_graph_more_readable does.
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+
+    Returns:
+        nx.DiGraph: The graph, with the node kind and technique as node attributes.
+    """
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    for node, name in enumerate(compact_flow.ids):
+        attributes: dict[str, Any] = {
+            "label": f'"{compact_flow.labels[node]}"',
+            "kind": int(compact_flow.kinds[node]),
+            "technique": compact_flow.technique_of(node),
+        }
+        if compact_flow.positions is not None:
+            x, y = compact_flow.positions[node]
+            attributes["position"] = f"({x},{y})"
+        graph.add_node(name, **attributes)
+    parents, children = compact_flow.edge_arrays()
+    graph.add_edges_from(
+        (compact_flow.ids[parent], compact_flow.ids[child])
+        for parent, child in zip(parents.tolist(), children.tolist())
+    )
+    return graph
+
+
+def to_bayesian_network(
+    compact_flow: CompactFlow, probabilities: np.ndarray
+) -> BayesianNetwork:
+    """
+    Build the pgmpy network of a flow, for the features that need pgmpy objects.
+
+    The CPDs are built and validated in bulk by assembly.assemble_network, see assembly.FlowNetwork for the
+    labels, positions and "actions_by_technique" graph attribute of the network.
+
+    Args:
+        compact_flow (CompactFlow): The flow graph.
+        probabilities (np.ndarray): The probabilities from node_probabilities.
+
+    Returns:
+        BayesianNetwork: The network, with the same CPDs flow_nx_to_pgmpy would build.
+
+    Raises:
+        ValueError: If the network is invalid.
+    """
+    from flow_network import assembly
+
+    return assembly.assemble_network(compact_flow, probabilities).to_bayesian_network()
@@ -0,0 +1,187 @@
+"""
+Parent divorcing for attack flow graphs.
+
+A node with n parents needs a 2 x 2^n CPD, so a single operator joining 30 branches would need a table with
+a billion columns. Divorcing inserts intermediate gate nodes so that no node has more than a fixed number
+of parents, which keeps the total size of the CPDs linear in the fan-in.
+
+The rewrite is exact. AND and OR are associative, so an operator over its parents is the same as the same
+operator over gates that each combine a group of them. Actions and conditions get the same probability for
+every combination of their parents, so any deterministic gate in front of them leaves them unchanged; an
+OR gate is used, matching the reading "any of the preceding steps happened".
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from flow_network import compact
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+@dataclass(frozen=True)
+class DivorceGate:
+    """
+    Stand-in for the flow object of an intermediate gate node, shaped like flow.AttackOperator.
+
+    Attributes:
+        operator (str): "AND" or "OR".
+        divorced_node (str): The node whose parents this gate combines.
+    """
+
+    operator: str
+    divorced_node: str
+    type: str = "attack-operator"
+
+    def is_and(self) -> bool:
+        """
+        Returns whether the gate is an AND gate.
+
+        Returns:
+            bool: True if the gate is an AND gate, False otherwise.
+        """
+        return self.operator == "AND"
+
+    def is_or(self) -> bool:
+        """
+        Returns whether the gate is an OR gate.
+
+        Returns:
+            bool: True if the gate is an OR gate, False otherwise.
+        """
+        return self.operator == "OR"
+
+
+def _gate_operator(flow_obj: Any) -> str:
+    """
+    Pick the operator of the gates inserted in front of a node.
+
+    Args:
+        flow_obj (Any): The flow object of the divorced node.
+
+    Returns:
+        str: "AND" for AND operators, "OR" otherwise.
+    """
+    if flow_obj.type == "attack-operator" and flow_obj.is_and():
+        return "AND"
+    return "OR"
+
+
+def divorce_parents(graph: nx.DiGraph, max_fan_in: int) -> nx.DiGraph:
+    """
+    Rewrite the graph in place so that no node has more than max_fan_in parents.
+
+    The parents of a node with too many of them are split, in order, into groups of max_fan_in that each feed
+    a new gate node, repeating until the node is left with at most max_fan_in inputs. The gate nodes are
+    named after the node they belong to, e.g. attack-operator--<uuid>-gate-1.
+
+    Args:
+        graph (nx.DiGraph): The flow graph, every node has its flow object under "object".
+        max_fan_in (int): The largest number of parents a node may keep, at least 2.
+
+    Returns:
+        nx.DiGraph: The same graph, for chaining.
+
+    Raises:
+        ValueError: If max_fan_in is smaller than 2.
+    """
+    if max_fan_in < 2:
+        raise ValueError("max_fan_in must be at least 2")
+    for node in list(graph.nodes):
+        parents = list(graph.predecessors(node))
+        if len(parents) <= max_fan_in:
+            continue
+        operator = _gate_operator(graph.nodes[node]["object"])
+        graph.remove_edges_from((parent, node) for parent in parents)
+        gate_count = 0
+        while len(parents) > max_fan_in:
+            grouped = []
+            for start in range(0, len(parents), max_fan_in):
+                group = parents[start : start + max_fan_in]
+                if len(group) == 1:
+                    grouped.append(group[0])
+                    continue
+                gate_count += 1
+                gate = f"{node}-gate-{gate_count}"
+                graph.add_node(gate, object=DivorceGate(operator, node))
+                graph.add_edges_from((parent, gate) for parent in group)
+                grouped.append(gate)
+            parents = grouped
+        graph.add_edges_from((parent, node) for parent in parents)
+    return graph
+
+
+def divorce_compact_flow(
+    compact_flow: compact.CompactFlow, max_fan_in: int
+) -> compact.CompactFlow:
+    """
+    Divorce the parents of a compact flow, exactly like divorce_parents does on a NetworkX graph.
+
+    Parents are grouped in index order, and the gate nodes are appended after the existing nodes in the
+    order they are created, so both functions give the same network.
+
+    Args:
+        compact_flow (compact.CompactFlow): The flow graph.
+        max_fan_in (int): The largest number of parents a node may keep, at least 2.
+
+    Returns:
+        compact.CompactFlow: A new flow graph, or the same one if no node has too many parents.
+
+    Raises:
+        ValueError: If max_fan_in is smaller than 2.
+    """
+    if max_fan_in < 2:
+        raise ValueError("max_fan_in must be at least 2")
+    wide = np.flatnonzero(compact_flow.in_degrees() > max_fan_in)
+    if len(wide) == 0:
+        return compact_flow
+    ids = list(compact_flow.ids)
+    kinds = compact_flow.kinds.tolist()
+    labels = list(compact_flow.labels)
+    parents, children = compact_flow.edge_arrays()
+    # the edges into nodes that keep their parents stay as they are
+    keep = ~np.isin(children, wide)
+    sources = parents[keep].tolist()
+    targets = children[keep].tolist()
+    for node in wide.tolist():
+        operator = "AND" if kinds[node] == compact.KIND_AND else "OR"
+        node_parents = compact_flow.parents_of(node).tolist()
+        gate_count = 0
+        while len(node_parents) > max_fan_in:
+            grouped = []
+            for start in range(0, len(node_parents), max_fan_in):
+                group = node_parents[start : start + max_fan_in]
+                if len(group) == 1:
+                    grouped.append(group[0])
+                    continue
+                gate_count += 1
+                gate = len(ids)
+                ids.append(f"{ids[node]}-gate-{gate_count}")
+                kinds.append(compact.KIND_AND if operator == "AND" else compact.KIND_OR)
+                labels.append(f"Operator: {operator}")
+                sources.extend(group)
+                targets.extend([gate] * len(group))
+                grouped.append(gate)
+            node_parents = grouped
+        sources.extend(node_parents)
+        targets.extend([node] * len(node_parents))
+    added = len(ids) - compact_flow.num_nodes
+    return compact.CompactFlow(
+        ids,
+        *compact.FlowStructure.csr_arrays(len(ids), sources, targets),
+        np.array(kinds, dtype=np.uint8),
+        np.concatenate(
+            (
+                compact_flow.techniques,
+                np.full(added, compact.NO_TECHNIQUE, dtype=np.int32),
+            )
+        ),
+        list(compact_flow.technique_ids),
+        list(compact_flow.technique_external_ids),
+        labels,
+    )
@@ -0,0 +1,523 @@
+"""
+Exact inference on the Bayesian networks built from attack flows.
+
+pgmpy's inference classes redo most of their work on every query: VariableElimination prunes the network and
+searches for an elimination order each time, and BeliefPropagation runs a fresh elimination on a subtree.
+CompiledNetwork does the structural work once per network instead. It finds an elimination order on the
+moral graph, turns it into a junction tree (one clique per eliminated variable, linked to the clique of the
+next neighbour to be eliminated) and places every CPD in a clique. A query then only multiplies in the
+evidence and passes messages up and down the tree once, which yields the marginal of every node at the same
+time. Calibrations are cached per evidence set, so any number of queries under the same evidence cost one.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections import ChainMap
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+import numpy as np
+
+from flow_network.assembly import network_tables
+
+if TYPE_CHECKING:
+    from pgmpy.models import BayesianNetwork
+
+    from flow_network.assembly import FlowNetwork
+
+# refuse to compile networks whose cliques would need more entries than this in total
+DEFAULT_MAX_TABLE_ENTRIES = 1 << 26
+
+
+def _elimination_order(neighbours: list[set[int]]) -> list[int]:
+    """
+    Greedy min-fill elimination order, using min-degree and then the index to break ties.
+
+    Only the scores of the eliminated variable's neighbours are refreshed after each step, which keeps the
+    search close to linear on the sparse graphs attack flows produce.
+
+    Args:
+        neighbours (list[set[int]]): The moral graph as adjacency sets, consumed by this function.
+
+    Returns:
+        list[int]: Every variable, in the order it should be eliminated.
+    """
+
+    def score(var: int) -> tuple[int, int, int]:
+        adjacent = list(neighbours[var])
+        fill = 0
+        for position, first in enumerate(adjacent):
+            for second in adjacent[position + 1 :]:
+                if second not in neighbours[first]:
+                    fill += 1
+        return (fill, len(adjacent), var)
+
+    heap = [score(var) for var in range(len(neighbours))]
+    heapq.heapify(heap)
+    current = {entry[2]: entry for entry in heap}
+    eliminated = [False] * len(neighbours)
+    order = []
+    while heap:
+        entry = heapq.heappop(heap)
+        var = entry[2]
+        if eliminated[var] or current[var] != entry:
+            continue  # stale entry
+        eliminated[var] = True
+        order.append(var)
+        adjacent = list(neighbours[var])
+        for first in adjacent:
+            neighbours[first].discard(var)
+            neighbours[first].update(other for other in adjacent if other != first)
+        for first in adjacent:
+            current[first] = score(first)
+            heapq.heappush(heap, current[first])
+    return order
+
+
+class CompiledNetwork:
+    """
+    A Bayesian network compiled into a junction tree for repeated exact queries.
+
+    Attributes:
+        variables (list[str]): The nodes of the network.
+        cardinality (list[int]): The number of states of each node.
+    """
+
+    def __init__(
+        self,
+        model: BayesianNetwork | FlowNetwork,
+        max_table_entries: int = DEFAULT_MAX_TABLE_ENTRIES,
+    ):
+        """
+        Compile the junction tree of a network.
+
+        Args:
+            model (BayesianNetwork | FlowNetwork): The network, every node must have a CPD.
+            max_table_entries (int): The largest total clique table size to accept.
+
+        Raises:
+            ValueError: If the junction tree would be larger than max_table_entries.
+        """
+        tables = network_tables(model)
+        self.variables = tables.variables
+        self._index = tables.index
+        self.cardinality = tables.cardinality
+
+        # the scope of each CPD in pgmpy's order, the first variable being the CPD's own
+        self._full_scopes = tables.scopes
+        # parents a CPD does not vary with (e.g. of actions and conditions) add no dependency, so they are left
+        # out of the moral graph, which keeps the cliques small and the junction tree shallow
+        self._cpd_scopes: list[list[int]] = []
+        self._factors: list[np.ndarray] = []
+        for var, scope in enumerate(self._full_scopes):
+            values = self._full_values(var, tables.values[var])
+            self._cpd_scopes.append(
+                [scope[0]]
+                + [
+                    parent
+                    for axis, parent in enumerate(scope[1:], start=1)
+                    if not np.allclose(values, values.take([0], axis=axis))
+                ]
+            )
+            self._factors.append(self._factor(var, values))
+        neighbours: list[set[int]] = [set() for _ in self.variables]
+        for scope in self._cpd_scopes:
+            for var in scope:
+                neighbours[var].update(other for other in scope if other != var)
+
+        order = _elimination_order([set(adjacent) for adjacent in neighbours])
+        position = {var: step for step, var in enumerate(order)}
+
+        # one clique per eliminated variable: the variable and its neighbours at the time
+        self._cliques: list[tuple[int, ...]] = []
+        self._clique_of = [0] * len(self.variables)
+        self._parent: list[int | None] = []
+        remaining = [set(adjacent) for adjacent in neighbours]
+        for step, var in enumerate(order):
+            adjacent = remaining[var]
+            self._cliques.append(tuple(sorted(adjacent | {var})))
+            self._clique_of[var] = step
+            for first in adjacent:
+                remaining[first].discard(var)
+                remaining[first].update(other for other in adjacent if other != first)
+        for step, var in enumerate(order):
+            later = [other for other in self._cliques[step] if other != var]
+            # linking to the clique of the next neighbour to go keeps the running intersection property
+            self._parent.append(
+                min(position[other] for other in later) if later else None
+            )
+        # the variables a clique shares with its parent are exactly the ones eliminated after it
+        self._sepsets = [
+            tuple(var for var in clique if var != order[step])
+            for step, clique in enumerate(self._cliques)
+        ]
+
+        total_entries = sum(self._table_size(clique) for clique in self._cliques)
+        if total_entries > max_table_entries:
+            raise ValueError(
+                f"The junction tree needs {total_entries} table entries, more than the limit of "
+                f"{max_table_entries}; divorce the parents of wide nodes or use approximate inference"
+            )
+
+        # every CPD goes to the clique of the first of its variables to be eliminated
+        self._clique_cpds: list[list[int]] = [[] for _ in self._cliques]
+        self._cpd_clique = [0] * len(self.variables)
+        self._children: list[list[int]] = [[] for _ in self._cliques]
+        for var, scope in enumerate(self._cpd_scopes):
+            self._cpd_clique[var] = min(position[other] for other in scope)
+            self._clique_cpds[self._cpd_clique[var]].append(var)
+        for step, parent in enumerate(self._parent):
+            if parent is not None:
+                self._children[parent].append(step)
+        self._potentials = [
+            self._clique_potential(step, {}) for step in range(len(self._cliques))
+        ]
+        self._calibrations: dict[tuple[tuple[int, int], ...], list[np.ndarray]] = {}
+        self._prior_messages: dict[int, np.ndarray] | None = None
+
+    def _full_values(self, var: int, values: np.ndarray) -> np.ndarray:
+        """
+        Reshape CPD values from pgmpy's (states x parent configurations) layout to one axis per variable.
+        """
+        return np.asarray(values, dtype=np.float64).reshape(
+            [self.cardinality[other] for other in self._full_scopes[var]]
+        )
+
+    def _factor(self, var: int, values: np.ndarray) -> np.ndarray:
+        """
+        Turn CPD values into a factor over the CPD's compiled scope, with axes in variable index order.
+
+        Args:
+            var (int): The variable of the CPD.
+            values (np.ndarray): The CPD values, in pgmpy's layout or with one axis per variable.
+
+        Returns:
+            np.ndarray: The factor.
+
+        Raises:
+            ValueError: If the values vary with a parent left out of the compiled scope.
+        """
+        full = self._full_values(var, values)
+        kept = set(self._cpd_scopes[var])
+        reduced = full[
+            tuple(
+                slice(None) if other in kept else 0 for other in self._full_scopes[var]
+            )
+        ]
+        expanded = reduced[
+            tuple(
+                slice(None) if other in kept else np.newaxis
+                for other in self._full_scopes[var]
+            )
+        ]
+        if not np.allclose(full, expanded):
+            raise ValueError(
+                f"The CPD of {self.variables[var]} must not depend on parents its compiled CPD ignores"
+            )
+        # sorting the axes by variable index lets sub-scopes keep their relative order
+        scope = self._cpd_scopes[var]
+        return reduced.transpose(
+            sorted(range(len(scope)), key=lambda axis: scope[axis])
+        )
+
+    def _clique_potential(
+        self, step: int, replaced: Mapping[int, np.ndarray]
+    ) -> np.ndarray:
+        """
+        Multiply the CPD factors assigned to a clique into its potential.
+
+        Args:
+            step (int): The clique.
+            replaced (Mapping[int, np.ndarray]): Factors to use instead of the compiled ones, by variable.
+
+        Returns:
+            np.ndarray: The potential, with one axis per clique variable.
+        """
+        clique = self._cliques[step]
+        potential = np.ones(self._shape(clique, clique))
+        for var in self._clique_cpds[step]:
+            factor = replaced[var] if var in replaced else self._factors[var]
+            potential = potential * factor.reshape(
+                self._shape(tuple(sorted(self._cpd_scopes[var])), clique)
+            )
+        return potential
+
+    def _table_size(self, scope: Iterable[int]) -> int:
+        """
+        Get the number of entries of a table over a scope.
+        """
+        size = 1
+        for var in scope:
+            size *= self.cardinality[var]
+        return size
+
+    def _shape(self, scope: tuple[int, ...], target: tuple[int, ...]) -> list[int]:
+        """
+        Get the shape that broadcasts a table over scope against a table over target.
+        """
+        members = set(scope)
+        return [self.cardinality[var] if var in members else 1 for var in target]
+
+    def _sum_to(
+        self, values: np.ndarray, scope: tuple[int, ...], target: tuple[int, ...]
+    ) -> np.ndarray:
+        """
+        Sum a table over scope down to a table over target, a subset of scope.
+        """
+        members = set(target)
+        axes = tuple(axis for axis, var in enumerate(scope) if var not in members)
+        return values.sum(axis=axes) if axes else values
+
+    def _calibrate(self, evidence: Mapping[int, int]) -> list[np.ndarray]:
+        """
+        Run one upward and one downward pass of Hugin propagation under the evidence.
+
+        Args:
+            evidence (Mapping[int, int]): The observed state of each observed variable.
+
+        Returns:
+            list[np.ndarray]: The calibrated belief of every clique, shaped like its potential.
+        """
+        key = tuple(sorted(evidence.items()))
+        if key in self._calibrations:
+            return self._calibrations[key]
+        beliefs = [potential.copy() for potential in self._potentials]
+        for var, state in evidence.items():
+            step = self._clique_of[var]
+            indicator = np.zeros(self.cardinality[var])
+            indicator[state] = 1.0
+            beliefs[step] = beliefs[step] * indicator.reshape(
+                self._shape((var,), self._cliques[step])
+            )
+        # cliques come in elimination order, so every child is finished before its parent
+        upward: list[np.ndarray | None] = [None] * len(self._cliques)
+        for step, parent in enumerate(self._parent):
+            if parent is None:
+                continue
+            sepset = self._sepsets[step]
+            message = self._sum_to(beliefs[step], self._cliques[step], sepset)
+            upward[step] = message.reshape(self._shape(sepset, self._cliques[step]))
+            beliefs[parent] = beliefs[parent] * message.reshape(
+                self._shape(sepset, self._cliques[parent])
+            )
+        for step in reversed(range(len(self._cliques))):
+            parent = self._parent[step]
+            if parent is None:
+                continue
+            sepset = self._sepsets[step]
+            down = self._sum_to(beliefs[parent], self._cliques[parent], sepset)
+            down = down.reshape(self._shape(sepset, self._cliques[step]))
+            up = upward[step]
+            assert up is not None
+            # Hugin update, where 0/0 is 0 because deterministic gates put zeros in the tables
+            ratio = np.divide(down, up, out=np.zeros_like(down), where=up != 0)
+            beliefs[step] = beliefs[step] * ratio
+        if len(self._calibrations) >= 8:
+            self._calibrations.pop(next(iter(self._calibrations)))
+        self._calibrations[key] = beliefs
+        return beliefs
+
+    def _evidence_indices(self, evidence: Mapping[str, int] | None) -> dict[int, int]:
+        """
+        Translate named evidence into variable indices, validating it.
+
+        Raises:
+            ValueError: If a variable or state does not exist.
+        """
+        indices = {}
+        for name, state in (evidence or {}).items():
+            if name not in self._index:
+                raise ValueError(f"Unknown evidence variable {name}")
+            var = self._index[name]
+            if not 0 <= int(state) < self.cardinality[var]:
+                raise ValueError(f"Invalid state {state} for {name}")
+            indices[var] = int(state)
+        return indices
+
+    def marginals(
+        self,
+        variables: Iterable[str] | None = None,
+        evidence: Mapping[str, int] | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Compute the posterior distribution of each variable given the evidence.
+
+        Args:
+            variables (Iterable[str] | None): The variables to report, None for every variable.
+            evidence (Mapping[str, int] | None): The observed state of each observed variable.
+
+        Returns:
+            dict[str, np.ndarray]: The normalised distribution of each variable over its states.
+
+        Raises:
+            ValueError: If a variable is unknown or the evidence is impossible.
+        """
+        indices = self._evidence_indices(evidence)
+        beliefs = self._calibrate(indices)
+        names = self.variables if variables is None else list(variables)
+        result = {}
+        for name in names:
+            if name not in self._index:
+                raise ValueError(f"Unknown query variable {name}")
+            var = self._index[name]
+            step = self._clique_of[var]
+            distribution = self._sum_to(beliefs[step], self._cliques[step], (var,))
+            total = distribution.sum()
+            if total <= 0:
+                raise ValueError("The evidence has zero probability")
+            result[name] = distribution / total
+        return result
+
+    def probability_of_evidence(self, evidence: Mapping[str, int]) -> float:
+        """
+        Compute the probability of observing the evidence.
+
+        Args:
+            evidence (Mapping[str, int]): The observed state of each observed variable.
+
+        Returns:
+            float: P(evidence).
+        """
+        beliefs = self._calibrate(self._evidence_indices(evidence))
+        # every tree of the forest is calibrated to its own share of P(evidence)
+        probability = 1.0
+        for step, parent in enumerate(self._parent):
+            if parent is None:
+                probability *= float(beliefs[step].sum())
+        return probability
+
+    def _messages_without_evidence(self) -> dict[int, np.ndarray]:
+        """
+        Get the upward message of every clique without evidence, computed once.
+
+        Returns:
+            dict[int, np.ndarray]: The message over each clique's sepset, or the total of a root.
+        """
+        if self._prior_messages is None:
+            self._prior_messages = self._collect(range(len(self._cliques)), {}, {})
+        return self._prior_messages
+
+    def _with_ancestors(self, steps: Iterable[int]) -> set[int]:
+        """
+        Get the cliques on the paths from some cliques to their roots.
+        """
+        dirty: set[int] = set()
+        for step in steps:
+            current: int | None = step
+            while current is not None and current not in dirty:
+                dirty.add(current)
+                current = self._parent[current]
+        return dirty
+
+    def _collect(
+        self,
+        steps: Iterable[int],
+        potentials: Mapping[int, np.ndarray],
+        messages: Mapping[int, np.ndarray],
+    ) -> dict[int, np.ndarray]:
+        """
+        Recompute the upward messages of a set of cliques that contains the parent of each of its members.
+
+        Args:
+            steps (Iterable[int]): The cliques to recompute.
+            potentials (Mapping[int, np.ndarray]): Potentials to use instead of the compiled ones, by clique.
+            messages (Mapping[int, np.ndarray]): The messages of the children that are not recomputed.
+
+        Returns:
+            dict[int, np.ndarray]: The message over each clique's sepset, or the total of a root.
+        """
+        collected: dict[int, np.ndarray] = {}
+        # cliques come in elimination order, so every child is finished before its parent
+        for step in sorted(steps):
+            clique = self._cliques[step]
+            potential = potentials.get(step, self._potentials[step])
+            for child in self._children[step]:
+                message = collected[child] if child in collected else messages[child]
+                potential = potential * message.reshape(
+                    self._shape(self._sepsets[child], clique)
+                )
+            if self._parent[step] is None:
+                collected[step] = np.asarray(potential.sum())
+            else:
+                collected[step] = self._sum_to(potential, clique, self._sepsets[step])
+        return collected
+
+    def probabilities(
+        self,
+        evidence_sets: Iterable[Mapping[str, int]],
+        cpds: Mapping[str, np.ndarray] | None = None,
+    ) -> list[float]:
+        """
+        Compute P(evidence) of several evidence sets in the network with some CPDs replaced, without
+        recompiling it.
+
+        The upward messages without evidence are computed once and kept. Replaced CPDs and evidence only
+        change the messages on the paths from their cliques to the root, so only those are recomputed: once
+        for the replaced CPDs, then once per evidence set on top of that. Sweeps over many small changes to
+        the network therefore cost a fraction of a calibration per change.
+
+        Args:
+            evidence_sets (Iterable[Mapping[str, int]]): The observed state of each observed variable, per set.
+            cpds (Mapping[str, np.ndarray] | None): New CPD values of some variables, in the layout of
+                TabularCPD.get_values for their current CPD.
+
+        Returns:
+            list[float]: P(evidence) of each evidence set in the changed network.
+
+        Raises:
+            ValueError: If a variable or state does not exist, or a new CPD depends on a parent its compiled
+                CPD ignores.
+        """
+        replaced = {}
+        for name, values in (cpds or {}).items():
+            if name not in self._index:
+                raise ValueError(f"Unknown variable {name}")
+            var = self._index[name]
+            replaced[var] = self._factor(var, values)
+        prior = self._messages_without_evidence()
+        touched = {self._cpd_clique[var] for var in replaced}
+        potentials = {step: self._clique_potential(step, replaced) for step in touched}
+        changed = ChainMap(
+            self._collect(self._with_ancestors(touched), potentials, prior), prior
+        )
+        results = []
+        for evidence in evidence_sets:
+            indices = self._evidence_indices(evidence)
+            observed = dict(potentials)
+            for var, state in indices.items():
+                step = self._clique_of[var]
+                indicator = np.zeros(self.cardinality[var])
+                indicator[state] = 1.0
+                observed[step] = observed.get(
+                    step, self._potentials[step]
+                ) * indicator.reshape(self._shape((var,), self._cliques[step]))
+            collected = self._collect(
+                self._with_ancestors(self._clique_of[var] for var in indices),
+                observed,
+                changed,
+            )
+            # without evidence every tree of the forest sums to one, so only the recomputed ones matter
+            probability = 1.0
+            for step, total in ChainMap(collected, changed.maps[0]).items():
+                if self._parent[step] is None:
+                    probability *= float(total)
+            results.append(probability)
+        return results
+
+    def probability(
+        self,
+        evidence: Mapping[str, int] | None = None,
+        cpds: Mapping[str, np.ndarray] | None = None,
+    ) -> float:
+        """
+        Compute P(evidence) in the network with some CPDs replaced, without recompiling it.
+
+        Args:
+            evidence (Mapping[str, int] | None): The observed state of each observed variable.
+            cpds (Mapping[str, np.ndarray] | None): New CPD values of some variables, in the layout of
+                TabularCPD.get_values for their current CPD.
+
+        Returns:
+            float: P(evidence) in the changed network.
+        """
+        return self.probabilities([evidence or {}], cpds)[0]
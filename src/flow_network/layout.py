@@ -0,0 +1,220 @@
+"""
+Layered layout of attack flow graphs for UnBBayes.
+
+A force-directed layout such as nx.spring_layout compares every pair of nodes on each iteration and starts
+from random positions, so it is slow on large flows and moves every node on every run. Attack flows are
+DAGs read from top to bottom, which a layered (Sugiyama-style) layout draws directly: each node goes on
+the layer of the longest path reaching it, and the nodes of each layer are ordered by the barycenter of
+their neighbours in the layer above or below to limit edge crossings. Every step is a linear pass plus a
+sort per layer, and ties are broken by node id, so the same flow always gets the same positions.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Hashable
+
+import numpy as np
+
+from flow_network.compact import FlowStructure
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+# pixels between two layers and between two neighbours on a layer
+LAYER_SPACING = 150
+NODE_SPACING = 300
+
+# alternating down and up passes of the barycenter ordering
+ORDERING_SWEEPS = 4
+
+
+def assign_layers(structure: FlowStructure) -> list[list[int]]:
+    """
+    Put every node on the layer of the longest path from a source to it.
+
+    Nodes on a cycle, which a valid flow cannot have, go on one extra layer below the others.
+
+    Args:
+        structure (FlowStructure): The flow graph.
+
+    Returns:
+        list[list[int]]: The nodes of each layer, sources first, sorted by node id.
+    """
+    pending = structure.in_degrees().tolist()
+    layer_of = [0] * structure.num_nodes
+    ready = [node for node, count in enumerate(pending) if count == 0]
+    while ready:
+        node = ready.pop()
+        for child in structure.children_of(node).tolist():
+            layer_of[child] = max(layer_of[child], layer_of[node] + 1)
+            pending[child] -= 1
+            if pending[child] == 0:
+                ready.append(child)
+    # every node that was placed has no pending parents left
+    depth = max(
+        (layer for layer, count in zip(layer_of, pending) if count == 0), default=-1
+    )
+    depth += 1
+    if any(pending):
+        for node, count in enumerate(pending):
+            if count > 0:
+                layer_of[node] = depth
+        depth += 1
+    layers: list[list[int]] = [[] for _ in range(depth)]
+    for node in sorted(range(structure.num_nodes), key=structure.ids.__getitem__):
+        layers[layer_of[node]].append(node)
+    return layers
+
+
+def _barycenter(
+    node: int, neighbours: list[int], position: list[int]
+) -> tuple[float, int]:
+    """
+    Sort key placing a node at the mean position of its neighbours, or where it is if it has none.
+    """
+    if not neighbours:
+        return (position[node], position[node])
+    return (
+        sum(position[other] for other in neighbours) / len(neighbours),
+        position[node],
+    )
+
+
+def order_layers(
+    structure: FlowStructure, layers: list[list[int]], sweeps: int = ORDERING_SWEEPS
+) -> list[list[int]]:
+    """
+    Reorder the nodes of each layer by the mean position of their neighbours on the layers already placed.
+
+    Args:
+        structure (FlowStructure): The flow graph.
+        layers (list[list[int]]): The layers from assign_layers.
+        sweeps (int): The number of passes, alternating top-down and bottom-up.
+
+    Returns:
+        list[list[int]]: The reordered layers.
+    """
+    layers = [list(layer) for layer in layers]
+    position = [0] * structure.num_nodes
+    for layer in layers:
+        for index, node in enumerate(layer):
+            position[node] = index
+    parents = [
+        structure.parents_of(node).tolist() for node in range(structure.num_nodes)
+    ]
+    children = [
+        structure.children_of(node).tolist() for node in range(structure.num_nodes)
+    ]
+    for sweep in range(sweeps):
+        downward = sweep % 2 == 0
+        neighbours = parents if downward else children
+        for layer in layers if downward else reversed(layers):
+            layer.sort(key=lambda node: _barycenter(node, neighbours[node], position))
+            for index, node in enumerate(layer):
+                position[node] = index
+    return layers
+
+
+def layered_positions(
+    structure: FlowStructure,
+    layer_spacing: int = LAYER_SPACING,
+    node_spacing: int = NODE_SPACING,
+) -> np.ndarray:
+    """
+    Compute deterministic, non-negative integer positions with the flow running from top to bottom.
+
+    Args:
+        structure (FlowStructure): The flow graph.
+        layer_spacing (int): The vertical distance between layers.
+        node_spacing (int): The horizontal distance between neighbours on a layer.
+
+    Returns:
+        np.ndarray: The (x, y) position of every node, one row per node.
+    """
+    layers = order_layers(structure, assign_layers(structure))
+    width = max((len(layer) for layer in layers), default=0)
+    positions = np.zeros((structure.num_nodes, 2), dtype=np.int64)
+    for depth, layer in enumerate(layers):
+        # center each layer under the widest one
+        offset = (width - len(layer)) * node_spacing // 2
+        for index, node in enumerate(layer):
+            positions[node] = (offset + index * node_spacing, depth * layer_spacing)
+    return positions
+
+
+def stable_positions(
+    structure: FlowStructure,
+    previous: dict[str, tuple[int, int]],
+    layer_spacing: int = LAYER_SPACING,
+    node_spacing: int = NODE_SPACING,
+) -> np.ndarray:
+    """
+    Lay out an edited flow keeping the nodes it shares with the previous version where they were.
+
+    Without a node in common this is layered_positions. Otherwise every new node goes on the row of its layer,
+    under the mean x of its parents already placed (or above that of its children), moved right to the first
+    free spot, so an analyst re-exporting a flow does not see the nodes they already arranged jump around.
+
+    Args:
+        structure (FlowStructure): The edited flow graph.
+        previous (dict[str, tuple[int, int]]): The position of every node of the previous version by id.
+        layer_spacing (int): The vertical distance between layers.
+        node_spacing (int): The horizontal distance between neighbours on a row.
+
+    Returns:
+        np.ndarray: The (x, y) position of every node, one row per node.
+    """
+    kept = [node for node, node_id in enumerate(structure.ids) if node_id in previous]
+    if not kept:
+        return layered_positions(structure, layer_spacing, node_spacing)
+    positions = np.zeros((structure.num_nodes, 2), dtype=np.int64)
+    placed = [False] * structure.num_nodes
+    occupied: set[tuple[int, int]] = set()
+    for node in kept:
+        positions[node] = previous[structure.ids[node]]
+        placed[node] = True
+        occupied.add(previous[structure.ids[node]])
+    for depth, layer in enumerate(order_layers(structure, assign_layers(structure))):
+        y = depth * layer_spacing
+        for index, node in enumerate(layer):
+            if placed[node]:
+                continue
+            neighbours = [
+                other
+                for other in structure.parents_of(node).tolist()
+                or structure.children_of(node).tolist()
+                if placed[other]
+            ]
+            if neighbours:
+                mean = sum(int(positions[other][0]) for other in neighbours)
+                x = round(mean / len(neighbours) / node_spacing) * node_spacing
+            else:
+                x = index * node_spacing
+            while (x, y) in occupied:
+                x += node_spacing
+            positions[node] = (x, y)
+            placed[node] = True
+            occupied.add((x, y))
+    return positions
+
+
+def layered_layout(
+    graph: nx.DiGraph,
+    layer_spacing: int = LAYER_SPACING,
+    node_spacing: int = NODE_SPACING,
+) -> dict[Hashable, tuple[int, int]]:
+    """
+    Compute the layered_positions of a NetworkX graph, ties being broken by the string form of the nodes.
+
+    Args:
+        graph (nx.DiGraph): The flow graph.
+        layer_spacing (int): The vertical distance between layers.
+        node_spacing (int): The horizontal distance between neighbours on a layer.
+
+    Returns:
+        dict[Hashable, tuple[int, int]]: The (x, y) position of every node.
+    """
+    positions = layered_positions(
+        FlowStructure.from_networkx(graph), layer_spacing, node_spacing
+    )
+    return {node: (int(x), int(y)) for node, (x, y) in zip(graph.nodes, positions)}
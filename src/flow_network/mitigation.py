@@ -0,0 +1,159 @@
+"""
+Rank ATT&CK mitigations by how much they lower the probability of an attack flow's outcome.
+
+A mitigation is modelled by dampening the probability of every action whose technique it mitigates. Trying
+each mitigation by rebuilding and re-querying the network would cost a full inference per mitigation, so the
+sweep compiles the network once and asks inference.CompiledNetwork.probabilities for the outcome with the
+dampened CPDs swapped in. Only the junction tree messages between the dampened actions and the root are
+recomputed for each mitigation, so ranking every applicable mitigation costs about as much as a few queries.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, cast
+
+import numpy as np
+
+from flow_network.assembly import FlowNetwork, network_tables
+from flow_network.inference import CompiledNetwork
+from stix_probability.weights import Mitigation, ProbabilityDatabase
+
+if TYPE_CHECKING:
+    from pgmpy.models import BayesianNetwork
+
+# the fraction of a technique's probability a mitigation removes, ATT&CK has no efficacy data
+DEFAULT_EFFICACY = 0.5
+
+
+@dataclass
+class MitigationImpact:
+    """
+    The effect of one mitigation on the terminal nodes of a flow.
+
+    Attributes:
+        mitigation (Mitigation): The mitigation.
+        actions (list[str]): The action nodes whose technique it mitigates.
+        probabilities (dict[str, float]): P(terminal node) with the mitigation in place.
+        drops (dict[str, float]): How much the mitigation lowers P(terminal node).
+        drop (float): The sum of drops, which mitigations are ranked by.
+    """
+
+    mitigation: Mitigation
+    actions: list[str]
+    probabilities: dict[str, float]
+    drops: dict[str, float]
+    drop: float
+
+
+def actions_by_technique(
+    model: BayesianNetwork | FlowNetwork, probability_db: ProbabilityDatabase
+) -> dict[str, list[str]]:
+    """
+    Group the action nodes of a flow network by the technique they use.
+
+    Techniques are looked up like their probabilities are, see ProbabilityDatabase.resolve_technique, so an
+    action given only an ATT&CK ID, the STIX id of another release or a sub-technique that rolls up is grouped
+    under the attack pattern the mitigations of the database refer to.
+
+    Args:
+        model (BayesianNetwork | FlowNetwork): The network built by assembly.assemble_network,
+            compact.to_bayesian_network or flow_nx_to_pgmpy.
+        probability_db (ProbabilityDatabase): The database the techniques are looked up in.
+
+    Returns:
+        dict[str, list[str]]: The action nodes of each attack pattern STIX id.
+    """
+    techniques: dict[tuple[str, str | None], list[str]]
+    if isinstance(model, FlowNetwork):
+        techniques = model.actions_by_technique()
+    elif "actions_by_technique" in model.graph:
+        techniques = cast(
+            "dict[tuple[str, str | None], list[str]]",
+            model.graph["actions_by_technique"],
+        )
+    else:
+        techniques = {}
+        for node, node_data in model.nodes(data=True):
+            flow_obj = node_data.get("object")
+            if flow_obj is None or flow_obj.type != "attack-action":
+                continue
+            attack_pattern = flow_obj.get_attack_pattern_id()
+            technique_id = flow_obj.get_technique_id()
+            if attack_pattern is not None or technique_id is not None:
+                techniques.setdefault(
+                    (attack_pattern or technique_id, technique_id), []
+                ).append(node)
+    actions: dict[str, list[str]] = {}
+    for (technique_ref, technique_id), nodes in techniques.items():
+        technique, _ = probability_db.resolve_technique(technique_ref, technique_id)
+        # a technique without a probability can still be mitigated
+        stix_id = technique_ref if technique is None else technique.stix_id
+        actions.setdefault(stix_id, []).extend(nodes)
+    return actions
+
+
+def rank_mitigations(
+    model: BayesianNetwork | FlowNetwork,
+    probability_db: ProbabilityDatabase,
+    efficacy: float = DEFAULT_EFFICACY,
+    terminals: list[str] | None = None,
+    compiled: CompiledNetwork | None = None,
+) -> tuple[dict[str, float], list[MitigationImpact]]:
+    """
+    Compute how much each applicable mitigation lowers the probability of the terminal nodes of a flow.
+
+    Args:
+        model (BayesianNetwork | FlowNetwork): The network built by assembly.assemble_network or flow_nx_to_pgmpy.
+        probability_db (ProbabilityDatabase): The database holding the ATT&CK mitigations.
+        efficacy (float): The fraction of P(action) a mitigation removes from the actions it covers.
+        terminals (list[str] | None): The nodes whose probability matters, None for the nodes without children.
+        compiled (CompiledNetwork | None): The compiled network, compiled here if not given.
+
+    Returns:
+        tuple[dict[str, float], list[MitigationImpact]]: P(terminal node) without mitigations, and the impact of
+        every mitigation covering at least one action of the flow, largest drop first.
+
+    Raises:
+        ValueError: If efficacy is not between 0 and 1.
+    """
+    if not 0 <= efficacy <= 1:
+        raise ValueError("The mitigation efficacy must be between 0 and 1")
+    tables = network_tables(model)
+    if terminals is None:
+        terminals = tables.terminal_nodes()
+    compiled = compiled or CompiledNetwork(model)
+    evidence_sets = [{node: 1} for node in terminals]
+    baseline = dict(zip(terminals, compiled.probabilities(evidence_sets)))
+    actions = actions_by_technique(model, probability_db)
+    dampened_cpds: dict[str, np.ndarray] = {}
+    impacts = []
+    for mitigation in probability_db.mitigations.values():
+        covered = sorted(
+            {
+                node
+                for technique in mitigation.techniques
+                for node in actions.get(technique, [])
+            }
+        )
+        if not covered:
+            continue
+        cpds = {}
+        for node in covered:
+            if node not in dampened_cpds:
+                values = tables.values[tables.index[node]].copy()
+                values[1] *= 1 - efficacy
+                values[0] = 1 - values[1]
+                dampened_cpds[node] = values
+            cpds[node] = dampened_cpds[node]
+        probabilities = dict(
+            zip(terminals, compiled.probabilities(evidence_sets, cpds))
+        )
+        drops = {node: baseline[node] - probabilities[node] for node in terminals}
+        impacts.append(
+            MitigationImpact(
+                mitigation, covered, probabilities, drops, sum(drops.values())
+            )
+        )
+    impacts.sort(key=lambda impact: (-impact.drop, impact.mitigation.mitigation_id))
+    return baseline, impacts
@@ -0,0 +1,188 @@
+"""
+Exact prior marginals of attack-flow networks without general inference.
+
+The CPDs built by flow_nx_to_pgmpy are very regular: actions and conditions have the same distribution
+whatever their parents are, and operators are deterministic AND/OR gates. An action or condition is therefore
+independent of everything upstream, and only the edges into gates carry any dependency. When those edges form
+a polytree (no two gate inputs share an ancestor), the inputs of every gate are independent and
+
+    P(AND) = prod P(parent)        P(OR) = 1 - prod (1 - P(parent))
+
+is exact. PolytreeEvaluator checks this once per network and then computes every marginal with a handful of
+vectorized NumPy operations per level of nested gates. Networks with shared ancestors, other kinds of CPDs,
+or queries with evidence need a general engine such as inference.CompiledNetwork.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from flow_network.assembly import network_tables
+
+if TYPE_CHECKING:
+    from pgmpy.models import BayesianNetwork
+
+    from flow_network.assembly import FlowNetwork
+
+CONSTANT = 0
+AND = 1
+OR = 2
+
+
+def cpd_kind(values: np.ndarray) -> int | None:
+    """
+    Recognise a binary CPD whose columns follow pgmpy's ordering.
+
+    Args:
+        values (np.ndarray): The CPD values, shaped (2, number of parent configurations).
+
+    Returns:
+        int | None: CONSTANT, AND or OR, or None for any other table.
+    """
+    if np.allclose(values, values[:, :1]):
+        return CONSTANT
+    true_row = values[1]
+    if np.array_equal(true_row, np.arange(true_row.size) == true_row.size - 1):
+        return AND
+    if np.array_equal(true_row, np.arange(true_row.size) != 0):
+        return OR
+    return None
+
+
+class PolytreeEvaluator:
+    """
+    All prior marginals of an attack-flow network whose gates form a polytree.
+
+    Build one with PolytreeEvaluator.compile, which returns None when the network does not qualify.
+
+    Attributes:
+        variables (list[str]): The nodes of the network.
+    """
+
+    def __init__(
+        self,
+        variables: list[str],
+        constants: np.ndarray,
+        levels: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]],
+    ):
+        """
+        Args:
+            variables (list[str]): The nodes of the network.
+            constants (np.ndarray): P(node is true) for every node whose CPD ignores its parents, NaN for gates.
+            levels (list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]): For each level of nested gates,
+                the gates, the offset of each gate's inputs, the flattened inputs and whether each gate is an AND.
+        """
+        self.variables = variables
+        self._index = {name: position for position, name in enumerate(variables)}
+        self._constants = constants
+        self._levels = levels
+
+    @classmethod
+    def compile(
+        cls, model: BayesianNetwork | FlowNetwork
+    ) -> "PolytreeEvaluator | None":
+        """
+        Compile the evaluator of a network if its marginals can be computed gate by gate.
+
+        Args:
+            model (BayesianNetwork | FlowNetwork): The network, every node must have a binary CPD.
+
+        Returns:
+            PolytreeEvaluator | None: The evaluator, or None if a CPD is not constant, AND or OR, or if two
+            inputs of a gate share an ancestor.
+        """
+        tables = network_tables(model)
+        variables = tables.variables
+        constants = np.full(len(variables), np.nan)
+        gate_kind: dict[int, int] = {}
+        gate_parents: dict[int, list[int]] = {}
+        # union-find over the edges into gates, any edge closing a loop means shared ancestors
+        component = list(range(len(variables)))
+
+        def find(var: int) -> int:
+            while component[var] != var:
+                component[var] = component[component[var]]
+                var = component[var]
+            return var
+
+        for var, scope in enumerate(tables.scopes):
+            if any(tables.cardinality[other] != 2 for other in scope):
+                return None
+            values = tables.values[var]
+            kind = cpd_kind(values)
+            if kind is None:
+                return None
+            if kind == CONSTANT:
+                constants[var] = values[1, 0]
+                continue
+            gate_kind[var] = kind
+            gate_parents[var] = scope[1:]
+            for parent in gate_parents[var]:
+                root, parent_root = find(var), find(parent)
+                if root == parent_root:
+                    return None
+                component[root] = parent_root
+
+        # a gate is evaluated one level after the deepest gate among its inputs
+        depth: dict[int, int] = {}
+        by_level: dict[int, list[int]] = {}
+        for var in tables.order:
+            if var not in gate_kind:
+                continue
+            depth[var] = 1 + max(depth.get(parent, 0) for parent in gate_parents[var])
+            by_level.setdefault(depth[var], []).append(var)
+        levels = []
+        for level in sorted(by_level):
+            gates = by_level[level]
+            sizes = [len(gate_parents[gate]) for gate in gates]
+            levels.append(
+                (
+                    np.array(gates, dtype=np.intp),
+                    np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp),
+                    np.array(
+                        [parent for gate in gates for parent in gate_parents[gate]],
+                        dtype=np.intp,
+                    ),
+                    np.array([gate_kind[gate] == AND for gate in gates]),
+                )
+            )
+        return cls(variables, constants, levels)
+
+    def probabilities(self) -> np.ndarray:
+        """
+        Compute P(node is true) for every node.
+
+        Returns:
+            np.ndarray: The probabilities, in the order of variables.
+        """
+        probabilities = self._constants.copy()
+        for gates, offsets, parents, is_and in self._levels:
+            inputs = probabilities[parents]
+            all_true = np.multiply.reduceat(inputs, offsets)
+            any_true = 1 - np.multiply.reduceat(1 - inputs, offsets)
+            probabilities[gates] = np.where(is_and, all_true, any_true)
+        return probabilities
+
+    def marginals(self, variables: list[str] | None = None) -> dict[str, np.ndarray]:
+        """
+        Compute the distribution of each variable, in the same form as inference.CompiledNetwork.marginals.
+
+        Args:
+            variables (list[str] | None): The variables to report, None for every variable.
+
+        Returns:
+            dict[str, np.ndarray]: The [P(false), P(true)] distribution of each variable.
+
+        Raises:
+            ValueError: If a variable is unknown.
+        """
+        probabilities = self.probabilities()
+        result = {}
+        for name in self.variables if variables is None else variables:
+            if name not in self._index:
+                raise ValueError(f"Unknown query variable {name}")
+            probability = probabilities[self._index[name]]
+            result[name] = np.array([1 - probability, probability])
+        return result
@@ -0,0 +1,358 @@
+"""
+Approximate inference on attack-flow networks by batched forward sampling.
+
+Exact inference gets infeasible on large merged flows with many loops, because the junction tree cliques grow
+exponentially. ForwardSampler draws whole batches of samples at once: it visits the nodes in topological order
+and fills one row of a boolean (node x sample) array per node with a single vector operation, so the cost is
+per node and batch, not per sample. AND/OR gates are evaluated with logical reductions over their parents'
+rows and other tables by looking up each sample's parent configuration.
+
+Evidence is handled by likelihood weighting: observed nodes are clamped and every sample is weighted by the
+probability of the observations given its parents. Marginals are reported with Wilson score intervals over the
+effective sample size, and sampling stops as soon as every interval is narrow enough.
+
+The batches, their sizes and their seeds follow a fixed schedule that worker processes only share out, so a
+seeded estimate is the same whatever the number of workers.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from statistics import NormalDist
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+import numpy as np
+
+from flow_network.assembly import network_tables
+from flow_network.polytree import AND, CONSTANT, OR, cpd_kind
+
+if TYPE_CHECKING:
+    from pgmpy.models import BayesianNetwork
+
+    from flow_network.assembly import FlowNetwork
+
+TABLE = 3
+# how many node x sample cells one batch may use, about 16 MB of booleans
+_BATCH_CELLS = 1 << 24
+# the precision is checked after 1, 2, 4, ... batches, at most this many apart
+_MAX_ROUND_BATCHES = 64
+
+
+@dataclass
+class MarginalEstimate:
+    """
+    A sampled estimate of P(node is true).
+
+    Attributes:
+        probability (float): The estimate.
+        lower (float): The lower end of the confidence interval.
+        upper (float): The upper end of the confidence interval.
+    """
+
+    probability: float
+    lower: float
+    upper: float
+
+
+@dataclass
+class SamplingResult:
+    """
+    The outcome of a sampling run.
+
+    Attributes:
+        estimates (dict[str, MarginalEstimate]): The estimate of each queried node.
+        samples (int): The number of samples drawn.
+        effective_samples (float): The number of unweighted samples the weighted ones are worth.
+        probability_of_evidence (float): The estimate of P(evidence), 1 without evidence.
+        converged (bool): False if max_samples was reached before the target precision.
+    """
+
+    estimates: dict[str, MarginalEstimate]
+    samples: int
+    effective_samples: float
+    probability_of_evidence: float
+    converged: bool
+
+
+def wilson_interval(
+    probability: np.ndarray, samples: float, z: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute Wilson score intervals of proportions, which stay sensible for proportions near 0 and 1.
+
+    Args:
+        probability (np.ndarray): The observed proportions.
+        samples (float): The (effective) number of samples.
+        z (float): The standard normal quantile of the confidence level.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The lower and upper end of each interval.
+    """
+    probability = np.asarray(probability, dtype=np.float64)
+    if samples <= 0:
+        return np.zeros_like(probability), np.ones_like(probability)
+    denominator = 1 + z * z / samples
+    center = (probability + z * z / (2 * samples)) / denominator
+    half_width = (
+        z
+        / denominator
+        * np.sqrt(
+            probability * (1 - probability) / samples + z * z / (4 * samples * samples)
+        )
+    )
+    return np.maximum(0.0, center - half_width), np.minimum(1.0, center + half_width)
+
+
+class ForwardSampler:
+    """
+    A binary Bayesian network compiled for batched forward sampling.
+
+    Attributes:
+        variables (list[str]): The nodes of the network.
+    """
+
+    def __init__(self, model: BayesianNetwork | FlowNetwork):
+        """
+        Args:
+            model (BayesianNetwork | FlowNetwork): The network, every node must have a binary CPD.
+
+        Raises:
+            ValueError: If a node is not binary.
+        """
+        tables = network_tables(model)
+        self.variables = tables.variables
+        self._index = tables.index
+        # (variable, kind, parents, P(true) for each parent configuration) in topological order
+        self._nodes: list[tuple[int, int, np.ndarray, np.ndarray]] = []
+        for var in tables.order:
+            scope = tables.scopes[var]
+            if any(tables.cardinality[other] != 2 for other in scope):
+                raise ValueError(
+                    f"Only binary nodes can be sampled, {self.variables[var]} is not"
+                )
+            values = tables.values[var]
+            kind = cpd_kind(values)
+            self._nodes.append(
+                (
+                    var,
+                    TABLE if kind is None else kind,
+                    np.array(scope[1:], dtype=np.intp),
+                    np.ascontiguousarray(values[1]),
+                )
+            )
+
+    def sample(
+        self,
+        size: int,
+        rng: np.random.Generator,
+        evidence: Mapping[int, int] | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Draw one batch of samples, clamping and weighting the evidence.
+
+        Args:
+            size (int): The number of samples.
+            rng (np.random.Generator): The random number generator.
+            evidence (Mapping[int, int] | None): The observed state of nodes, by variable index.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The (node x sample) boolean states and the weight of each sample.
+        """
+        evidence = evidence or {}
+        states = np.empty((len(self.variables), size), dtype=bool)
+        weights = np.ones(size)
+        for var, kind, parents, true_table in self._nodes:
+            deterministic = kind in (AND, OR)
+            if kind == AND:
+                value = np.logical_and.reduce(states[parents], axis=0)
+            elif kind == OR:
+                value = np.logical_or.reduce(states[parents], axis=0)
+            elif kind == CONSTANT:
+                p_true = true_table[0]
+            else:
+                # pgmpy orders the columns with the first parent as the most significant bit
+                configuration = np.zeros(size, dtype=np.intp)
+                for parent in parents:
+                    configuration <<= 1
+                    configuration |= states[parent]
+                p_true = true_table[configuration]
+            if var in evidence:
+                observed = bool(evidence[var])
+                if deterministic:
+                    weights *= value == observed
+                else:
+                    weights *= p_true if observed else 1 - p_true
+                states[var] = observed
+            elif deterministic:
+                states[var] = value
+            else:
+                states[var] = rng.random(size) < p_true
+        return states, weights
+
+    def _batch_totals(
+        self,
+        size: int,
+        seed: np.random.SeedSequence,
+        evidence: Mapping[int, int],
+        query: np.ndarray,
+    ) -> tuple[float, float, np.ndarray]:
+        """
+        Draw a batch and reduce it to the sums the estimates need.
+
+        Returns:
+            tuple[float, float, np.ndarray]: The sum of the weights, of the squared weights, and the weighted
+            count of true states of each queried node.
+        """
+        states, weights = self.sample(size, np.random.default_rng(seed), evidence)
+        return (
+            float(weights.sum()),
+            float(weights @ weights),
+            states[query].astype(np.float64) @ weights,
+        )
+
+    def estimate(
+        self,
+        variables: list[str] | None = None,
+        evidence: Mapping[str, int] | None = None,
+        precision: float = 0.005,
+        confidence: float = 0.95,
+        max_samples: int = 10_000_000,
+        batch_size: int | None = None,
+        seed: int | None = None,
+        jobs: int = 1,
+    ) -> SamplingResult:
+        """
+        Estimate marginals by sampling batches until every confidence interval is narrow enough.
+
+        Args:
+            variables (list[str] | None): The nodes to estimate, None for every node.
+            evidence (Mapping[str, int] | None): The observed state of nodes.
+            precision (float): Stop once every interval is at most this far from its estimate on either side.
+            confidence (float): The confidence level of the intervals.
+            max_samples (int): Stop after this many samples even if the precision was not reached.
+            batch_size (int | None): Samples per batch, by default as many as fit in about 16 MB.
+            seed (int | None): Seed for reproducible estimates.
+            jobs (int): Worker processes drawing batches in parallel, 1 samples in this process. The estimates do
+                not depend on it.
+
+        Returns:
+            SamplingResult: The estimates.
+
+        Raises:
+            ValueError: If a node is unknown, or no sample was compatible with the evidence.
+        """
+        names = self.variables if variables is None else list(variables)
+        for name in [*names, *(evidence or {})]:
+            if name not in self._index:
+                raise ValueError(f"Unknown variable {name}")
+        evidence_indices = {
+            self._index[name]: int(state) for name, state in (evidence or {}).items()
+        }
+        query = np.array([self._index[name] for name in names], dtype=np.intp)
+        if batch_size is None:
+            batch_size = max(1000, _BATCH_CELLS // max(1, len(self.variables)))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        seeds = np.random.SeedSequence(seed)
+        total_weight = total_square_weight = 0.0
+        weighted_true = np.zeros(len(query))
+        samples = 0
+        converged = False
+        executor = (
+            ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_sampling_worker, initargs=(self,)
+            )
+            if jobs > 1
+            else None
+        )
+        round_batches = 1
+        try:
+            while samples < max_samples and not converged:
+                # rounds double in batches so large flows keep the workers busy while small ones stop early,
+                # and the precision is checked between rounds
+                sizes: list[int] = []
+                for _ in range(round_batches):
+                    size = min(batch_size, max_samples - samples - sum(sizes))
+                    if size > 0:
+                        sizes.append(size)
+                round_batches = min(2 * round_batches, _MAX_ROUND_BATCHES)
+                batch_seeds = seeds.spawn(len(sizes))
+                totals: Iterable[tuple[float, float, np.ndarray]]
+                if executor is None:
+                    totals = [
+                        self._batch_totals(size, batch_seed, evidence_indices, query)
+                        for size, batch_seed in zip(sizes, batch_seeds)
+                    ]
+                else:
+                    totals = executor.map(
+                        _sample_in_worker,
+                        sizes,
+                        batch_seeds,
+                        repeat(evidence_indices),
+                        repeat(query),
+                    )
+                for weight, square_weight, true_weight in totals:
+                    total_weight += weight
+                    total_square_weight += square_weight
+                    weighted_true += true_weight
+                samples += sum(sizes)
+                if total_weight > 0:
+                    lower, upper = wilson_interval(
+                        weighted_true / total_weight,
+                        total_weight * total_weight / total_square_weight,
+                        z,
+                    )
+                    probabilities = weighted_true / total_weight
+                    converged = bool(
+                        np.all(probabilities - lower <= precision)
+                        and np.all(upper - probabilities <= precision)
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if total_weight <= 0:
+            raise ValueError("No sample was compatible with the evidence")
+        probabilities = weighted_true / total_weight
+        effective_samples = total_weight * total_weight / total_square_weight
+        lower, upper = wilson_interval(probabilities, effective_samples, z)
+        estimates = {
+            name: MarginalEstimate(
+                float(probabilities[position]),
+                float(lower[position]),
+                float(upper[position]),
+            )
+            for position, name in enumerate(names)
+        }
+        return SamplingResult(
+            estimates,
+            samples,
+            effective_samples,
+            total_weight / samples if evidence_indices else 1.0,
+            converged,
+        )
+
+
+# the sampler of a worker process, set once by _init_sampling_worker
+_worker_sampler: ForwardSampler | None = None
+
+
+def _init_sampling_worker(sampler: ForwardSampler) -> None:
+    """
+    Store the sampler in a worker so it is only sent once per process.
+    """
+    global _worker_sampler
+    _worker_sampler = sampler
+
+
+def _sample_in_worker(
+    size: int,
+    seed: np.random.SeedSequence,
+    evidence: Mapping[int, int],
+    query: np.ndarray,
+) -> tuple[float, float, np.ndarray]:
+    """
+    Draw one batch in a worker process, see ForwardSampler._batch_totals.
+    """
+    assert _worker_sampler is not None
+    return _worker_sampler._batch_totals(size, seed, evidence, query)
@@ -0,0 +1,556 @@
+"""
+Long-running local scoring service that keeps the ATT&CK probability database warm.
+
+Every run of main.py loads the ATT&CK probabilities (from the cache at best) and imports the libraries it needs
+before converting a single flow. The service pays for that once: it listens on localhost for HTTP/JSON requests
+carrying ATT&CK Flow bundles and answers with the Hugin NET text and/or the posterior probabilities of every
+flow in them. Conversions are CPU bound, so they run in a pool of worker processes that received the
+probability database when they started. At most `jobs` conversions run at a time and at most `max_pending`
+more wait for a worker; the requests beyond that are turned away with 503 so that a burst cannot pile up
+unbounded work, and the latency of recent requests is reported on GET /stats.
+
+Endpoints:
+    POST /score     {"bundle": {...}, "net": true, "posteriors": true, "variables": [...], "evidence": {...}},
+                    or just the bundle, answered with {"flows": [...]}, one result per attack flow
+    GET  /stats     request counts, queue state and latency percentiles per endpoint
+    GET  /health    "starting" until the workers are loaded then "ok", and the size of the probability database
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any
+
+import numpy as np
+
+import main
+from flow_network import assembly, compact
+from hugin_net import writer as hugin_writer
+from stix_probability.weights import ProbabilityDatabase
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+# requests waiting for a worker beyond the ones being converted, before new ones get 503
+DEFAULT_MAX_PENDING = 16
+
+# flow exports are a few MiB at most, anything much larger is refused before it is read
+MAX_BODY_BYTES = 64 << 20
+
+# the number of recent requests per endpoint the latency percentiles are computed over
+LATENCY_WINDOW = 1000
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+@dataclass
+class ScoreRequest:
+    """
+    A request to score the attack flows of a bundle.
+
+    Attributes:
+        bundle (dict[str, Any]): The decoded ATT&CK Flow export.
+        net (bool): Whether to return the Hugin NET text of every flow.
+        posteriors (bool): Whether to return posterior probabilities, see main.query_flow_networks.
+        variables (list[str] | None): The nodes to report, None for the terminal nodes of each flow.
+        evidence (dict[str, int]): The observed state of nodes.
+    """
+
+    bundle: dict[str, Any]
+    net: bool = True
+    posteriors: bool = True
+    variables: list[str] | None = None
+    evidence: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, payload: Any) -> ScoreRequest:
+        """
+        Validate the decoded body of a POST /score request.
+
+        A bare bundle asks for both the NET text and the posteriors of the terminal nodes.
+
+        Args:
+            payload (Any): The decoded body.
+
+        Returns:
+            ScoreRequest: The request.
+
+        Raises:
+            ValueError: If the body is malformed.
+        """
+        if isinstance(payload, dict) and payload.get("type") == "bundle":
+            return cls(payload)
+        if not isinstance(payload, dict) or not isinstance(payload.get("bundle"), dict):
+            raise ValueError("Expected a bundle, or an object with a bundle")
+        net = payload.get("net", True)
+        posteriors = payload.get("posteriors", True)
+        if not isinstance(net, bool) or not isinstance(posteriors, bool):
+            raise ValueError("net and posteriors must be true or false")
+        if not net and not posteriors:
+            raise ValueError("Nothing to compute, net and posteriors are both false")
+        variables = payload.get("variables")
+        if variables is not None and (
+            not isinstance(variables, list)
+            or not all(isinstance(node, str) for node in variables)
+        ):
+            raise ValueError("variables must be a list of node ids")
+        evidence = payload.get("evidence", {})
+        if not isinstance(evidence, dict) or not all(
+            state in (0, 1) for state in evidence.values()
+        ):
+            raise ValueError("evidence must map node ids to 0 or 1")
+        return cls(
+            payload["bundle"],
+            net,
+            posteriors,
+            variables or None,
+            {node: int(state) for node, state in evidence.items()},
+        )
+
+
+def score_request(
+    request: ScoreRequest,
+    probability_db: ProbabilityDatabase,
+    options: main.ConversionOptions,
+    query_options: main.QueryOptions,
+) -> list[dict[str, Any]]:
+    """
+    Convert the attack flows of a bundle and compute what the request asks for.
+
+    Args:
+        request (ScoreRequest): The request.
+        probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        options (main.ConversionOptions): How to build the networks.
+        query_options (main.QueryOptions): How to compute the posteriors.
+
+    Returns:
+        list[dict[str, Any]]: One JSON-ready result per attack flow, with its "net" text and the fields of
+        main.query_flow_networks as asked.
+
+    Raises:
+        ValueError: If the bundle holds no attack flow, a flow graph has a cycle, or a requested node is in
+            none of the flows.
+    """
+    compact_flows = main.compact_flows_from_bundle(
+        main.parse_flow_data(request.bundle, options.strict), options
+    )
+    probabilities = [
+        compact.node_probabilities(compact_flow, probability_db)
+        for _, compact_flow in compact_flows
+    ]
+    results: list[dict[str, Any]] = [
+        {"flow": attack_flow.id, "name": attack_flow.get("name", "")}
+        for attack_flow, _ in compact_flows
+    ]
+    if request.net:
+        for result, (_, compact_flow), flow_probabilities in zip(
+            results, compact_flows, probabilities
+        ):
+            # UnBBayes cannot load a cyclic network
+            assembly.topological_order(compact_flow)
+            buffer = io.StringIO()
+            hugin_writer.write_compact_net(compact_flow, flow_probabilities, buffer)
+            result["net"] = buffer.getvalue()
+    if request.posteriors:
+        networks = [
+            (attack_flow, assembly.assemble_network(compact_flow, flow_probabilities))
+            for (attack_flow, compact_flow), flow_probabilities in zip(
+                compact_flows, probabilities
+            )
+        ]
+        posteriors = main.query_flow_networks(
+            networks, request.variables, request.evidence, query_options
+        )
+        for result, posterior in zip(results, posteriors):
+            result.update(posterior)
+    return results
+
+
+# the state of a worker process, set once by _init_worker
+_worker_probability_db: ProbabilityDatabase | None = None
+_worker_options: main.ConversionOptions | None = None
+_worker_query_options: main.QueryOptions | None = None
+
+
+def _init_worker(
+    probability_db: ProbabilityDatabase,
+    options: main.ConversionOptions,
+    query_options: main.QueryOptions,
+) -> None:
+    """
+    Store the probability database in a worker so it is only sent once per process, and import pgmpy up
+    front so that the first request asking for posteriors does not pay for it.
+    """
+    global _worker_probability_db, _worker_options, _worker_query_options
+    _worker_probability_db = probability_db
+    _worker_options = options
+    _worker_query_options = query_options
+    import pgmpy.models  # noqa: F401
+
+
+def _score_in_worker(body: bytes) -> list[dict[str, Any]]:
+    """
+    Decode, validate and score one request in a worker process, so the event loop never parses a bundle.
+    """
+    assert _worker_probability_db is not None
+    assert _worker_options is not None and _worker_query_options is not None
+    request = ScoreRequest.from_json(json.loads(body))
+    return score_request(
+        request, _worker_probability_db, _worker_options, _worker_query_options
+    )
+
+
+class LatencyStats:
+    """
+    Request counts and the latency of the most recent requests, per endpoint.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        """
+        Args:
+            window (int): The number of recent requests per endpoint the percentiles are computed over.
+        """
+        self._window = window
+        self._latencies: dict[str, deque[float]] = {}
+        self._requests: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        self.started = time.monotonic()
+
+    def record(self, endpoint: str, status: int, seconds: float) -> None:
+        """
+        Record one answered request.
+
+        Args:
+            endpoint (str): The path of the request.
+            status (int): The HTTP status it was answered with.
+            seconds (float): The time from reading the request to having the answer.
+        """
+        self._latencies.setdefault(endpoint, deque(maxlen=self._window)).append(seconds)
+        self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+        if status >= 400:
+            self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Summarize the requests seen so far.
+
+        Returns:
+            dict[str, Any]: The uptime, and the request and error counts and latency percentiles in milliseconds
+            of every endpoint.
+        """
+        endpoints = {}
+        for endpoint, latencies in sorted(self._latencies.items()):
+            milliseconds = np.array(latencies) * 1000
+            p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99])
+            endpoints[endpoint] = {
+                "requests": self._requests[endpoint],
+                "errors": self._errors.get(endpoint, 0),
+                "latency_ms": {
+                    "window": len(latencies),
+                    "mean": float(milliseconds.mean()),
+                    "p50": float(p50),
+                    "p90": float(p90),
+                    "p99": float(p99),
+                    "max": float(milliseconds.max()),
+                },
+            }
+        return {
+            "uptime_s": time.monotonic() - self.started,
+            "endpoints": endpoints,
+        }
+
+
+class ScoringService:
+    """
+    The endpoints of the service, independent of the HTTP layer.
+
+    Attributes:
+        probability_db (ProbabilityDatabase): The probability database the workers use.
+        jobs (int): The number of worker processes, which is also the number of concurrent conversions.
+        max_pending (int): How many requests may wait for a worker before new ones are refused.
+        stats (LatencyStats): The latency of the answered requests.
+    """
+
+    def __init__(
+        self,
+        probability_db: ProbabilityDatabase,
+        options: main.ConversionOptions | None = None,
+        query_options: main.QueryOptions | None = None,
+        jobs: int = 1,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        """
+        Start the worker processes.
+
+        Args:
+            probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+            options (main.ConversionOptions | None): How to build the networks, defaults to ConversionOptions().
+            query_options (main.QueryOptions | None): How to compute posteriors, defaults to QueryOptions().
+            jobs (int): The number of worker processes.
+            max_pending (int): How many requests may wait for a worker before new ones are refused.
+
+        Raises:
+            ValueError: If jobs is not positive or max_pending is negative.
+        """
+        if jobs < 1:
+            raise ValueError("The service needs at least one worker")
+        if max_pending < 0:
+            raise ValueError("max_pending cannot be negative")
+        # only the computed mapping is sent to the workers, not the ATT&CK data it may have been computed from
+        self.probability_db = ProbabilityDatabase(
+            probability_mapping=probability_db.probability_mapping,
+            mitigations=probability_db.mitigations,
+            technique_rollup=probability_db.technique_rollup,
+        )
+        self.jobs = jobs
+        self.max_pending = max_pending
+        self.stats = LatencyStats()
+        self._executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(
+                self.probability_db,
+                options or main.ConversionOptions(),
+                query_options or main.QueryOptions(),
+            ),
+        )
+        # start the workers now, so the first requests do not wait for them to load
+        self._warmup = [self._executor.submit(int) for _ in range(jobs)]
+        self._workers = asyncio.Semaphore(jobs)
+        # requests admitted to /score, converting or waiting for a worker
+        self._admitted = 0
+        self._rejected = 0
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        self._executor.shutdown(cancel_futures=True)
+
+    async def handle(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[int, dict[str, Any]]:
+        """
+        Answer one request.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The path, without the query string.
+            body (bytes): The request body.
+
+        Returns:
+            tuple[int, dict[str, Any]]: The HTTP status and the JSON body of the answer.
+        """
+        start = time.perf_counter()
+        routes = {"/score": "POST", "/stats": "GET", "/health": "GET"}
+        if path not in routes:
+            return 404, {"error": f"Unknown endpoint {path}"}
+        if method != routes[path]:
+            return 405, {"error": f"{path} expects {routes[path]}"}
+        if path == "/score":
+            status, payload = await self._score(body)
+        elif path == "/stats":
+            status, payload = 200, self._stats()
+        else:
+            status, payload = 200, {
+                "status": (
+                    "ok"
+                    if all(future.done() for future in self._warmup)
+                    else "starting"
+                ),
+                "techniques": len(self.probability_db.probability_mapping),
+                "mitigations": len(self.probability_db.mitigations),
+            }
+        self.stats.record(path, status, time.perf_counter() - start)
+        return status, payload
+
+    async def _score(self, body: bytes) -> tuple[int, dict[str, Any]]:
+        """
+        Score a bundle in a worker, or refuse it if too many requests are already waiting.
+        """
+        if self._admitted >= self.jobs + self.max_pending:
+            self._rejected += 1
+            return 503, {"error": "Too many pending requests, retry later"}
+        self._admitted += 1
+        try:
+            async with self._workers:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _score_in_worker, body
+                )
+        except (ValueError, KeyError, TypeError) as error:
+            # malformed JSON, a malformed request or bundle, or unknown nodes
+            return 400, {"error": f"{type(error).__name__}: {error}"}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+        finally:
+            self._admitted -= 1
+        return 200, {"flows": results}
+
+    def _stats(self) -> dict[str, Any]:
+        """
+        The latency stats with the current state of the queue.
+        """
+        return {
+            **self.stats.snapshot(),
+            "jobs": self.jobs,
+            "converting": min(self._admitted, self.jobs),
+            "waiting": max(self._admitted - self.jobs, 0),
+            "max_pending": self.max_pending,
+            "rejected": self._rejected,
+        }
+
+
+async def _write_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    payload: dict[str, Any],
+    keep_alive: bool,
+) -> None:
+    """
+    Send a JSON answer.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def handle_connection(
+    service: ScoringService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    """
+    Serve the HTTP/1.1 requests of one connection, keeping it open between requests unless asked not to.
+
+    Args:
+        service (ScoringService): The service answering the requests.
+        reader (asyncio.StreamReader): The incoming side of the connection.
+        writer (asyncio.StreamWriter): The outgoing side of the connection.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+                length = int(headers.get("content-length", "0"))
+            except ValueError:
+                await _write_response(
+                    writer, 400, {"error": "Malformed HTTP request"}, False
+                )
+                break
+            if length > MAX_BODY_BYTES:
+                await _write_response(
+                    writer,
+                    413,
+                    {"error": f"Bodies are limited to {MAX_BODY_BYTES} bytes"},
+                    False,
+                )
+                break
+            body = await reader.readexactly(length) if length > 0 else b""
+            status, payload = await service.handle(
+                method, target.partition("?")[0], body
+            )
+            keep_alive = (
+                version == "HTTP/1.1"
+                and headers.get("connection", "").lower() != "close"
+            )
+            await _write_response(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        # the client went away mid-request
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(
+    service: ScoringService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> None:
+    """
+    Serve requests until cancelled.
+
+    Args:
+        service (ScoringService): The service answering the requests.
+        host (str): The interface to listen on. The service has no authentication, keep it local.
+        port (int): The port to listen on, 0 for any free port.
+    """
+    server = await asyncio.start_server(partial(handle_connection, service), host, port)
+    for sock in server.sockets:
+        address = sock.getsockname()
+        print(
+            f"Scoring service listening on http://{address[0]}:{address[1]}",
+            file=sys.stderr,
+        )
+    async with server:
+        await server.serve_forever()
+
+
+def run_service(
+    probability_db: ProbabilityDatabase,
+    options: main.ConversionOptions | None = None,
+    query_options: main.QueryOptions | None = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    jobs: int = 1,
+    max_pending: int = DEFAULT_MAX_PENDING,
+) -> None:
+    """
+    Run the scoring service until interrupted.
+
+    Args:
+        probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        options (main.ConversionOptions | None): How to build the networks.
+        query_options (main.QueryOptions | None): How to compute posteriors.
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        jobs (int): The number of worker processes.
+        max_pending (int): How many requests may wait for a worker before new ones are refused.
+    """
+
+    async def run() -> None:
+        service = ScoringService(
+            probability_db, options, query_options, jobs, max_pending
+        )
+        try:
+            await serve(service, host, port)
+        finally:
+            service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
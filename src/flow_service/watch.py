@@ -0,0 +1,315 @@
+"""
+Watch mode: reconvert an ATT&CK Flow export every time it is saved again.
+
+Analysts iterate on a flow in the Flow Builder and re-export it many times an hour. Running main.py again
+for every export reloads the ATT&CK probabilities, lays the whole flow out from scratch and formats every
+CPD, when an edit usually touches a handful of nodes. The watcher keeps the probability database loaded and,
+per attack flow, the NET text of every node and potential together with what it was made from: the label and
+position of the node, and the kind, probability and parent ids behind its CPD. When the export changes, the
+new bundle is diffed against the previous one by STIX id, only the blocks whose inputs changed are formatted
+again, the nodes that were already there keep their position (see layout.stable_positions), and the .net
+file is replaced atomically so UnBBayes never reads half of it.
+
+The first conversion writes exactly what main.py writes for the same export.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable
+
+import numpy as np
+
+import main
+from flow_network import assembly, compact
+from flow_network import layout as flow_layout
+from hugin_net import writer as hugin_writer
+from instrumentation import stages
+from stix_probability.weights import ProbabilityDatabase
+
+# seconds between two checks of the flow export
+DEFAULT_INTERVAL = 0.5
+
+
+def _render(write: Callable[..., None], *args: Any) -> str:
+    """
+    Capture what one of the hugin_writer functions writes.
+    """
+    buffer = io.StringIO()
+    write(buffer, *args)
+    return buffer.getvalue()
+
+
+@dataclass
+class NetUpdate:
+    """
+    What changed in one attack flow between two exports.
+
+    Attributes:
+        added (list[str]): The ids of the new nodes.
+        removed (list[str]): The ids of the nodes that are gone.
+        rebuilt_cpds (list[str]): The ids of the nodes whose potential was formatted again.
+        text (str): The NET text of the flow.
+    """
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    rebuilt_cpds: list[str] = field(default_factory=list)
+    text: str = ""
+
+
+class IncrementalNet:
+    """
+    The NET text of one attack flow, kept block by block so an edited version only formats what changed.
+
+    Attributes:
+        layout (bool): Whether nodes get positions.
+        positions (dict[str, tuple[int, int]]): The position of every node by id.
+        node_blocks (dict[str, tuple[Any, str]]): The declaration of every node with what it was made from.
+        potential_blocks (dict[str, tuple[Any, str]]): The potential of every node with what it was made from.
+    """
+
+    def __init__(self, layout: bool = True):
+        """
+        Args:
+            layout (bool): Whether nodes get positions.
+        """
+        self.layout = layout
+        self.positions: dict[str, tuple[int, int]] = {}
+        self.node_blocks: dict[str, tuple[Any, str]] = {}
+        self.potential_blocks: dict[str, tuple[Any, str]] = {}
+
+    def update(
+        self, compact_flow: compact.CompactFlow, probabilities: np.ndarray
+    ) -> NetUpdate:
+        """
+        Bring the text up to date with a new version of the flow.
+
+        Args:
+            compact_flow (compact.CompactFlow): The new version, without positions; they are set here.
+            probabilities (np.ndarray): The probability of each node, see compact.node_probabilities.
+
+        Returns:
+            NetUpdate: The changes, and the text of the new version.
+
+        Raises:
+            ValueError: If the flow graph has a cycle, the text of the previous version is then kept.
+        """
+        # UnBBayes cannot load a cyclic network
+        assembly.topological_order(compact_flow)
+        ids = compact_flow.ids
+        update = NetUpdate(
+            added=[node_id for node_id in ids if node_id not in self.node_blocks],
+            removed=sorted(set(self.node_blocks) - set(ids)),
+        )
+        if self.layout:
+            compact_flow.positions = flow_layout.stable_positions(
+                compact_flow, self.positions
+            )
+            self.positions = {
+                node_id: (int(x), int(y))
+                for node_id, (x, y) in zip(ids, compact_flow.positions)
+            }
+        order = sorted(range(compact_flow.num_nodes), key=ids.__getitem__)
+        node_blocks: dict[str, tuple[Any, str]] = {}
+        potential_blocks: dict[str, tuple[Any, str]] = {}
+        for node in order:
+            node_id = ids[node]
+            position = self.positions.get(node_id) if self.layout else None
+            node_key = (compact_flow.labels[node], position)
+            cached = self.node_blocks.get(node_id)
+            if cached is None or cached[0] != node_key:
+                attributes = {
+                    "label": f'"{compact_flow.labels[node]}"',
+                    **dict.fromkeys(hugin_writer.DROPPED_ATTRIBUTES),
+                }
+                if position is not None:
+                    attributes["position"] = f"({position[0]},{position[1]})"
+                cached = (
+                    node_key,
+                    _render(hugin_writer.write_net_node, node_id, attributes),
+                )
+            node_blocks[node_id] = cached
+
+            parents = [ids[parent] for parent in compact_flow.parents_of(node).tolist()]
+            potential_key = (
+                int(compact_flow.kinds[node]),
+                float(probabilities[node]),
+                tuple(parents),
+            )
+            cached = self.potential_blocks.get(node_id)
+            if cached is None or cached[0] != potential_key:
+                cached = (
+                    potential_key,
+                    _render(
+                        hugin_writer.write_net_potential,
+                        node_id,
+                        parents,
+                        compact.cpd_values(compact_flow, node, probabilities),
+                    ),
+                )
+                update.rebuilt_cpds.append(node_id)
+            potential_blocks[node_id] = cached
+        self.node_blocks = node_blocks
+        self.potential_blocks = potential_blocks
+        update.text = "".join(
+            [
+                _render(hugin_writer.write_net_header),
+                *(text for _, text in node_blocks.values()),
+                *(text for _, text in potential_blocks.values()),
+            ]
+        )
+        return update
+
+
+def write_atomically(path: str, text: str) -> None:
+    """
+    Replace a file in one step, so readers see either the old or the new version.
+
+    Args:
+        path (str): The file.
+        text (str): Its new content.
+    """
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temporary, path)
+
+
+class FlowWatcher:
+    """
+    Reconverts an ATT&CK Flow export when it changes, see the module docstring.
+
+    Attributes:
+        flow_file (str): The export to watch.
+        output_file (str): Where to write the Hugin net file, see main.flow_output_files.
+        probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        options (main.ConversionOptions): How to build the networks.
+        nets (dict[str, IncrementalNet]): The text of every attack flow by STIX id.
+    """
+
+    def __init__(
+        self,
+        flow_file: str,
+        output_file: str,
+        probability_db: ProbabilityDatabase,
+        options: main.ConversionOptions | None = None,
+    ):
+        """
+        Args:
+            flow_file (str): The export to watch.
+            output_file (str): Where to write the Hugin net file.
+            probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+            options (main.ConversionOptions | None): How to build the networks, defaults to
+                main.ConversionOptions().
+        """
+        self.flow_file = flow_file
+        self.output_file = output_file
+        self.probability_db = probability_db
+        self.options = options or main.ConversionOptions()
+        self.nets: dict[str, IncrementalNet] = {}
+        self._signature: tuple[int, int] | None = None
+        self._content: bytes | None = None
+
+    def changed(self) -> bool:
+        """
+        Check whether the export was saved since the last conversion.
+
+        Returns:
+            bool: Whether its modification time or size changed.
+        """
+        stat = os.stat(self.flow_file)
+        return (stat.st_mtime_ns, stat.st_size) != self._signature
+
+    def convert(self) -> dict[str, NetUpdate] | None:
+        """
+        Convert the export, formatting only the blocks that changed since the last conversion.
+
+        Returns:
+            dict[str, NetUpdate] | None: The update of every output file, None if the content did not change.
+
+        Raises:
+            ValueError: If the export cannot be read, or a flow graph has a cycle, the previous output of the
+                flow is then left in place.
+        """
+        stat = os.stat(self.flow_file)
+        self._signature = (stat.st_mtime_ns, stat.st_size)
+        with open(self.flow_file, "rb") as file:
+            content = file.read()
+        if content == self._content:
+            return None
+        with stages.stage("read_flow") as counts:
+            flow_bundle = main.parse_flow_data(json.loads(content), self.options.strict)
+            counts["objects"] = len(flow_bundle.objects)
+        # positions come from the previous version, see IncrementalNet.update
+        compact_flows = main.compact_flows_from_bundle(
+            flow_bundle, replace(self.options, layout=False)
+        )
+        output_files = main.flow_output_files(
+            self.output_file, [attack_flow for attack_flow, _ in compact_flows]
+        )
+        nets = {}
+        updates = {}
+        for (attack_flow, compact_flow), output_file in zip(
+            compact_flows, output_files
+        ):
+            net = self.nets.get(attack_flow.id) or IncrementalNet(self.options.layout)
+            with stages.labelled(flow=attack_flow.id):
+                with stages.stage("write_net") as counts:
+                    counts.update(stages.flow_counts(compact_flow))
+                    update = net.update(
+                        compact_flow,
+                        compact.node_probabilities(compact_flow, self.probability_db),
+                    )
+                    write_atomically(output_file, update.text)
+                    counts["rebuilt_cpds"] = len(update.rebuilt_cpds)
+            nets[attack_flow.id] = net
+            updates[output_file] = update
+        self.nets = nets
+        self._content = content
+        return updates
+
+
+def run_watch(
+    flow_file: str,
+    output_file: str,
+    probability_db: ProbabilityDatabase,
+    options: main.ConversionOptions | None = None,
+    interval: float = DEFAULT_INTERVAL,
+) -> None:
+    """
+    Convert an export, then again every time it changes, until interrupted.
+
+    Args:
+        flow_file (str): The export to watch.
+        output_file (str): Where to write the Hugin net file.
+        probability_db (ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        options (main.ConversionOptions | None): How to build the networks.
+        interval (float): The seconds between two checks of the export.
+    """
+    watcher = FlowWatcher(flow_file, output_file, probability_db, options)
+    print(f"Watching {flow_file}, press Ctrl+C to stop")
+    try:
+        while True:
+            try:
+                if watcher.changed():
+                    start = time.perf_counter()
+                    updates = watcher.convert()
+                    seconds = time.perf_counter() - start
+                    for written_file, update in (updates or {}).items():
+                        print(
+                            f"{written_file}: {len(update.added)} nodes added, "
+                            f"{len(update.removed)} removed, {len(update.rebuilt_cpds)} CPDs rebuilt "
+                            f"in {seconds:.3f}s"
+                        )
+            except Exception as error:
+                # the export may be half written or invalid, the next save will be picked up
+                print(f"Could not convert {flow_file}: {error}", file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
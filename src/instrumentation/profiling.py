@@ -0,0 +1,199 @@
+"""
+Deterministic profiles of every stage, for --profile.
+
+ProfileRecorder runs cProfile over each stage (see instrumentation.stages) and writes two files per stage to
+its directory, named after the stage and its labels:
+
+    <pid>-<n>-<stage>-<flow file>-<flow>.pstats     for pstats, snakeviz or gprof2dot
+    <pid>-<n>-<stage>-<flow file>-<flow>.collapsed  "frame;frame;frame microseconds" lines for flamegraph.pl,
+                                                    inferno or speedscope
+
+cProfile only records which function called which, not whole stacks, so the collapsed stacks are rebuilt by
+splitting the time of every function between its callers in proportion to the time spent under each, as
+flameprof and similar tools do. Functions reached through several callers may therefore be attributed to
+paths that never occurred together; the pstats file holds the exact caller/callee times. Profiling makes
+Python code several times slower, so the --metrics times of a profiled run are not comparable to others.
+"""
+
+import cProfile
+import itertools
+import os
+import pstats
+import re
+from typing import Any
+
+from instrumentation.stages import StageRecorder
+
+# a pstats function key: (file name, line number, function name)
+FunctionKey = tuple[str, int, str]
+
+# stacks with less time than this are left out of the collapsed stacks
+MIN_MICROSECONDS = 1
+
+
+def frame_name(function: FunctionKey) -> str:
+    """
+    Name a function in a collapsed stack.
+
+    Args:
+        function (FunctionKey): The pstats key of the function.
+
+    Returns:
+        str: "name (file:line)", or the name alone for built-in functions, without semicolons.
+    """
+    file_name, line, name = function
+    if file_name == "~":
+        frame = name
+    else:
+        frame = f"{name} ({os.path.basename(file_name)}:{line})"
+    return frame.replace(";", ",")
+
+
+def collapse_stats(stats: pstats.Stats) -> dict[str, int]:
+    """
+    Rebuild collapsed stacks from a profile.
+
+    Starting from the functions called from outside the profile, the own time of every function is assigned to
+    the current stack and its callees are visited with the share of their time spent under it.
+
+    Args:
+        stats (pstats.Stats): The profile.
+
+    Returns:
+        dict[str, int]: The own time in microseconds of every stack, frames joined by semicolons, root first.
+    """
+    timings: dict[FunctionKey, tuple[int, int, float, float, dict]] = stats.stats  # type: ignore[attr-defined]
+    callees: dict[FunctionKey, list[tuple[FunctionKey, float]]] = {}
+    for function, (_, _, _, _, callers) in timings.items():
+        for caller, (_, _, _, caller_cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, caller_cumulative))
+
+    stacks: dict[str, int] = {}
+    # (function, share of its time spent under the stack, stack of frame names, functions on the stack)
+    pending: list[tuple[FunctionKey, float, list[str], frozenset[FunctionKey]]] = []
+    for function, (_, _, _, cumulative, callers) in timings.items():
+        # stacks are rooted at the time not spent under another profiled function, i.e. called by the code
+        # that enabled the profile, whose calls are not recorded
+        inside = sum(
+            caller_cumulative
+            for caller, (_, _, _, caller_cumulative) in callers.items()
+            if caller in timings and caller != function
+        )
+        share = max(1.0 - inside / cumulative, 0.0) if cumulative > 0 else 1.0
+        if share > 1e-6:
+            pending.append(
+                (function, share, [frame_name(function)], frozenset([function]))
+            )
+    while pending:
+        function, share, frames, on_stack = pending.pop()
+        _, _, own, cumulative, _ = timings[function]
+        own_microseconds = round(own * share * 1e6)
+        if own_microseconds >= MIN_MICROSECONDS:
+            key = ";".join(frames)
+            stacks[key] = stacks.get(key, 0) + own_microseconds
+        for callee, edge_cumulative in callees.get(function, []):
+            # recursion is folded into the outermost call, like pstats does for cumulative times
+            if callee in on_stack:
+                continue
+            callee_cumulative = timings[callee][3]
+            if callee_cumulative <= 0:
+                continue
+            callee_share = share * min(edge_cumulative / callee_cumulative, 1.0)
+            if callee_cumulative * callee_share * 1e6 < MIN_MICROSECONDS:
+                continue
+            pending.append(
+                (
+                    callee,
+                    callee_share,
+                    [*frames, frame_name(callee)],
+                    on_stack | {callee},
+                )
+            )
+    return stacks
+
+
+def write_collapsed(stats: pstats.Stats, path: str) -> None:
+    """
+    Write the collapsed stacks of a profile, see collapse_stats.
+
+    Args:
+        stats (pstats.Stats): The profile.
+        path (str): The file to write.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, microseconds in sorted(collapse_stats(stats).items()):
+            file.write(f"{stack} {microseconds}\n")
+
+
+def _file_label(value: Any) -> str:
+    """
+    Make a label value usable in a file name.
+    """
+    text = str(value)
+    if os.sep in text or text.endswith(".json"):
+        text = os.path.splitext(os.path.basename(text))[0]
+    # keep the STIX type and the start of the UUID of object ids
+    text = re.sub(r"^([a-z-]+)--([0-9a-f]{8})[0-9a-f-]*$", r"\1-\2", text)
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", text)[:60]
+
+
+class ProfileRecorder(StageRecorder):
+    """
+    Profiles every stage with cProfile, writing pstats files and collapsed stacks.
+
+    Attributes:
+        directory (str): Where the profiles are written, created if needed.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): Where the profiles are written, created if needed.
+        """
+        self.directory = directory
+        self._sequence = itertools.count(1)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # worker processes number their own profiles, told apart by their pid
+        return {"directory": self.directory}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.directory = state["directory"]
+        self._sequence = itertools.count(1)
+
+    def profile_path(self, name: str, labels: dict[str, Any]) -> str:
+        """
+        Choose the path of the next profile, without extension.
+
+        Args:
+            name (str): The name of the stage.
+            labels (dict[str, Any]): The labels in effect.
+
+        Returns:
+            str: The path, unique within the directory.
+        """
+        parts = [str(os.getpid()), f"{next(self._sequence):03d}", name]
+        parts.extend(
+            _file_label(labels[label])
+            for label in ("flow_file", "flow")
+            if label in labels
+        )
+        return os.path.join(self.directory, "-".join(parts))
+
+    def start(self, name: str, labels: dict[str, Any]) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(
+        self,
+        state: cProfile.Profile,
+        name: str,
+        labels: dict[str, Any],
+        counts: dict[str, Any],
+    ) -> None:
+        state.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.profile_path(name, labels)
+        state.dump_stats(f"{path}.pstats")
+        write_collapsed(pstats.Stats(state), f"{path}.collapsed")
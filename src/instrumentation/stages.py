@@ -0,0 +1,157 @@
+"""
+Named stages of a conversion, for the recorders behind --metrics and --profile.
+
+The conversion code marks its stages with `with stages.stage("layout") as counts:` and may fill counts with
+sizes such as nodes and edges. Labels set with `stages.labelled(flow_file=...)` apply to every stage inside
+them. Nothing is measured unless a StageRecorder is installed, so the markers cost a dictionary and a check
+of an empty list otherwise. Stages are not nested: a recorder measuring peak memory resets the peak when a
+stage starts.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class StageRecorder:
+    """
+    Base class of what gets told about every stage, e.g. metrics.MetricsRecorder or profiling.ProfileRecorder.
+
+    Recorders are sent to batch worker processes, so they must be picklable.
+    """
+
+    def start(self, name: str, labels: dict[str, Any]) -> Any:
+        """
+        Called when a stage starts.
+
+        Args:
+            name (str): The name of the stage.
+            labels (dict[str, Any]): The labels in effect.
+
+        Returns:
+            Any: State handed back to stop.
+        """
+        return None
+
+    def stop(
+        self, state: Any, name: str, labels: dict[str, Any], counts: dict[str, Any]
+    ) -> None:
+        """
+        Called when a stage ends, normally or not.
+
+        Args:
+            state (Any): What start returned.
+            name (str): The name of the stage.
+            labels (dict[str, Any]): The labels in effect.
+            counts (dict[str, Any]): What the stage reported, with the exception type under "error" if it failed.
+        """
+
+    def close(self) -> None:
+        """
+        Called once the run is over, to release files and the like.
+        """
+
+
+_recorders: list[StageRecorder] = []
+_labels: dict[str, Any] = {}
+
+
+def install(recorder: StageRecorder) -> None:
+    """
+    Start telling a recorder about every stage.
+
+    Args:
+        recorder (StageRecorder): The recorder.
+    """
+    _recorders.append(recorder)
+
+
+def uninstall(recorder: StageRecorder) -> None:
+    """
+    Stop telling a recorder about the stages.
+
+    Args:
+        recorder (StageRecorder): The recorder, as passed to install.
+    """
+    _recorders.remove(recorder)
+
+
+def install_only(recorders: list[StageRecorder]) -> None:
+    """
+    Replace the installed recorders, e.g. in a forked worker process that inherited those of its parent.
+
+    Args:
+        recorders (list[StageRecorder]): The recorders.
+    """
+    _recorders[:] = recorders
+
+
+def installed() -> list[StageRecorder]:
+    """
+    Get the installed recorders, e.g. to install them in worker processes.
+
+    Returns:
+        list[StageRecorder]: The recorders, in installation order.
+    """
+    return list(_recorders)
+
+
+@contextmanager
+def labelled(**labels: Any) -> Iterator[None]:
+    """
+    Label every stage inside the block.
+
+    Args:
+        **labels (Any): The labels, e.g. flow_file or flow.
+    """
+    previous = dict(_labels)
+    _labels.update(labels)
+    try:
+        yield
+    finally:
+        _labels.clear()
+        _labels.update(previous)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[dict[str, Any]]:
+    """
+    Mark a stage of the conversion.
+
+    Args:
+        name (str): The name of the stage.
+
+    Yields:
+        dict[str, Any]: Where the stage may report sizes, such as nodes, edges or cpd_cells.
+    """
+    counts: dict[str, Any] = {}
+    if not _recorders:
+        yield counts
+        return
+    recorders = list(_recorders)
+    labels = dict(_labels)
+    states = [recorder.start(name, labels) for recorder in recorders]
+    try:
+        yield counts
+    except BaseException as error:
+        counts["error"] = type(error).__name__
+        raise
+    finally:
+        for recorder, state in reversed(list(zip(recorders, states))):
+            recorder.stop(state, name, labels, counts)
+
+
+def flow_counts(structure: Any) -> dict[str, int]:
+    """
+    The sizes reported for a flow graph.
+
+    Args:
+        structure (Any): A compact.FlowStructure.
+
+    Returns:
+        dict[str, int]: The nodes, edges and CPD cells (two states for every parent configuration of every node).
+    """
+    return {
+        "nodes": structure.num_nodes,
+        "edges": structure.num_edges,
+        "cpd_cells": int(sum(2 << int(degree) for degree in structure.in_degrees())),
+    }
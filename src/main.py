@@ -15,28 +15,50 @@ Dependencies:
 - stix2
 - mitreattack.stix20
 - pgmpy
+
+The heavy dependencies are imported on demand: a conversion with cached probabilities runs on the compact
+flow arrays and never loads pgmpy, NetworkX, stix2 or mitreattack, which only the modes using them pay for.
 """
 
+from __future__ import annotations
+
 import sys
 
 # add local directory to system path
 sys.path.append("./")
 import argparse
+import io
 import json
-from collections import defaultdict
-from typing import Any
+import os
+import re
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Sequence
 
-import networkx as nx
 import numpy as np
-import stix2
-from mitreattack.stix20 import MitreAttackData
-from pgmpy.factors.discrete import TabularCPD
-from pgmpy.inference import VariableElimination
-from pgmpy.models import BayesianNetwork
 
-from attack_flow_extension import flow
-from stix_probability import weights
-from pgmpy.readwrite import NETWriter
+from attack_flow_extension import records
+from flow_network import (
+    artifact,
+    assembly,
+    compact,
+    divorce,
+    inference,
+    mitigation,
+    polytree,
+    sampling,
+)
+from flow_network import layout as flow_layout
+from hugin_net import writer as hugin_writer
+from instrumentation import stages
+from stix_probability import cache, incidence, weights
+
+if TYPE_CHECKING:
+    import networkx as nx
+    import stix2
+    from pgmpy.models import BayesianNetwork
 
 
 def parse_args() -> argparse.Namespace:
@@ -47,27 +69,294 @@ def parse_args() -> argparse.Namespace:
         argparse.Namespace: Parsed arguments.
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("--flow_file", type=str, required=True)
-    parser.add_argument("--attack_stix", type=str, required=True)
-    parser.add_argument("--output_file", type=str, required=True)
-    return parser.parse_args()
+    flow_source = parser.add_mutually_exclusive_group()
+    flow_source.add_argument("--flow_file", type=str)
+    flow_source.add_argument(
+        "--flow_dir",
+        type=str,
+        help="convert every flow export in this directory (batch mode)",
+    )
+    flow_source.add_argument(
+        "--serve",
+        action="store_true",
+        help="run a local HTTP/JSON scoring service instead, see flow_service.server",
+    )
+    flow_source.add_argument(
+        "--compiled",
+        type=str,
+        help="query, rank the mitigations of or write the .net file of a network saved with --compile_to, "
+        "without converting the flow again",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="interface the scoring service listens on, it has no authentication so keep it local",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="port the scoring service listens on"
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=16,
+        help="requests the scoring service queues beyond the ones being converted before answering 503",
+    )
+    parser.add_argument("--attack_stix", type=str)
+    parser.add_argument(
+        "--attack_release",
+        type=str,
+        help="with --attack_stix, also store its probabilities under this release name, computed from the "
+        "previously stored release; without it, use the stored release, e.g. 15.1",
+    )
+    parser.add_argument("--output_file", type=str)
+    parser.add_argument(
+        "--compile_to",
+        type=str,
+        help="also save the compiled network of each flow to this file, see flow_network.artifact; "
+        "bundles with several flows get one file per flow, named like --output_file",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        help="where batch mode writes the .net files, defaults to --flow_dir",
+    )
+    parser.add_argument(
+        "--flow_glob",
+        type=str,
+        default="*.json",
+        help="which files in --flow_dir to convert",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes for batch mode and sampling",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=Path,
+        default=cache.default_cache_dir(),
+        help="directory for cached ATT&CK probabilities",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="always recompute the ATT&CK probabilities",
+    )
+    parser.add_argument(
+        "--attack_loader",
+        choices=cache.ATTACK_LOADERS,
+        default="streaming",
+        help="how to read the ATT&CK bundle when the probabilities are not cached",
+    )
+    parser.add_argument(
+        "--estimator",
+        choices=list(incidence.ESTIMATORS),
+        default=incidence.DEFAULT_ESTIMATOR,
+        help="how technique probabilities are estimated from the campaigns, groups and software using them",
+    )
+    parser.add_argument(
+        "--technique_rollup",
+        choices=weights.TECHNIQUE_ROLLUPS,
+        default=weights.ROLLUP_NONE,
+        help="give sub-techniques (T1059.001) the probability of their parent technique (T1059): never, "
+        "only when the sub-technique has no probability of its own, or always",
+    )
+    parser.add_argument(
+        "--max_fan_in",
+        type=int,
+        help="insert AND/OR gate nodes so no node has more parents than this (at least 2), "
+        "keeping CPD sizes linear instead of exponential in the number of parents",
+    )
+    parser.add_argument(
+        "--strict_flow",
+        action="store_true",
+        help="validate every object of the flow export with stix2 instead of reading only the attack flow objects",
+    )
+    parser.add_argument(
+        "--no_layout",
+        action="store_true",
+        help="do not compute node positions, for networks that are never opened in UnBBayes",
+    )
+    parser.add_argument(
+        "--query",
+        nargs="*",
+        metavar="NODE",
+        help="print the posterior probability of these nodes as JSON, "
+        "or of each flow's terminal nodes when no node is given",
+    )
+    parser.add_argument(
+        "--evidence",
+        action="append",
+        default=[],
+        metavar="NODE=STATE",
+        help="condition --query on a node being observed false (0) or true (1), can be repeated",
+    )
+    parser.add_argument(
+        "--query_engine",
+        choices=QUERY_ENGINES,
+        default="auto",
+        help="exact inference, forward sampling, or auto to sample only flows too large for exact inference",
+    )
+    parser.add_argument(
+        "--precision",
+        type=float,
+        default=0.005,
+        help="with sampling, stop once every 95%% confidence interval is this narrow on either side",
+    )
+    parser.add_argument(
+        "--max_samples",
+        type=int,
+        default=10_000_000,
+        help="with sampling, the most samples to draw per flow",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed for reproducible sampling, the estimates do not depend on --jobs",
+    )
+    parser.add_argument(
+        "--rank_mitigations",
+        action="store_true",
+        help="print, as JSON, how much each ATT&CK mitigation lowers the probability of each flow's terminal nodes",
+    )
+    parser.add_argument(
+        "--mitigation_efficacy",
+        type=float,
+        default=mitigation.DEFAULT_EFFICACY,
+        help="the fraction of a technique's probability a mitigation removes",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and rewrite --output_file every time --flow_file is saved, "
+        "reformatting only the nodes that changed and keeping node positions",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        type=float,
+        default=0.5,
+        help="seconds between two checks of --flow_file in --watch mode",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        metavar="PATH",
+        help="append the wall time, CPU time, peak traced memory and graph sizes of every stage "
+        "as JSON lines to this file, - for stderr",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="DIR",
+        help="profile every stage with cProfile and write its pstats file and flamegraph collapsed stacks "
+        "to this directory, named after the stage and flow file",
+    )
+    args = parser.parse_args()
+    json_mode = args.query is not None or args.rank_mitigations
+    if (
+        args.attack_stix is None
+        and args.attack_release is None
+        and (args.compiled is None or args.rank_mitigations)
+    ):
+        parser.error("one of the arguments --attack_stix --attack_release is required")
+    if args.estimator != incidence.DEFAULT_ESTIMATOR and (
+        args.attack_release is not None or args.attack_loader != "streaming"
+    ):
+        parser.error(
+            f"--estimator {args.estimator} needs the streaming --attack_loader and no --attack_release"
+        )
+    if (
+        args.flow_file is None
+        and args.flow_dir is None
+        and args.compiled is None
+        and not args.serve
+    ):
+        parser.error(
+            "one of the arguments --flow_file --flow_dir --serve --compiled is required"
+        )
+    if args.max_fan_in is not None and args.max_fan_in < 2:
+        parser.error("--max_fan_in must be at least 2")
+    if args.flow_file is not None and args.output_file is None and not json_mode:
+        parser.error("--output_file is required with --flow_file")
+    if args.compiled is not None and args.output_file is None and not json_mode:
+        parser.error("--compiled needs --output_file, --query or --rank_mitigations")
+    if json_mode and args.flow_file is None and args.compiled is None:
+        parser.error("--query and --rank_mitigations need --flow_file or --compiled")
+    if args.compile_to is not None and (args.flow_file is None or args.watch):
+        parser.error(
+            "--compile_to needs --flow_file and cannot be combined with --watch"
+        )
+    if args.query is not None and args.rank_mitigations:
+        parser.error("--query and --rank_mitigations cannot be combined")
+    if not 0 <= args.mitigation_efficacy <= 1:
+        parser.error("--mitigation_efficacy must be between 0 and 1")
+    if args.watch and (args.flow_file is None or json_mode):
+        parser.error(
+            "--watch needs --flow_file and cannot be combined with --query or --rank_mitigations"
+        )
+    if args.watch_interval <= 0:
+        parser.error("--watch_interval must be positive")
+    if args.evidence and args.query is None:
+        parser.error("--evidence needs --query")
+    try:
+        args.evidence = parse_evidence(args.evidence)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.max_pending < 0:
+        parser.error("--max_pending cannot be negative")
+    if not 0 < args.precision < 1:
+        parser.error("--precision must be between 0 and 1")
+    return args
 
 
-def read_flow_file(name: str) -> stix2.Bundle:
+def read_flow_file(
+    name: str, strict: bool = False
+) -> stix2.Bundle | records.FlowBundle:
     """
     Read a flow file and return the data.
 
+    By default only the attack flow objects are kept, as lightweight records (see
+    attack_flow_extension.records). Strict parsing builds and validates every object with stix2 instead.
+
     Parameters:
     name (str): The name of the flow file to read.
+    strict (bool): Whether to validate the whole bundle with stix2.
 
     Returns:
-    bundle (stix2.Bundle): The parsed STIX bundle data.
+    bundle (stix2.Bundle | records.FlowBundle): The parsed STIX bundle data.
 
     """
     with open(name, "r", encoding="utf-8") as file:
         data = json.load(file)
-        bundle: stix2.Bundle = stix2.parse(data, allow_custom=True)
-        return bundle
+    return parse_flow_data(data, strict)
+
+
+def parse_flow_data(
+    data: dict[str, Any], strict: bool = False
+) -> stix2.Bundle | records.FlowBundle:
+    """
+    Parse the decoded JSON of a flow export, see read_flow_file.
+
+    Args:
+        data (dict[str, Any]): The decoded flow export.
+        strict (bool): Whether to validate the whole bundle with stix2.
+
+    Returns:
+        stix2.Bundle | records.FlowBundle: The parsed STIX bundle data.
+    """
+    if not strict:
+        return records.parse_flow_bundle(data)
+    import stix2
+
+    # registers the attack flow extension objects with stix2
+    from attack_flow_extension import flow  # noqa: F401
+
+    bundle: stix2.Bundle = stix2.parse(data, allow_custom=True)
+    return bundle
 
 
 def flow_nx_to_pgmpy(
@@ -86,6 +375,9 @@ def flow_nx_to_pgmpy(
     Raises:
         ValueError: If the model is invalid.
     """
+    from pgmpy.factors.discrete import TabularCPD
+    from pgmpy.models import BayesianNetwork
+
     model = BayesianNetwork(graph)
     for node, node_data in model.nodes(data=True):
         parents = list(model.predecessors(node))
@@ -94,16 +386,9 @@ def flow_nx_to_pgmpy(
             # isolated node
             if flow_obj.type == "attack-action":
                 # why do you just have the one node? this is a lot of work for just 1 node.
-                relevant_attack_pattern: str | None = flow_obj.get_attack_pattern_id()
-                probability: float
-                if relevant_attack_pattern is None:
-                    probability = probabilities.get_probability_for_technique(
-                        weights.StixId("")
-                    )
-                else:
-                    probability = probabilities.get_probability_for_technique(
-                        weights.StixId(relevant_attack_pattern)
-                    )
+                probability: float = probabilities.get_probability_for_action(
+                    flow_obj.get_attack_pattern_id(), flow_obj.get_technique_id()
+                )
                 cpd = TabularCPD(
                     variable=node,
                     variable_card=2,
@@ -123,16 +408,9 @@ def flow_nx_to_pgmpy(
         elif parents:
             if flow_obj.type == "attack-action":
                 evidence_card = []
-                relevant_attack_pattern: str | None = flow_obj.get_attack_pattern_id()
-                probability: float
-                if relevant_attack_pattern is None:
-                    probability = probabilities.get_probability_for_technique(
-                        weights.StixId("")
-                    )
-                else:
-                    probability = probabilities.get_probability_for_technique(
-                        weights.StixId(relevant_attack_pattern)
-                    )
+                probability: float = probabilities.get_probability_for_action(
+                    flow_obj.get_attack_pattern_id(), flow_obj.get_technique_id()
+                )
                 vals = np.zeros((2, 2 ** len(parents)))
                 # top row is false, bottom row is true
                 vals[0, :] = 1 - probability
@@ -196,20 +474,37 @@ def flow_nx_to_pgmpy(
 
 
 def convert_attack_flow_to_nx(
-    attack_flow: flow.AttackFlow, flow_bundle: stix2.Bundle
+    attack_flow: records.AnyAttackFlow,
+    flow_bundle: stix2.Bundle | records.FlowBundle,
+    object_index: dict[str, list[Any]] | None = None,
 ) -> nx.DiGraph:
     """
     performs a BFS to convert the attackflow to a networkx graph
+
+    object_index is the id index of the bundle (see flow.index_flow_objects), built here if not given.
+    Every node is looked up and expanded exactly once, so this is linear in the number of nodes plus edges.
     """
+    import networkx as nx
+
+    from attack_flow_extension import flow
+
+    if object_index is None:
+        object_index = flow.index_flow_objects(flow_bundle)
     G = nx.DiGraph()
-    queue = []
+    queue: deque[str] = deque()
+    # every node that was ever queued, so shared descendants (diamonds) are only expanded once
+    seen: set[str] = set()
     for starting_node in attack_flow.get_starting_points():
-        backing_obj = flow.get_single_flow_object_by_id(starting_node, flow_bundle)
+        backing_obj = flow.get_single_flow_object_by_id(
+            starting_node, flow_bundle, object_index
+        )
         G.add_node(starting_node, object=backing_obj)
-        queue.append(starting_node)
+        if starting_node not in seen:
+            seen.add(starting_node)
+            queue.append(starting_node)
     while queue:
-        node = queue.pop(0)
-        list_of_objs = flow_bundle.get_obj(node)
+        node = queue.popleft()
+        list_of_objs = object_index.get(node, [])
         if len(list_of_objs) != 1:
             raise ValueError(f"Expected to find exactly one object with id {node}")
         node_obj = list_of_objs[0]
@@ -227,9 +522,12 @@ def convert_attack_flow_to_nx(
                 # this is a terminal node
                 continue
         for child in children:
-            if child not in queue:
-                backing_obj = flow.get_single_flow_object_by_id(child, flow_bundle)
+            if child not in seen:
+                backing_obj = flow.get_single_flow_object_by_id(
+                    child, flow_bundle, object_index
+                )
                 G.add_node(child, object=backing_obj)
+                seen.add(child)
                 queue.append(child)
             G.add_edge(node, child)
     return G
@@ -239,35 +537,26 @@ def pgmpy_to_unbbayes_hugin(model: BayesianNetwork) -> str:
     """
     Convert a pgmpy BayesianNetwork model to a Hugin format string.
 
+    Use hugin_net.writer.write_unbbayes_net to stream the model straight to a file instead.
+
     Parameters:
         model (BayesianNetwork): The pgmpy BayesianNetwork model to convert.
 
     Returns:
         str: The Hugin format string representation of the model.
     """
-    writer = NETWriter(model)
-    raw_hugin_file = str(writer)
-    # cheap hacks to get around a bug in either pgmpy or unbbayes.
-    for line in iter(raw_hugin_file.splitlines()):
-        # remove lines with "object" in them because unbbayes doesn't know what to do with that
-        if "object" in line:
-            raw_hugin_file = raw_hugin_file.replace(line, "")
-        # remove lines with "weight" in them because unbbayes doesn't know what to do with that
-        elif "weight" in line:
-            raw_hugin_file = raw_hugin_file.replace(line, "")
-    # At the end of a node declaration, there is a open-squirly bracket. Unbbayes won't read the file unless thats on a new line
-    # Also this makes the net file pretty ugly but if it works it works
-    # thanks r: https://www.bnlearn.com/bnrepository/discrete-small.html#asia
-    raw_hugin_file = raw_hugin_file.replace("{", "\n{")
-    return raw_hugin_file
+    buffer = io.StringIO()
+    hugin_writer.write_unbbayes_net(model, buffer)
+    return buffer.getvalue()
 
 
-def make_nx_graph_more_readable(graph: nx.DiGraph) -> nx.DiGraph:
+def make_nx_graph_more_readable(graph: nx.DiGraph, layout: bool = True) -> nx.DiGraph:
     """
-    Make the graph more readable by adding labels to the nodes.
+    Make the graph more readable by adding labels and, optionally, layered positions to the nodes.
 
     Args:
         graph (nx.DiGraph): The graph to make more readable.
+        layout (bool): Whether to position the nodes, see flow_network.layout.
 
     Returns:
         nx.DiGraph: The more readable graph.
@@ -283,30 +572,620 @@ def make_nx_graph_more_readable(graph: nx.DiGraph) -> nx.DiGraph:
         else:
             raise ValueError("Unknown node type")
 
-    # add positions to the nodes for better visualization, otherwise we will get a cthulhu monster in unbbayes
-    positions = nx.spring_layout(graph, k=0.5, iterations=50)
-    scale = 500  # 500 is probably fine
-    # Find the minimum values
-    min_x = min(coord[0] for coord in positions.values())
-    min_y = min(coord[1] for coord in positions.values())
+    if layout:
+        # add positions to the nodes for better visualization, otherwise we will get a cthulhu monster in unbbayes
+        for node, (x, y) in flow_layout.layered_layout(graph).items():
+            graph.nodes[node]["position"] = f"({x},{y})"
+    return graph
+
 
-    # Shift all positions to be positive
-    positions = {
-        node: (coord[0] - min_x, coord[1] - min_y) for node, coord in positions.items()
-    }
+def flow_output_files(
+    output_file: str, flows: list[records.AnyAttackFlow]
+) -> list[str]:
+    """
+    Name the output file of each attack flow in a bundle.
+
+    A bundle with a single flow is written to output_file itself. With several flows, each one gets
+    output_file with the flow name appended to the stem, e.g. out.net -> out-cobalt-kitty-campaign.net.
+
+    Args:
+        output_file (str): The requested output file.
+        flows (list[records.AnyAttackFlow]): The attack flows in the bundle.
+
+    Returns:
+        list[str]: One distinct output file per flow, in the same order.
+    """
+    if len(flows) == 1:
+        return [output_file]
+    stem, suffix = os.path.splitext(output_file)
+    output_files = []
+    used: set[str] = set()
+    for position, attack_flow in enumerate(flows, start=1):
+        slug = "-".join(re.findall(r"[a-z0-9]+", attack_flow.get("name", "").lower()))
+        candidate = f"{stem}-{slug or position}{suffix}"
+        if candidate in used:
+            candidate = f"{stem}-{slug or 'flow'}-{position}{suffix}"
+        used.add(candidate)
+        output_files.append(candidate)
+    return output_files
+
+
+@dataclass
+class ConversionOptions:
+    """
+    Options controlling how a flow is turned into a Bayesian network.
+
+    Attributes:
+        max_fan_in (int | None): Divorce the parents of nodes with more parents than this, None keeps every edge as is.
+        layout (bool): Whether to give the nodes positions for UnBBayes to draw them at.
+        strict (bool): Whether to validate the whole flow export with stix2, see read_flow_file.
+    """
+
+    max_fan_in: int | None = None
+    layout: bool = True
+    strict: bool = False
 
-    # Scale up the positions
-    positions = {
-        node: (coord[0] * scale, coord[1] * scale) for node, coord in positions.items()
+
+def build_compact_flows(
+    flow_file: str, options: ConversionOptions | None = None
+) -> list[tuple[records.AnyAttackFlow, compact.CompactFlow]]:
+    """
+    Build the compact flow graph of every attack flow in an ATT&CK Flow export.
+
+    Args:
+        flow_file (str): The ATT&CK Flow export to read.
+        options (ConversionOptions | None): How to build the graphs, defaults to ConversionOptions().
+
+    Returns:
+        list[tuple[records.AnyAttackFlow, compact.CompactFlow]]: Each attack flow with its graph, in bundle order.
+
+    Raises:
+        ValueError: If the file does not contain any attack flow.
+    """
+    options = options or ConversionOptions()
+    with stages.stage("read_flow") as counts:
+        flow_bundle = read_flow_file(flow_file, options.strict)
+        counts["objects"] = len(flow_bundle.objects)
+    return compact_flows_from_bundle(flow_bundle, options)
+
+
+def compact_flows_from_bundle(
+    flow_bundle: stix2.Bundle | records.FlowBundle,
+    options: ConversionOptions | None = None,
+) -> list[tuple[records.AnyAttackFlow, compact.CompactFlow]]:
+    """
+    Build the compact flow graph of every attack flow in a parsed ATT&CK Flow export, see build_compact_flows.
+
+    Args:
+        flow_bundle (stix2.Bundle | records.FlowBundle): The export, from read_flow_file or parse_flow_data.
+        options (ConversionOptions | None): How to build the graphs, defaults to ConversionOptions().
+
+    Returns:
+        list[tuple[records.AnyAttackFlow, compact.CompactFlow]]: Each attack flow with its graph, in bundle order.
+
+    Raises:
+        ValueError: If the bundle does not contain any attack flow.
+    """
+    options = options or ConversionOptions()
+    flows = records.get_flows_from_stix_bundle(flow_bundle)
+    if not flows:
+        raise ValueError("Expected at least one attack flow in the file.")
+    # one index over the bundle, shared by every flow in it
+    object_index = records.index_flow_objects(flow_bundle)
+    compact_flows = []
+    for attack_flow in flows:
+        with stages.labelled(flow=attack_flow.id):
+            with stages.stage("traverse") as counts:
+                compact_flow = compact.from_attack_flow(
+                    attack_flow, flow_bundle, object_index
+                )
+                counts.update(stages.flow_counts(compact_flow))
+            if options.max_fan_in is not None:
+                with stages.stage("divorce") as counts:
+                    compact_flow = divorce.divorce_compact_flow(
+                        compact_flow, options.max_fan_in
+                    )
+                    counts.update(stages.flow_counts(compact_flow))
+            if options.layout:
+                with stages.stage("layout") as counts:
+                    # add positions to the nodes for better visualization, otherwise we will get a cthulhu monster in unbbayes
+                    compact_flow.positions = flow_layout.layered_positions(compact_flow)
+                    counts.update(stages.flow_counts(compact_flow))
+        compact_flows.append((attack_flow, compact_flow))
+    return compact_flows
+
+
+def write_compact_flows(
+    compact_flows: list[tuple[records.AnyAttackFlow, compact.CompactFlow]],
+    probability_db: weights.ProbabilityDatabase,
+    output_file: str,
+) -> list[str]:
+    """
+    Write the compact flow graphs of an ATT&CK Flow export to Hugin net files.
+
+    Args:
+        compact_flows (list[tuple[records.AnyAttackFlow, compact.CompactFlow]]): The graphs from build_compact_flows.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        output_file (str): Where to write the Hugin net file, see flow_output_files for bundles with several flows.
+
+    Returns:
+        list[str]: The Hugin net files that were written, one per attack flow.
+
+    Raises:
+        ValueError: If a flow graph has a cycle.
+    """
+    output_files = flow_output_files(
+        output_file, [attack_flow for attack_flow, _ in compact_flows]
+    )
+    for (attack_flow, compact_flow), flow_output_file in zip(
+        compact_flows, output_files
+    ):
+        with stages.labelled(flow=attack_flow.id):
+            with stages.stage("write_net") as counts:
+                counts.update(stages.flow_counts(compact_flow))
+                counts.update(
+                    (f"actions_{level}", count)
+                    for level, count in compact.technique_coverage(
+                        compact_flow, probability_db
+                    ).items()
+                )
+                # UnBBayes cannot load a cyclic network, so refuse before the file is touched
+                assembly.topological_order(compact_flow)
+                probabilities = compact.node_probabilities(compact_flow, probability_db)
+                with open(flow_output_file, "w", encoding="utf-8") as file:
+                    hugin_writer.write_compact_net(compact_flow, probabilities, file)
+                    counts["bytes"] = file.tell()
+    return output_files
+
+
+def describe_attack_data(args: argparse.Namespace) -> dict[str, str]:
+    """
+    Describe the ATT&CK data and probability model selected on the command line, as compiled networks record it.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        dict[str, str]: The probability model, estimator and technique rollup, and the release and the
+            bundle's file name and SHA-256 if they were given.
+    """
+    attack = {
+        "probability_model": weights.PROBABILITY_MODEL_VERSION,
+        "estimator": args.estimator,
+        "technique_rollup": args.technique_rollup,
     }
+    if args.attack_release is not None:
+        attack["release"] = args.attack_release
+    if args.attack_stix is not None:
+        attack["bundle"] = os.path.basename(args.attack_stix)
+        attack["sha256"] = cache.hash_attack_bundle(args.attack_stix)
+    return attack
+
+
+def write_compiled_flows(
+    compact_flows: list[tuple[records.AnyAttackFlow, compact.CompactFlow]],
+    probability_db: weights.ProbabilityDatabase,
+    output_file: str,
+    attack: dict[str, str],
+) -> list[str]:
+    """
+    Save the compiled networks of an ATT&CK Flow export, see flow_network.artifact.
+
+    Args:
+        compact_flows (list[tuple[records.AnyAttackFlow, compact.CompactFlow]]): The graphs from build_compact_flows.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        output_file (str): Where to save the network, see flow_output_files for bundles with several flows.
+        attack (dict[str, str]): The ATT&CK data the probabilities come from, see describe_attack_data.
+
+    Returns:
+        list[str]: The files that were written, one per attack flow.
+    """
+    output_files = flow_output_files(
+        output_file, [attack_flow for attack_flow, _ in compact_flows]
+    )
+    for (attack_flow, compact_flow), flow_output_file in zip(
+        compact_flows, output_files
+    ):
+        with stages.labelled(flow=attack_flow.id):
+            network = assembly.assemble_network(
+                compact_flow, compact.node_probabilities(compact_flow, probability_db)
+            )
+            with stages.stage("write_compiled") as counts:
+                counts.update(stages.flow_counts(compact_flow))
+                with open(flow_output_file, "wb") as file:
+                    counts["bytes"] = artifact.write_artifact(
+                        file, network, attack_flow, attack
+                    )
+    return output_files
+
+
+def convert_flow_file(
+    flow_file: str,
+    output_file: str,
+    probability_db: weights.ProbabilityDatabase,
+    options: ConversionOptions | None = None,
+) -> list[str]:
+    """
+    Convert every attack flow in an ATT&CK Flow export to a Hugin net file.
+
+    Args:
+        flow_file (str): The ATT&CK Flow export to read.
+        output_file (str): Where to write the Hugin net file, see flow_output_files for bundles with several flows.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        options (ConversionOptions | None): How to build the networks, defaults to ConversionOptions().
+
+    Returns:
+        list[str]: The Hugin net files that were written, one per attack flow.
+
+    Raises:
+        ValueError: If the file does not contain any attack flow, or a flow graph has a cycle.
+    """
+    compact_flows = build_compact_flows(flow_file, options)
+    return write_compact_flows(compact_flows, probability_db, output_file)
+
+
+def parse_evidence(assignments: list[str]) -> dict[str, int]:
+    """
+    Parse NODE=STATE evidence from the command line.
+
+    Args:
+        assignments (list[str]): The assignments, the state being 0/1 or false/true.
+
+    Returns:
+        dict[str, int]: The observed state of each node.
+
+    Raises:
+        ValueError: If an assignment is malformed.
+    """
+    states = {"0": 0, "1": 1, "false": 0, "true": 1}
+    evidence = {}
+    for assignment in assignments:
+        node, separator, state = assignment.rpartition("=")
+        if not separator or not node or state.lower() not in states:
+            raise ValueError(
+                f"Evidence must look like NODE=0 or NODE=1, got {assignment}"
+            )
+        evidence[node] = states[state.lower()]
+    return evidence
+
+
+QUERY_ENGINES = ("auto", "exact", "sampling")
 
-    # Round to whole numbers
-    positions = {
-        node: (round(coord[0]), round(coord[1])) for node, coord in positions.items()
+
+@dataclass
+class QueryOptions:
+    """
+    Options controlling how --query computes posterior probabilities.
+
+    Attributes:
+        engine (str): "exact", "sampling", or "auto" to sample only flows too large for exact inference.
+        precision (float): How wide the sampling confidence intervals may be on either side of the estimate.
+        max_samples (int): The most samples to draw per flow.
+        seed (int | None): Seed for reproducible sampling.
+        jobs (int): The number of processes drawing samples.
+    """
+
+    engine: str = "auto"
+    precision: float = 0.005
+    max_samples: int = 10_000_000
+    seed: int | None = None
+    jobs: int = 1
+
+
+def query_flow_network(
+    model: BayesianNetwork | assembly.FlowNetwork,
+    variables: list[str],
+    evidence: dict[str, int],
+    options: QueryOptions,
+) -> dict[str, Any]:
+    """
+    Compute posterior probabilities on one network with the cheapest engine that can answer.
+
+    Without evidence, flows whose gates form a polytree are evaluated directly (see polytree.PolytreeEvaluator).
+    Otherwise the network is compiled once (see inference.CompiledNetwork) and every variable is read off the
+    same calibration, unless the junction tree is too large or sampling was asked for (see sampling.ForwardSampler).
+
+    Args:
+        model (BayesianNetwork | assembly.FlowNetwork): The network.
+        variables (list[str]): The nodes to report.
+        evidence (dict[str, int]): The observed state of nodes.
+        options (QueryOptions): Which engine to use and how precisely to sample.
+
+    Returns:
+        dict[str, Any]: The method, P(evidence) and the probability of each variable, with its confidence
+        interval when sampled.
+    """
+    if options.engine != "sampling":
+        # prior marginals of polytree flows need no junction tree
+        evaluator = None if evidence else polytree.PolytreeEvaluator.compile(model)
+        if evaluator is not None:
+            marginals = evaluator.marginals(variables)
+            return {
+                "method": "polytree",
+                "probability_of_evidence": 1.0,
+                "probabilities": {
+                    node: {"probability": float(marginals[node][1])}
+                    for node in variables
+                },
+            }
+        try:
+            compiled = inference.CompiledNetwork(model)
+        except ValueError:
+            if options.engine == "exact":
+                raise
+        else:
+            marginals = compiled.marginals(variables, evidence)
+            return {
+                "method": "junction-tree",
+                "probability_of_evidence": compiled.probability_of_evidence(evidence),
+                "probabilities": {
+                    node: {"probability": float(marginals[node][1])}
+                    for node in variables
+                },
+            }
+    estimate = sampling.ForwardSampler(model).estimate(
+        variables,
+        evidence,
+        precision=options.precision,
+        max_samples=options.max_samples,
+        seed=options.seed,
+        jobs=options.jobs,
+    )
+    return {
+        "method": "sampling",
+        "samples": estimate.samples,
+        "converged": estimate.converged,
+        "probability_of_evidence": estimate.probability_of_evidence,
+        "probabilities": {
+            node: {
+                "probability": estimate.estimates[node].probability,
+                "interval": [
+                    estimate.estimates[node].lower,
+                    estimate.estimates[node].upper,
+                ],
+            }
+            for node in variables
+        },
     }
-    for node, pos in positions.items():
-        graph.nodes[node]["position"] = f"({pos[0]},{pos[1]})"
-    return graph
+
+
+def query_flow_networks(
+    networks: Sequence[
+        tuple[
+            records.AnyAttackFlow,
+            BayesianNetwork | assembly.FlowNetwork,
+        ]
+    ],
+    variables: list[str] | None = None,
+    evidence: dict[str, int] | None = None,
+    options: QueryOptions | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Compute posterior probabilities on the networks of an ATT&CK Flow export, see query_flow_network.
+
+    In a bundle with several flows, variables and evidence apply to the flows containing them.
+
+    Args:
+        networks (Sequence[tuple[records.AnyAttackFlow, BayesianNetwork | assembly.FlowNetwork]]):
+            The networks from assembly.assemble_network, or their pgmpy version.
+        variables (list[str] | None): The nodes to report, None for the terminal nodes of each flow.
+        evidence (dict[str, int] | None): The observed state of nodes.
+        options (QueryOptions | None): How to compute the probabilities, defaults to QueryOptions().
+
+    Returns:
+        list[dict[str, Any]]: One JSON-ready result per attack flow.
+
+    Raises:
+        ValueError: If a named node is in none of the flows, or the evidence is impossible.
+    """
+    evidence = evidence or {}
+    options = options or QueryOptions()
+    tables = [assembly.network_tables(model) for _, model in networks]
+    known = set().union(*(flow_tables.index for flow_tables in tables))
+    for node in [*(variables or []), *evidence]:
+        if node not in known:
+            raise ValueError(f"Node {node} is not in any attack flow of the file")
+    results = []
+    for (attack_flow, model), flow_tables in zip(networks, tables):
+        flow_evidence = {
+            node: state for node, state in evidence.items() if node in flow_tables.index
+        }
+        if variables is None:
+            flow_variables = flow_tables.terminal_nodes()
+        else:
+            flow_variables = [node for node in variables if node in flow_tables.index]
+        with stages.labelled(flow=attack_flow.id), stages.stage("query") as counts:
+            result = query_flow_network(model, flow_variables, flow_evidence, options)
+            counts["method"] = result["method"]
+        probabilities = {
+            node: {"label": flow_tables.labels[flow_tables.index[node]], **posterior}
+            for node, posterior in result.pop("probabilities").items()
+        }
+        results.append(
+            {
+                "flow": attack_flow.id,
+                "name": attack_flow.get("name", ""),
+                "evidence": flow_evidence,
+                **result,
+                "posteriors": probabilities,
+            }
+        )
+    return results
+
+
+def rank_flow_mitigations(
+    networks: Sequence[
+        tuple[
+            records.AnyAttackFlow,
+            BayesianNetwork | assembly.FlowNetwork,
+        ]
+    ],
+    probability_db: weights.ProbabilityDatabase,
+    efficacy: float = mitigation.DEFAULT_EFFICACY,
+) -> list[dict[str, Any]]:
+    """
+    Rank the ATT&CK mitigations by how much they lower the probability of each flow's terminal nodes.
+
+    Args:
+        networks (Sequence[tuple[records.AnyAttackFlow, BayesianNetwork | assembly.FlowNetwork]]):
+            The networks from assembly.assemble_network, or their pgmpy version.
+        probability_db (weights.ProbabilityDatabase): The probability database holding the mitigations.
+        efficacy (float): The fraction of a technique's probability a mitigation removes.
+
+    Returns:
+        list[dict[str, Any]]: One JSON-ready ranking per attack flow, largest drop first.
+    """
+    results = []
+    for attack_flow, model in networks:
+        tables = assembly.network_tables(model)
+        with stages.labelled(flow=attack_flow.id), stages.stage("rank_mitigations"):
+            baseline, impacts = mitigation.rank_mitigations(
+                model, probability_db, efficacy
+            )
+        results.append(
+            {
+                "flow": attack_flow.id,
+                "name": attack_flow.get("name", ""),
+                "efficacy": efficacy,
+                "baseline": {
+                    node: {
+                        "label": tables.labels[tables.index[node]],
+                        "probability": probability,
+                    }
+                    for node, probability in baseline.items()
+                },
+                "mitigations": [
+                    {
+                        "mitigation_id": impact.mitigation.mitigation_id,
+                        "name": impact.mitigation.name,
+                        "stix_id": impact.mitigation.stix_id,
+                        "actions": impact.actions,
+                        "drop": impact.drop,
+                        "probabilities": impact.probabilities,
+                    }
+                    for impact in impacts
+                ],
+            }
+        )
+    return results
+
+
+@dataclass
+class BatchResult:
+    """
+    The outcome of converting one flow file in batch mode.
+
+    Attributes:
+        flow_file (str): The flow file that was converted.
+        output_file (str): The requested Hugin net file, see flow_output_files.
+        error (str | None): Why the conversion failed, or None on success.
+        written_files (list[str]): The Hugin net files that were written, one per attack flow.
+    """
+
+    flow_file: str
+    output_file: str
+    error: str | None = None
+    written_files: list[str] = field(default_factory=list)
+
+
+# the probability database and options of a batch worker process, set once by _init_batch_worker
+_worker_probability_db: weights.ProbabilityDatabase | None = None
+_worker_options: ConversionOptions | None = None
+
+
+def _init_batch_worker(
+    probability_db: weights.ProbabilityDatabase,
+    options: ConversionOptions,
+    recorders: list[stages.StageRecorder] | None = None,
+) -> None:
+    """
+    Store the probability database in a batch worker so it is only sent once per process.
+
+    Args:
+        probability_db (weights.ProbabilityDatabase): The probability database shared by the batch.
+        options (ConversionOptions): The conversion options shared by the batch.
+        recorders (list[stages.StageRecorder] | None): Stage recorders to install in a worker process, replacing any it inherited.
+    """
+    global _worker_probability_db, _worker_options
+    _worker_probability_db = probability_db
+    _worker_options = options
+    if recorders is not None:
+        stages.install_only(recorders)
+
+
+def _convert_batch_item(flow_file: str, output_file: str) -> BatchResult:
+    """
+    Convert one flow file of a batch, capturing any failure in the result.
+
+    Args:
+        flow_file (str): The ATT&CK Flow export to read.
+        output_file (str): Where to write the Hugin net file.
+
+    Returns:
+        BatchResult: The outcome of the conversion.
+    """
+    assert _worker_probability_db is not None
+    try:
+        with stages.labelled(flow_file=flow_file):
+            written_files = convert_flow_file(
+                flow_file, output_file, _worker_probability_db, _worker_options
+            )
+    except Exception as error:
+        # one broken export must not abort the rest of the batch
+        return BatchResult(flow_file, output_file, f"{type(error).__name__}: {error}")
+    return BatchResult(flow_file, output_file, written_files=written_files)
+
+
+def convert_flow_directory(
+    flow_dir: str,
+    output_dir: str,
+    probability_db: weights.ProbabilityDatabase,
+    flow_glob: str = "*.json",
+    jobs: int = 1,
+    options: ConversionOptions | None = None,
+) -> list[BatchResult]:
+    """
+    Convert every ATT&CK Flow export in a directory, sharing one probability database.
+
+    Args:
+        flow_dir (str): The directory containing the flow exports.
+        output_dir (str): The directory to write the Hugin net files to.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+        flow_glob (str): Which files in the directory to convert.
+        jobs (int): The number of worker processes, 1 converts in this process.
+        options (ConversionOptions | None): How to build the networks, defaults to ConversionOptions().
+
+    Returns:
+        list[BatchResult]: The outcome for each flow file, in file name order.
+    """
+    options = options or ConversionOptions()
+    os.makedirs(output_dir, exist_ok=True)
+    work = [
+        (str(flow_path), os.path.join(output_dir, f"{flow_path.stem}.net"))
+        for flow_path in sorted(Path(flow_dir).glob(flow_glob))
+        if flow_path.is_file()
+    ]
+    if jobs == 1 or len(work) <= 1:
+        _init_batch_worker(probability_db, options)
+        return [_convert_batch_item(*item) for item in work]
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(work)),
+        initializer=_init_batch_worker,
+        initargs=(probability_db, options, stages.installed()),
+    ) as executor:
+        futures = [executor.submit(_convert_batch_item, *item) for item in work]
+        results = []
+        for (flow_file, output_file), future in zip(work, futures):
+            try:
+                results.append(future.result())
+            except Exception as error:
+                # e.g. a worker process that died
+                results.append(
+                    BatchResult(
+                        flow_file, output_file, f"{type(error).__name__}: {error}"
+                    )
+                )
+        return results
 
 
 def main() -> None:
@@ -314,22 +1193,264 @@ def main() -> None:
     Main function of the program.
     """
     args = parse_args()
+    recorders: list[stages.StageRecorder] = []
+    if args.profile is not None:
+        from instrumentation import profiling
+
+        # installed first so it starts before and stops after the metrics, which do not count its writing
+        recorders.append(profiling.ProfileRecorder(args.profile))
+    if args.metrics is not None:
+        from instrumentation import metrics
+
+        recorders.append(
+            metrics.MetricsRecorder(
+                args.metrics,
+                {
+                    "attack_stix": args.attack_stix
+                    and os.path.basename(args.attack_stix),
+                    "attack_release": args.attack_release,
+                },
+            )
+        )
+    for recorder in recorders:
+        stages.install(recorder)
+    try:
+        run(args)
+    finally:
+        for recorder in recorders:
+            stages.uninstall(recorder)
+            recorder.close()
+
+
+def load_probabilities(args: argparse.Namespace) -> weights.ProbabilityDatabase:
+    """
+    Load the ATT&CK probabilities selected on the command line.
+
+    With --attack_release they come from the release store in the cache directory, after storing the
+    --attack_stix bundle under that name if one is given. Otherwise they are computed from --attack_stix,
+    or read from the probability cache. Either way techniques roll up as --technique_rollup says.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        weights.ProbabilityDatabase: The probability database.
+    """
+    if args.attack_release is None:
+        probability_db = cache.load_probability_database(
+            args.attack_stix,
+            None if args.no_cache else args.cache_dir,
+            args.attack_loader,
+            args.estimator,
+        )
+    else:
+        from stix_probability import releases
+
+        store = releases.ReleaseStore(args.cache_dir / "releases")
+        if args.attack_stix is not None:
+            diff = store.add(args.attack_release, args.attack_stix)
+            if diff is not None:
+                changes = (
+                    f", {len(diff.techniques_changed)} techniques changed since {diff.base}"
+                    if diff.base is not None
+                    else ""
+                )
+                print(f"Stored ATT&CK release {diff.release}{changes}", file=sys.stderr)
+        probability_db = store.load(args.attack_release)
+    probability_db.technique_rollup = args.technique_rollup
+    return probability_db
+
+
+def run(args: argparse.Namespace) -> None:
+    """
+    Run the mode selected on the command line.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    options = ConversionOptions(
+        max_fan_in=args.max_fan_in, layout=not args.no_layout, strict=args.strict_flow
+    )
+    query_options = QueryOptions(
+        args.query_engine, args.precision, args.max_samples, args.seed, args.jobs
+    )
+    if args.serve:
+        from flow_service import server
+
+        probability_db = load_probabilities(args)
+        # the workers already run in parallel, each samples in its own process
+        query_options.jobs = 1
+        server.run_service(
+            probability_db,
+            options,
+            query_options,
+            args.host,
+            args.port,
+            args.jobs,
+            args.max_pending,
+        )
+        return
+    if args.flow_dir is not None:
+        probability_db = load_probabilities(args)
+        results = convert_flow_directory(
+            args.flow_dir,
+            args.output_dir or args.flow_dir,
+            probability_db,
+            args.flow_glob,
+            args.jobs,
+            options,
+        )
+        failures = [result for result in results if result.error is not None]
+        for result in results:
+            if result.error is None:
+                print(f"OK     {result.flow_file} -> {', '.join(result.written_files)}")
+            else:
+                print(f"FAILED {result.flow_file}: {result.error}")
+        print(f"Converted {len(results) - len(failures)} of {len(results)} flow files")
+        if failures:
+            sys.exit(1)
+        return
+    if args.compiled is not None:
+        run_compiled(args, query_options)
+        return
     # print_flow(args.flow_file)
-    flow_bundle: stix2.Bundle = read_flow_file(args.flow_file)
-    flows = flow.get_flows_from_stix_bundle(flow_bundle)
-    # technically there can be multiple attack flows in a stix bundle but I am too lazy to deal with that
-    if len(flows) != 1:
-        raise ValueError("Expected exactly one attack flow in the file.")
-    attack_data = MitreAttackData(args.attack_stix)
-    probability_db = weights.ProbabilityDatabase(attack_data)
-    flow_nx = convert_attack_flow_to_nx(flows[0], flow_bundle)
-    flow_nx = make_nx_graph_more_readable(flow_nx)
-    bayesian_network = flow_nx_to_pgmpy(flow_nx, probability_db)
-
-    content = pgmpy_to_unbbayes_hugin(bayesian_network)
-    with open(args.output_file, "w", encoding="utf-8") as file:
-        file.write(content)
-    print("New bayesian network written to", args.output_file)
+    probability_db = load_probabilities(args)
+    if args.watch:
+        from flow_service import watch
+
+        with stages.labelled(flow_file=args.flow_file):
+            watch.run_watch(
+                args.flow_file,
+                args.output_file,
+                probability_db,
+                options,
+                args.watch_interval,
+            )
+        return
+    with stages.labelled(flow_file=args.flow_file):
+        run_flow_file(args, options, query_options, probability_db)
+
+
+def run_compiled(args: argparse.Namespace, query_options: QueryOptions) -> None:
+    """
+    Write the Hugin net file of, query or rank the mitigations of the network saved in --compiled.
+
+    The network is mapped from the file rather than converted again, so only mitigation ranking, which needs
+    the mitigations of each technique, loads the ATT&CK probabilities.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+        query_options (QueryOptions): How to compute posterior probabilities.
+    """
+    compiled = artifact.CompiledArtifact(args.compiled)
+    json_mode = args.query is not None or args.rank_mitigations
+    with stages.labelled(compiled=args.compiled, flow=compiled.attack_flow.id):
+        if args.output_file is not None:
+            with stages.stage("write_net") as counts:
+                counts.update(stages.flow_counts(compiled.network.flow))
+                with open(args.output_file, "w", encoding="utf-8") as file:
+                    compiled.write_net(file)
+                    counts["bytes"] = file.tell()
+            # stdout is reserved for the JSON so it can be piped
+            print(
+                "New bayesian network written to",
+                args.output_file,
+                file=sys.stderr if json_mode else sys.stdout,
+            )
+        if not json_mode:
+            return
+        networks = [(compiled.attack_flow, compiled.network)]
+        if args.rank_mitigations:
+            results = rank_flow_mitigations(
+                networks, load_probabilities(args), args.mitigation_efficacy
+            )
+        else:
+            results = query_flow_networks(
+                networks, args.query or None, args.evidence, query_options
+            )
+    print(json.dumps(results, indent=2))
+
+
+def format_technique_coverage(coverage: dict[str, int]) -> str:
+    """
+    Describe how the techniques of a flow's actions were found in the probability database.
+
+    Args:
+        coverage (dict[str, int]): The number of actions at each resolution level, see compact.technique_coverage.
+
+    Returns:
+        str: E.g. "12 actions: 10 by STIX id, 1 by ATT&CK ID, 0 by parent technique, 1 unresolved, 0 without technique".
+    """
+    return (
+        f"{sum(coverage.values())} actions: "
+        f"{coverage[weights.RESOLVED_STIX_ID]} by STIX id, "
+        f"{coverage[weights.RESOLVED_EXTERNAL_ID]} by ATT&CK ID, "
+        f"{coverage[weights.RESOLVED_PARENT]} by parent technique, "
+        f"{coverage[weights.UNRESOLVED]} unresolved, "
+        f"{coverage[weights.NO_TECHNIQUE]} without technique"
+    )
+
+
+def run_flow_file(
+    args: argparse.Namespace,
+    options: ConversionOptions,
+    query_options: QueryOptions,
+    probability_db: weights.ProbabilityDatabase,
+) -> None:
+    """
+    Convert, query or rank the mitigations of the flows in --flow_file.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+        options (ConversionOptions): How to build the networks.
+        query_options (QueryOptions): How to compute posterior probabilities.
+        probability_db (weights.ProbabilityDatabase): The probability database containing the ATT&CK probabilities.
+    """
+    compact_flows = build_compact_flows(args.flow_file, options)
+    for attack_flow, compact_flow in compact_flows:
+        coverage = compact.technique_coverage(compact_flow, probability_db)
+        print(
+            f"Techniques of {attack_flow.get('name') or attack_flow.id}: {format_technique_coverage(coverage)}",
+            file=sys.stderr,
+        )
+    if args.compile_to is not None:
+        for compiled_file in write_compiled_flows(
+            compact_flows, probability_db, args.compile_to, describe_attack_data(args)
+        ):
+            print("Compiled network written to", compiled_file, file=sys.stderr)
+    if args.query is not None or args.rank_mitigations:
+        # stdout is reserved for the JSON so it can be piped
+        if args.output_file is not None:
+            for output_file in write_compact_flows(
+                compact_flows, probability_db, args.output_file
+            ):
+                print("New bayesian network written to", output_file, file=sys.stderr)
+        networks = []
+        for attack_flow, compact_flow in compact_flows:
+            with stages.labelled(flow=attack_flow.id):
+                networks.append(
+                    (
+                        attack_flow,
+                        assembly.assemble_network(
+                            compact_flow,
+                            compact.node_probabilities(compact_flow, probability_db),
+                        ),
+                    )
+                )
+        if args.rank_mitigations:
+            results = rank_flow_mitigations(
+                networks, probability_db, args.mitigation_efficacy
+            )
+        else:
+            results = query_flow_networks(
+                networks, args.query or None, args.evidence, query_options
+            )
+        print(json.dumps(results, indent=2))
+        return
+    for output_file in write_compact_flows(
+        compact_flows, probability_db, args.output_file
+    ):
+        print("New bayesian network written to", output_file)
     print("The network can be loaded into Hugin or Unbbayes")
     print("Thanks for using the program!")
 
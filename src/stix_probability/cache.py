@@ -0,0 +1,270 @@
+"""
+On-disk cache for the probability mappings and mitigations computed by ProbabilityDatabase.
+
+Computing the probabilities means parsing the whole ATT&CK STIX bundle, which takes most of the
+runtime of a conversion. The computed database is small, so it is persisted as JSON under a key made
+of the SHA-256 of the bundle file, the probability model version and the estimator. A new ATT&CK release or a
+change in how the probabilities are derived produces a different key, so stale entries are never read.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+from instrumentation import stages
+from stix_probability import incidence
+from stix_probability.loader import load_attack_records, mitigations_from_attack_records
+from stix_probability.weights import (
+    PROBABILITY_MODEL_VERSION,
+    Mitigation,
+    ProbabilityDatabase,
+    StixId,
+    TechniqueProbability,
+)
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+# "streaming" reads only the records needed for the probabilities, "mitreattack" builds the full MitreAttackData
+ATTACK_LOADERS = ("streaming", "mitreattack")
+
+
+def default_cache_dir() -> Path:
+    """
+    Get the default directory for cached probability mappings.
+
+    Returns:
+        Path: $XDG_CACHE_HOME/attack-risk, falling back to ~/.cache/attack-risk.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return Path(base) / "attack-risk"
+
+
+def hash_attack_bundle(attack_stix_path: str) -> str:
+    """
+    Compute the content hash of an ATT&CK STIX bundle file.
+
+    Args:
+        attack_stix_path (str): Path to the ATT&CK STIX bundle.
+
+    Returns:
+        str: The hex encoded SHA-256 digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(attack_stix_path, "rb") as file:
+        for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(
+    attack_stix_path: str, estimator: str = incidence.DEFAULT_ESTIMATOR
+) -> str:
+    """
+    Get the cache key for an ATT&CK STIX bundle under the current probability model.
+
+    Args:
+        attack_stix_path (str): Path to the ATT&CK STIX bundle.
+        estimator (str): The probability estimator, one of incidence.ESTIMATORS.
+
+    Returns:
+        str: The cache key.
+    """
+    key = f"{hash_attack_bundle(attack_stix_path)}-model{PROBABILITY_MODEL_VERSION}"
+    # entries of the original estimator keep the key they had before there was a choice
+    return key if estimator == incidence.DEFAULT_ESTIMATOR else f"{key}-{estimator}"
+
+
+def database_to_data(probability_db: ProbabilityDatabase) -> dict[str, Any]:
+    """
+    Convert a probability database to JSON-ready data, see database_from_data.
+
+    Args:
+        probability_db (ProbabilityDatabase): The database.
+
+    Returns:
+        dict[str, Any]: The model version, techniques and mitigations.
+    """
+    return {
+        "model_version": PROBABILITY_MODEL_VERSION,
+        "techniques": [
+            asdict(technique)
+            for technique in probability_db.probability_mapping.values()
+        ],
+        "mitigations": [
+            asdict(mitigation) for mitigation in probability_db.mitigations.values()
+        ],
+    }
+
+
+def database_from_data(data: dict[str, Any]) -> ProbabilityDatabase:
+    """
+    Rebuild a probability database from the data of database_to_data.
+
+    Args:
+        data (dict[str, Any]): The decoded data.
+
+    Returns:
+        ProbabilityDatabase: The database.
+
+    Raises:
+        KeyError: If a field is missing.
+    """
+    probability_mapping = {
+        StixId(entry["stix_id"]): TechniqueProbability(
+            entry["name"],
+            entry["ttp"],
+            entry["count"],
+            entry["probability"],
+            StixId(entry["stix_id"]),
+        )
+        for entry in data["techniques"]
+    }
+    mitigations = {
+        entry["stix_id"]: Mitigation(
+            entry["name"],
+            entry["mitigation_id"],
+            entry["stix_id"],
+            [StixId(technique) for technique in entry["techniques"]],
+        )
+        for entry in data["mitigations"]
+    }
+    return ProbabilityDatabase(
+        probability_mapping=probability_mapping, mitigations=mitigations
+    )
+
+
+def read_cached_database(cache_file: Path) -> ProbabilityDatabase | None:
+    """
+    Read a cached probability database.
+
+    Args:
+        cache_file (Path): The cache entry to read.
+
+    Returns:
+        ProbabilityDatabase | None: The database, or None if the entry is missing or unreadable.
+    """
+    try:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        if data["model_version"] != PROBABILITY_MODEL_VERSION:
+            return None
+        return database_from_data(data)
+    except (OSError, ValueError, KeyError, TypeError):
+        # a missing or corrupt entry is just a cache miss
+        return None
+
+
+def write_cached_database(
+    cache_file: Path, probability_db: ProbabilityDatabase
+) -> None:
+    """
+    Atomically write a probability database to the cache.
+
+    Args:
+        cache_file (Path): The cache entry to write.
+        probability_db (ProbabilityDatabase): The database to persist.
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    data = database_to_data(probability_db)
+    # write to a temporary file first so a concurrent reader never sees a partial entry
+    temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    with open(temp_file, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(temp_file, cache_file)
+
+
+def compute_probability_database(
+    attack_stix_path: str,
+    attack_loader: str = "streaming",
+    estimator: str = incidence.DEFAULT_ESTIMATOR,
+) -> ProbabilityDatabase:
+    """
+    Compute the probability database for an ATT&CK STIX bundle without looking at the cache.
+
+    Args:
+        attack_stix_path (str): Path to the ATT&CK STIX bundle.
+        attack_loader (str): One of ATTACK_LOADERS.
+        estimator (str): The probability estimator, one of incidence.ESTIMATORS. The mitreattack loader only
+            implements the default one.
+
+    Returns:
+        ProbabilityDatabase: The probability database for the bundle.
+
+    Raises:
+        ValueError: If the loader or estimator is unknown, or the loader does not implement the estimator.
+    """
+    if estimator not in incidence.ESTIMATORS:
+        raise ValueError(f"Unknown probability estimator {estimator}")
+    if attack_loader == "streaming":
+        with stages.stage("attack_load") as counts:
+            records = load_attack_records(attack_stix_path)
+            counts["attack_patterns"] = len(records.attack_patterns)
+        with stages.stage("probability_database") as counts:
+            matrix = incidence.IncidenceMatrix.from_attack_records(records)
+            probability_db = ProbabilityDatabase(
+                probability_mapping=incidence.estimate_probabilities(matrix, estimator),
+                mitigations=mitigations_from_attack_records(records),
+            )
+            counts["techniques"] = len(probability_db.probability_mapping)
+        return probability_db
+    if attack_loader == "mitreattack":
+        if estimator != incidence.DEFAULT_ESTIMATOR:
+            raise ValueError(
+                f"The mitreattack loader only implements the {incidence.DEFAULT_ESTIMATOR} estimator"
+            )
+        from mitreattack.stix20 import MitreAttackData
+
+        with stages.stage("attack_load"):
+            attack_data = MitreAttackData(attack_stix_path)
+        with stages.stage("probability_database") as counts:
+            probability_db = ProbabilityDatabase(attack_data)
+            counts["techniques"] = len(probability_db.probability_mapping)
+        return probability_db
+    raise ValueError(f"Unknown ATT&CK loader {attack_loader}")
+
+
+def load_probability_database(
+    attack_stix_path: str,
+    cache_dir: Path | None = None,
+    attack_loader: str = "streaming",
+    estimator: str = incidence.DEFAULT_ESTIMATOR,
+) -> ProbabilityDatabase:
+    """
+    Load the probability database for an ATT&CK STIX bundle, using the on-disk cache when possible.
+
+    Args:
+        attack_stix_path (str): Path to the ATT&CK STIX bundle.
+        cache_dir (Path | None): Directory holding the cache entries, or None to disable caching.
+        attack_loader (str): How to read the bundle on a cache miss, one of ATTACK_LOADERS.
+        estimator (str): The probability estimator, one of incidence.ESTIMATORS.
+
+    Returns:
+        ProbabilityDatabase: The probability database for the bundle.
+    """
+    if cache_dir is None:
+        return compute_probability_database(attack_stix_path, attack_loader, estimator)
+    with stages.stage("hash_attack_bundle"):
+        cache_file = cache_dir / f"{cache_key(attack_stix_path, estimator)}.json"
+    with stages.stage("read_probability_cache") as counts:
+        cached_db = read_cached_database(cache_file)
+        counts["hit"] = cached_db is not None
+    if cached_db is not None:
+        return cached_db
+    probability_db = compute_probability_database(
+        attack_stix_path, attack_loader, estimator
+    )
+    try:
+        with stages.stage("write_probability_cache"):
+            write_cached_database(cache_file, probability_db)
+    except OSError as error:
+        # not being able to cache is not a reason to fail the conversion
+        print(
+            f"Could not write probability cache {cache_file}: {error}", file=sys.stderr
+        )
+    return probability_db
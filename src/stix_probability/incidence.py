@@ -0,0 +1,367 @@
+"""
+Sparse technique x actor incidence matrix of an ATT&CK release, and the probability estimators built on it.
+
+ATT&CK says which campaigns, groups (intrusion sets) and software use which techniques. IncidenceMatrix
+holds that once, as flat arrays: one row per attack pattern, one column per actor, and one entry per
+(technique, actor) pair with the number of "uses" relationships between them, in coordinate form like the
+edges of compact.FlowStructure. What each actor is (campaign, group or software), whether it is active and
+when it was last seen are one array each.
+
+An estimator turns the matrix into a probability per technique with a few array operations over the entries,
+typically a weighted np.bincount over the rows, instead of another walk over the STIX objects:
+
+    campaign-frequency  active campaigns using the technique over all campaigns (the original model)
+    laplace             campaign counts with add-one smoothing, so techniques no campaign uses get a small
+                        probability from the data instead of the 0.01 fallback
+    group-frequency     active groups using the technique over all active groups
+    recency             campaign counts weighted by how recently each campaign was seen, halving every
+                        RECENCY_HALF_LIFE years before the most recent campaign
+
+to_polars exposes the entries as a Polars frame for ad hoc analysis.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, List
+
+import numpy as np
+
+from stix_probability.loader import AttackRecords, CampaignRecord
+from stix_probability.weights import StixId, TechniqueProbability
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# actor kinds
+ACTOR_CAMPAIGN = 0
+ACTOR_GROUP = 1
+ACTOR_SOFTWARE = 2
+ACTOR_KIND_NAMES = ("campaign", "group", "software")
+
+# years after which a campaign counts half as much in the recency estimator
+RECENCY_HALF_LIFE = 3.0
+
+# the pseudo-count added to both outcomes by the laplace estimator
+LAPLACE_ALPHA = 1.0
+
+DEFAULT_ESTIMATOR = "campaign-frequency"
+
+
+def _year(date: str | None) -> float:
+    """
+    Convert an ISO date to a fractional year, NaN if unknown.
+    """
+    if not date or len(date) < 7 or not date[:4].isdigit() or not date[5:7].isdigit():
+        return float("nan")
+    return int(date[:4]) + (int(date[5:7]) - 1) / 12
+
+
+@dataclass(eq=False)
+class IncidenceMatrix:
+    """
+    Which actors use which techniques, see the module docstring.
+
+    Attributes:
+        technique_ids (list[StixId]): The STIX id of every attack pattern, rows are indices into this list.
+        technique_names (list[str]): The name of every attack pattern.
+        external_ids (list[str | None]): The ATT&CK ID of every attack pattern, None without one.
+        actor_ids (list[str]): The STIX id of every actor, columns are indices into this list.
+        actor_kinds (np.ndarray): The kind of each actor, one of the ACTOR_ constants.
+        actor_active (np.ndarray): Whether each actor is in the bundle and neither revoked nor deprecated.
+        actor_present (np.ndarray): Whether each actor is in the bundle, relationships can name missing ones.
+        actor_last_seen (np.ndarray): When each actor was last seen as a fractional year, NaN if unknown.
+        rows (np.ndarray): The technique of every entry.
+        columns (np.ndarray): The actor of every entry.
+        uses (np.ndarray): The number of "uses" relationships of every entry.
+    """
+
+    technique_ids: List[StixId]
+    technique_names: List[str]
+    external_ids: List[str | None]
+    actor_ids: List[str]
+    actor_kinds: np.ndarray
+    actor_active: np.ndarray
+    actor_present: np.ndarray
+    actor_last_seen: np.ndarray
+    rows: np.ndarray
+    columns: np.ndarray
+    uses: np.ndarray
+
+    @classmethod
+    def from_attack_records(cls, records: AttackRecords) -> "IncidenceMatrix":
+        """
+        Build the matrix from the records of an ATT&CK bundle.
+
+        Args:
+            records (AttackRecords): The records, see loader.load_attack_records.
+
+        Returns:
+            IncidenceMatrix: The matrix.
+
+        Raises:
+            ValueError: If a campaign "uses" relationship targets an attack pattern missing from the bundle.
+        """
+        technique_index = {
+            stix_id: row for row, stix_id in enumerate(records.attack_patterns)
+        }
+        patterns = list(records.attack_patterns.values())
+        actor_index: dict[str, int] = {}
+        actors: list[CampaignRecord | None] = []
+        kinds: list[int] = []
+        rows: list[int] = []
+        columns: list[int] = []
+        for kind, known, relationships in (
+            (ACTOR_CAMPAIGN, records.campaigns, records.campaign_uses),
+            (ACTOR_GROUP, records.groups, records.group_uses),
+            (ACTOR_SOFTWARE, records.software, records.software_uses),
+        ):
+            # every actor of the bundle gets a column, used or not, as it counts in the totals
+            for stix_id in [*known, *(actor for actor, _ in relationships)]:
+                if stix_id not in actor_index:
+                    actor_index[stix_id] = len(actors)
+                    actors.append(known.get(stix_id))
+                    kinds.append(kind)
+            for actor, attack_pattern in relationships:
+                row = technique_index.get(attack_pattern)
+                if row is None:
+                    if kind == ACTOR_CAMPAIGN:
+                        raise ValueError(f"{attack_pattern} not found")
+                    continue
+                rows.append(row)
+                columns.append(actor_index[actor])
+        pairs, uses = np.unique(
+            np.array([rows, columns], dtype=np.int64).reshape(2, -1),
+            axis=1,
+            return_counts=True,
+        )
+        return cls(
+            list(records.attack_patterns),
+            [pattern.name for pattern in patterns],
+            [pattern.external_id for pattern in patterns],
+            list(actor_index),
+            np.array(kinds, dtype=np.uint8),
+            np.array(
+                [actor is not None and actor.active for actor in actors], dtype=bool
+            ),
+            np.array([actor is not None for actor in actors], dtype=bool),
+            np.array(
+                [_year(actor.last_seen if actor else None) for actor in actors],
+                dtype=np.float64,
+            ),
+            pairs[0].astype(np.int32),
+            pairs[1].astype(np.int32),
+            uses.astype(np.int32),
+        )
+
+    @property
+    def num_techniques(self) -> int:
+        """
+        The number of rows.
+        """
+        return len(self.technique_ids)
+
+    @property
+    def num_actors(self) -> int:
+        """
+        The number of columns.
+        """
+        return len(self.actor_ids)
+
+    def row_sums(self, actor_weights: np.ndarray, per_use: bool = True) -> np.ndarray:
+        """
+        Sum a weight per actor over the actors using each technique.
+
+        Args:
+            actor_weights (np.ndarray): The weight of every actor, 0 for the actors to leave out.
+            per_use (bool): Whether an actor counts once per "uses" relationship or once per technique.
+
+        Returns:
+            np.ndarray: The sum of every row.
+        """
+        entry_weights = actor_weights[self.columns]
+        if per_use:
+            entry_weights = entry_weights * self.uses
+        return np.bincount(
+            self.rows, weights=entry_weights, minlength=self.num_techniques
+        )
+
+    def used_by(self, kind: int) -> np.ndarray:
+        """
+        Get which techniques a "uses" relationship of an actor of a kind targets, active or not.
+
+        Args:
+            kind (int): One of the ACTOR_ constants.
+
+        Returns:
+            np.ndarray: One boolean per technique.
+        """
+        return self.row_sums((self.actor_kinds == kind).astype(np.float64)) > 0
+
+    def to_polars(self) -> pl.DataFrame:
+        """
+        Get the entries of the matrix as a Polars frame, one row per technique and actor using it.
+
+        Returns:
+            pl.DataFrame: technique_id, external_id, actor_id, actor_kind, active, last_seen and uses columns.
+        """
+        import polars as pl
+
+        return pl.DataFrame(
+            {
+                "technique_id": np.array(self.technique_ids, dtype=object)[self.rows],
+                "external_id": np.array(self.external_ids, dtype=object)[self.rows],
+                "actor_id": np.array(self.actor_ids, dtype=object)[self.columns],
+                "actor_kind": np.array(ACTOR_KIND_NAMES, dtype=object)[
+                    self.actor_kinds[self.columns]
+                ],
+                "active": self.actor_active[self.columns],
+                "last_seen": self.actor_last_seen[self.columns],
+                "uses": self.uses,
+            },
+            schema={
+                "technique_id": pl.Utf8,
+                "external_id": pl.Utf8,
+                "actor_id": pl.Utf8,
+                "actor_kind": pl.Utf8,
+                "active": pl.Boolean,
+                "last_seen": pl.Float64,
+                "uses": pl.Int32,
+            },
+        )
+
+
+# an estimator gives the count and probability of every technique, NaN for the ones it has no value for
+Estimator = Callable[[IncidenceMatrix], tuple[np.ndarray, np.ndarray]]
+
+
+def _active(matrix: IncidenceMatrix, kind: int) -> np.ndarray:
+    """
+    Weight 1 for the active actors of a kind, 0 for the others.
+    """
+    return np.asarray(
+        (matrix.actor_kinds == kind) & matrix.actor_active, dtype=np.float64
+    )
+
+
+def campaign_frequency(matrix: IncidenceMatrix) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The original model: the active campaigns using a technique over the number of campaigns, revoked ones
+    included, for the techniques some campaign uses.
+
+    Args:
+        matrix (IncidenceMatrix): The incidence matrix.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The count and probability of every technique.
+    """
+    counts = matrix.row_sums(_active(matrix, ACTOR_CAMPAIGN))
+    total = np.count_nonzero(
+        (matrix.actor_kinds == ACTOR_CAMPAIGN) & matrix.actor_present
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = counts / total
+    return counts, np.where(matrix.used_by(ACTOR_CAMPAIGN), probabilities, np.nan)
+
+
+def laplace(
+    matrix: IncidenceMatrix, alpha: float = LAPLACE_ALPHA
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Campaign counts with additive smoothing, (count + alpha) / (active campaigns + 2 alpha), for every technique.
+
+    Args:
+        matrix (IncidenceMatrix): The incidence matrix.
+        alpha (float): The pseudo-count.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The count and probability of every technique.
+    """
+    weights = _active(matrix, ACTOR_CAMPAIGN)
+    counts = matrix.row_sums(weights, per_use=False)
+    return counts, (counts + alpha) / (weights.sum() + 2 * alpha)
+
+
+def group_frequency(matrix: IncidenceMatrix) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The active groups using a technique over the number of active groups, for the techniques some group uses.
+
+    Args:
+        matrix (IncidenceMatrix): The incidence matrix.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The count and probability of every technique.
+    """
+    weights = _active(matrix, ACTOR_GROUP)
+    counts = matrix.row_sums(weights, per_use=False)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = counts / weights.sum()
+    return counts, np.where(matrix.used_by(ACTOR_GROUP), probabilities, np.nan)
+
+
+def recency(
+    matrix: IncidenceMatrix, half_life: float = RECENCY_HALF_LIFE
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Campaign frequency with every active campaign weighted by 2 ** -(years before the most recent campaign /
+    half_life), for the techniques some campaign uses. Campaigns without a date count as the oldest one.
+
+    Args:
+        matrix (IncidenceMatrix): The incidence matrix.
+        half_life (float): The years after which a campaign counts half as much.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The count and probability of every technique.
+    """
+    active = _active(matrix, ACTOR_CAMPAIGN)
+    seen = np.where(active > 0, matrix.actor_last_seen, np.nan)
+    if np.all(np.isnan(seen)):
+        return campaign_frequency(matrix)
+    seen = np.where(np.isnan(seen), np.nanmin(seen), seen)
+    weights = active * np.exp2(-(np.nanmax(seen) - seen) / half_life)
+    counts = matrix.row_sums(active, per_use=False)
+    probabilities = matrix.row_sums(weights, per_use=False) / weights.sum()
+    return counts, np.where(matrix.used_by(ACTOR_CAMPAIGN), probabilities, np.nan)
+
+
+ESTIMATORS: dict[str, Estimator] = {
+    "campaign-frequency": campaign_frequency,
+    "laplace": laplace,
+    "group-frequency": group_frequency,
+    "recency": recency,
+}
+
+
+def estimate_probabilities(
+    matrix: IncidenceMatrix, estimator: str = DEFAULT_ESTIMATOR
+) -> dict[StixId, TechniqueProbability]:
+    """
+    Estimate the probability of every technique with an ATT&CK ID.
+
+    Args:
+        matrix (IncidenceMatrix): The incidence matrix.
+        estimator (str): One of ESTIMATORS.
+
+    Returns:
+        dict[StixId, TechniqueProbability]: The techniques the estimator has a value for, by STIX id.
+
+    Raises:
+        ValueError: If the estimator is unknown.
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown probability estimator {estimator}")
+    counts, probabilities = ESTIMATORS[estimator](matrix)
+    techniques: dict[StixId, TechniqueProbability] = {}
+    for row in np.flatnonzero(~np.isnan(probabilities)).tolist():
+        external_id = matrix.external_ids[row]
+        if external_id is None:
+            continue  # no ATT&CK reference, same as MitreAttackData
+        technique_id = matrix.technique_ids[row]
+        techniques[technique_id] = TechniqueProbability(
+            matrix.technique_names[row],
+            external_id,
+            int(counts[row]),
+            float(probabilities[row]),
+            technique_id,
+        )
+    return techniques
@@ -0,0 +1,401 @@
+"""
+Lean, streaming loader for the parts of an ATT&CK STIX bundle needed to compute technique probabilities.
+
+MitreAttackData builds stix2 objects and an in-memory store for every object in the bundle, which is
+far more than ProbabilityDatabase needs. This loader makes a single pass over the bundle JSON, decoding
+one object at a time, and keeps compact records for only attack-patterns, the campaigns, groups and software
+using them and their "uses" relationships. Everything else is discarded as soon as it is decoded,
+so peak memory stays close to the size of the kept records instead of the size of the bundle.
+
+The filtering mirrors MitreAttackData.get_all_campaigns_using_all_techniques and get_campaigns, so the
+probabilities computed from these records are the same as the ones computed from MitreAttackData. The
+course-of-action -> attack-pattern "mitigates" relationships are kept as well, to rank mitigations.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Iterator, TextIO
+
+from stix_probability.weights import Mitigation, StixId, TechniqueProbability
+
+_READ_CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\n\r"
+
+
+@dataclass(slots=True, frozen=True)
+class AttackPatternRecord:
+    """
+    The fields of an ATT&CK attack-pattern needed to compute its probability.
+
+    Attributes:
+        stix_id (StixId): The STIX identifier of the attack pattern.
+        name (str): The name of the technique.
+        external_id (str | None): The ATT&CK ID (e.g. T1059.001) from the mitre-attack external reference.
+        active (bool): False if the attack pattern is revoked or deprecated.
+    """
+
+    stix_id: StixId
+    name: str
+    external_id: str | None
+    active: bool = True
+
+
+@dataclass(slots=True, frozen=True)
+class CampaignRecord:
+    """
+    The fields of an ATT&CK campaign, group or software needed to compute technique probabilities.
+
+    Attributes:
+        stix_id (str): The STIX identifier of the campaign.
+        name (str): The name of the campaign.
+        active (bool): False if the campaign is revoked or deprecated.
+        last_seen (str | None): When it was last seen, or last modified if that is not known, as an ISO date.
+    """
+
+    stix_id: str
+    name: str
+    active: bool
+    last_seen: str | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class CourseOfActionRecord:
+    """
+    The fields of an ATT&CK course-of-action needed to rank mitigations.
+
+    Attributes:
+        stix_id (str): The STIX identifier of the course-of-action.
+        name (str): The name of the mitigation.
+        external_id (str | None): The ATT&CK ID (e.g. M1038) from the mitre-attack external reference.
+        active (bool): False if the course-of-action is revoked or deprecated.
+    """
+
+    stix_id: str
+    name: str
+    external_id: str | None
+    active: bool
+
+
+@dataclass
+class AttackRecords:
+    """
+    Compact view of an ATT&CK bundle holding only what the probability computation needs.
+
+    Attributes:
+        attack_patterns (dict[StixId, AttackPatternRecord]): Attack patterns by STIX id.
+        campaigns (dict[str, CampaignRecord]): Campaigns by STIX id, including revoked and deprecated ones.
+        campaign_uses (list[tuple[str, StixId]]): (campaign id, attack pattern id) for every active "uses" relationship.
+        groups (dict[str, CampaignRecord]): Groups (intrusion sets) by STIX id.
+        group_uses (list[tuple[str, StixId]]): (group id, attack pattern id) for every active "uses" relationship.
+        software (dict[str, CampaignRecord]): Malware and tools by STIX id.
+        software_uses (list[tuple[str, StixId]]): (software id, attack pattern id) for every active "uses"
+            relationship.
+        courses_of_action (dict[str, CourseOfActionRecord]): Courses of action by STIX id.
+        mitigates (list[tuple[str, StixId]]): (course-of-action id, attack pattern id) for every active "mitigates" relationship.
+    """
+
+    attack_patterns: dict[StixId, AttackPatternRecord] = field(default_factory=dict)
+    campaigns: dict[str, CampaignRecord] = field(default_factory=dict)
+    campaign_uses: list[tuple[str, StixId]] = field(default_factory=list)
+    groups: dict[str, CampaignRecord] = field(default_factory=dict)
+    group_uses: list[tuple[str, StixId]] = field(default_factory=list)
+    software: dict[str, CampaignRecord] = field(default_factory=dict)
+    software_uses: list[tuple[str, StixId]] = field(default_factory=list)
+    courses_of_action: dict[str, CourseOfActionRecord] = field(default_factory=dict)
+    mitigates: list[tuple[str, StixId]] = field(default_factory=list)
+
+
+def _mitre_attack_id(stix_object: dict[str, Any]) -> str | None:
+    """
+    Get the ATT&CK ID of a STIX object, the last mitre-attack external reference winning like in MitreAttackData.
+
+    Args:
+        stix_object (dict[str, Any]): The decoded STIX object.
+
+    Returns:
+        str | None: The ATT&CK ID, or None without a mitre-attack reference.
+    """
+    external_id = None
+    for reference in stix_object.get("external_references", []):
+        if reference.get("source_name") == "mitre-attack":
+            external_id = reference.get("external_id")
+    return external_id
+
+
+def _is_active(stix_object: dict[str, Any]) -> bool:
+    """
+    Check that a STIX object is neither revoked nor deprecated.
+
+    Args:
+        stix_object (dict[str, Any]): The decoded STIX object.
+
+    Returns:
+        bool: True if the object is active.
+    """
+    return (
+        stix_object.get("x_mitre_deprecated", False) is False
+        and stix_object.get("revoked", False) is False
+    )
+
+
+class _StreamingBundleReader:
+    """
+    Incrementally decodes the top level "objects" array of a STIX bundle from a text stream.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """
+        Read more of the stream into the buffer, dropping what has already been consumed.
+
+        Returns:
+            bool: False if the end of the stream was reached.
+        """
+        if self.eof:
+            return False
+        # grow the read size with the pending data so a single large value is not re-scanned many times
+        pending = len(self.buffer) - self.pos
+        chunk = self.stream.read(max(_READ_CHUNK_SIZE, pending))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it.
+
+        Returns:
+            str: The next non-whitespace character, or "" at the end of the stream.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        """
+        Consume the next non-whitespace character, which must be `char`.
+
+        Args:
+            char (str): The expected character.
+
+        Raises:
+            ValueError: If a different character is found.
+        """
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in STIX bundle, found {found!r}")
+        self.pos += 1
+
+    def _decode_value(self) -> Any:
+        """
+        Decode the next JSON value, reading more of the stream until it is complete.
+
+        Returns:
+            Any: The decoded value.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number cut off by the chunk boundary decodes fine, so make sure the value really ended
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_objects(self) -> Iterator[dict[str, Any]]:
+        """
+        Yield every object of the bundle's "objects" array, one at a time.
+
+        Yields:
+            dict[str, Any]: The decoded STIX objects.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(":")
+            if key == "objects":
+                self._expect("[")
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self._decode_value()
+                        if self._peek() == "]":
+                            self.pos += 1
+                            break
+                        self._expect(",")
+            else:
+                self._decode_value()
+            if self._peek() == "}":
+                return
+            self._expect(",")
+
+
+def iter_bundle_objects(stream: TextIO) -> Iterator[dict[str, Any]]:
+    """
+    Stream the objects of a STIX bundle without decoding the whole document at once.
+
+    Args:
+        stream (TextIO): The bundle JSON.
+
+    Yields:
+        dict[str, Any]: Each object of the bundle in file order.
+    """
+    return _StreamingBundleReader(stream).iter_objects()
+
+
+def load_attack_records(attack_stix_path: str) -> AttackRecords:
+    """
+    Load the compact attack-pattern, campaign and "uses" records from an ATT&CK STIX bundle in one pass.
+
+    Args:
+        attack_stix_path (str): Path to the ATT&CK STIX bundle.
+
+    Returns:
+        AttackRecords: The records needed to compute technique probabilities.
+    """
+    records = AttackRecords()
+    with open(attack_stix_path, "r", encoding="utf-8") as file:
+        for stix_object in iter_bundle_objects(file):
+            object_type = stix_object.get("type")
+            if object_type == "attack-pattern":
+                stix_id = StixId(stix_object["id"])
+                records.attack_patterns[stix_id] = AttackPatternRecord(
+                    stix_id,
+                    stix_object.get("name", ""),
+                    _mitre_attack_id(stix_object),
+                    _is_active(stix_object),
+                )
+            elif object_type in ("campaign", "intrusion-set", "malware", "tool"):
+                actor = CampaignRecord(
+                    stix_object["id"],
+                    stix_object.get("name", ""),
+                    _is_active(stix_object),
+                    stix_object.get("last_seen") or stix_object.get("modified"),
+                )
+                if object_type == "campaign":
+                    records.campaigns[actor.stix_id] = actor
+                elif object_type == "intrusion-set":
+                    records.groups[actor.stix_id] = actor
+                else:
+                    records.software[actor.stix_id] = actor
+            elif object_type == "course-of-action":
+                records.courses_of_action[stix_object["id"]] = CourseOfActionRecord(
+                    stix_object["id"],
+                    stix_object.get("name", ""),
+                    _mitre_attack_id(stix_object),
+                    _is_active(stix_object),
+                )
+            elif object_type == "relationship" and _is_active(stix_object):
+                relationship_type = stix_object.get("relationship_type")
+                source_ref: str = stix_object.get("source_ref", "")
+                target_ref: str = stix_object.get("target_ref", "")
+                # same matching as MitreAttackData.get_related
+                if "attack-pattern" not in target_ref:
+                    continue
+                if relationship_type == "uses" and "campaign" in source_ref:
+                    records.campaign_uses.append((source_ref, StixId(target_ref)))
+                elif relationship_type == "uses" and "intrusion-set" in source_ref:
+                    records.group_uses.append((source_ref, StixId(target_ref)))
+                elif relationship_type == "uses" and (
+                    source_ref.startswith("malware--")
+                    or source_ref.startswith("tool--")
+                ):
+                    records.software_uses.append((source_ref, StixId(target_ref)))
+                elif (
+                    relationship_type == "mitigates"
+                    and "course-of-action" in source_ref
+                ):
+                    records.mitigates.append((source_ref, StixId(target_ref)))
+    return records
+
+
+def probabilities_from_attack_records(
+    records: AttackRecords,
+) -> dict[StixId, TechniqueProbability]:
+    """
+    Calculate the probability of each technique from the compact ATT&CK records.
+
+    The probability of a technique is the number of active campaigns using it over the total number of campaigns.
+
+    Args:
+        records (AttackRecords): The records loaded from the ATT&CK bundle.
+
+    Returns:
+        dict[StixId, TechniqueProbability]: A dictionary mapping each technique's STIX ID to its TechniqueProbability.
+
+    Raises:
+        ValueError: If a "uses" relationship targets an attack pattern missing from the bundle.
+    """
+    counts: dict[StixId, int] = {}
+    for campaign_id, attack_pattern in records.campaign_uses:
+        campaign = records.campaigns.get(campaign_id)
+        # relationships to revoked or missing campaigns still list the technique, they just do not count
+        counts[attack_pattern] = counts.get(attack_pattern, 0) + (
+            1 if campaign is not None and campaign.active else 0
+        )
+    total_campaigns = len(records.campaigns)
+    techniques: dict[StixId, TechniqueProbability] = {}
+    for attack_pattern, count in counts.items():
+        pattern = records.attack_patterns.get(attack_pattern)
+        if pattern is None:
+            raise ValueError(f"{attack_pattern} not found")
+        if pattern.external_id is None:
+            continue  # no ATT&CK reference, same as MitreAttackData
+        techniques[attack_pattern] = TechniqueProbability(
+            pattern.name,
+            pattern.external_id,
+            count,
+            count / total_campaigns,
+            attack_pattern,
+        )
+    return techniques
+
+
+def mitigations_from_attack_records(records: AttackRecords) -> dict[str, Mitigation]:
+    """
+    Collect the active mitigations and the active techniques each of them mitigates.
+
+    Args:
+        records (AttackRecords): The records loaded from the ATT&CK bundle.
+
+    Returns:
+        dict[str, Mitigation]: The mitigations mitigating at least one technique, by STIX id.
+    """
+    mitigations: dict[str, Mitigation] = {}
+    for course_of_action_id, attack_pattern in records.mitigates:
+        course_of_action = records.courses_of_action.get(course_of_action_id)
+        pattern = records.attack_patterns.get(attack_pattern)
+        if course_of_action is None or not course_of_action.active:
+            continue
+        if pattern is None or not pattern.active:
+            continue  # same as MitreAttackData, which drops revoked targets
+        if course_of_action_id not in mitigations:
+            mitigations[course_of_action_id] = Mitigation(
+                course_of_action.name,
+                course_of_action.external_id or "",
+                course_of_action_id,
+                [],
+            )
+        mitigations[course_of_action_id].techniques.append(attack_pattern)
+    return mitigations
@@ -0,0 +1,423 @@
+"""
+Versioned store of the technique probabilities of several ATT&CK releases.
+
+The probability cache (see cache.py) is keyed by the hash of one bundle, so every run has to be given the raw
+bundle of the release it uses and a new release is computed from scratch. The store keeps any number of
+releases side by side in one directory, under names such as "15.1" or "16.0", so a run can pick a release by
+name without the bundle, and a long-running process can hold several of them at once.
+
+Next to the probabilities, every release keeps the state they were computed from: whether each campaign
+counts, the campaign -> attack pattern "uses" relationships, and how many active campaigns use each attack
+pattern. A new release is then computed from a base release by diffing its campaigns and "uses"
+relationships against the base and adjusting only the counts of the attack patterns involved. Only when the
+number of campaigns changes do all probabilities move, and then only the division is redone. The result is
+the same as computing the release from scratch, see probabilities_from_attack_records.
+
+Layout of the directory:
+    index.json          the releases in the order they were added, with their base and bundle hash
+    <release>.json      the probabilities, mitigations and campaign state of one release
+"""
+
+import json
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from instrumentation import stages
+from stix_probability import cache
+from stix_probability.loader import (
+    AttackRecords,
+    load_attack_records,
+    mitigations_from_attack_records,
+)
+from stix_probability.weights import (
+    PROBABILITY_MODEL_VERSION,
+    ProbabilityDatabase,
+    StixId,
+    TechniqueProbability,
+)
+
+INDEX_FILE = "index.json"
+
+
+@dataclass
+class ReleaseState:
+    """
+    What the probabilities of a release were computed from.
+
+    Attributes:
+        campaigns (dict[str, bool]): Whether each campaign of the bundle is active, revoked ones included.
+        campaign_uses (Counter[tuple[str, StixId]]): The (campaign id, attack pattern id) "uses" relationships.
+        counts (dict[StixId, tuple[int, int]]): For every attack pattern targeted by a "uses" relationship, the
+            number of active campaigns using it and the number of relationships targeting it.
+    """
+
+    campaigns: dict[str, bool] = field(default_factory=dict)
+    campaign_uses: Counter[tuple[str, StixId]] = field(default_factory=Counter)
+    counts: dict[StixId, tuple[int, int]] = field(default_factory=dict)
+
+
+@dataclass
+class ReleaseDiff:
+    """
+    How a release differs from its base.
+
+    Attributes:
+        release (str): The new release.
+        base (str | None): The release it was computed from, None if it was computed from scratch.
+        campaigns_added (int): Campaigns missing from the base.
+        campaigns_removed (int): Campaigns missing from the new release.
+        campaigns_changed (int): Campaigns that were revoked, deprecated or restored.
+        uses_added (int): "uses" relationships missing from the base.
+        uses_removed (int): "uses" relationships missing from the new release.
+        techniques_changed (list[StixId]): The techniques whose entry differs from the base.
+    """
+
+    release: str
+    base: str | None = None
+    campaigns_added: int = 0
+    campaigns_removed: int = 0
+    campaigns_changed: int = 0
+    uses_added: int = 0
+    uses_removed: int = 0
+    techniques_changed: list[StixId] = field(default_factory=list)
+
+
+def _technique(
+    records: AttackRecords, attack_pattern: StixId, count: int, total_campaigns: int
+) -> TechniqueProbability | None:
+    """
+    Build the entry of one technique like probabilities_from_attack_records.
+
+    Raises:
+        ValueError: If the attack pattern is missing from the bundle.
+    """
+    pattern = records.attack_patterns.get(attack_pattern)
+    if pattern is None:
+        raise ValueError(f"{attack_pattern} not found")
+    if pattern.external_id is None:
+        return None  # no ATT&CK reference, same as MitreAttackData
+    return TechniqueProbability(
+        pattern.name,
+        pattern.external_id,
+        count,
+        count / total_campaigns,
+        attack_pattern,
+    )
+
+
+def update_probabilities(
+    base: ProbabilityDatabase,
+    base_state: ReleaseState,
+    records: AttackRecords,
+    release: str = "",
+    base_release: str | None = None,
+) -> tuple[dict[StixId, TechniqueProbability], ReleaseState, ReleaseDiff]:
+    """
+    Compute the probabilities of a release from those of a base release and the changes between the two.
+
+    Args:
+        base (ProbabilityDatabase): The probabilities of the base release.
+        base_state (ReleaseState): What they were computed from.
+        records (AttackRecords): The records of the new release.
+        release (str): The name of the new release, for the diff.
+        base_release (str | None): The name of the base release, for the diff.
+
+    Returns:
+        tuple[dict[StixId, TechniqueProbability], ReleaseState, ReleaseDiff]: The probabilities and state of
+        the new release, and how it differs from the base.
+
+    Raises:
+        ValueError: If a "uses" relationship targets an attack pattern missing from the bundle.
+    """
+    campaigns = {
+        campaign_id: campaign.active
+        for campaign_id, campaign in records.campaigns.items()
+    }
+    campaign_uses = Counter(records.campaign_uses)
+    diff = ReleaseDiff(release, base_release)
+    diff.campaigns_added = len(campaigns.keys() - base_state.campaigns.keys())
+    diff.campaigns_removed = len(base_state.campaigns.keys() - campaigns.keys())
+    diff.campaigns_changed = sum(
+        1
+        for campaign_id, active in campaigns.items()
+        if campaign_id in base_state.campaigns
+        and base_state.campaigns[campaign_id] != active
+    )
+    # campaigns whose relationships start or stop counting, missing campaigns do not count
+    flipped = {
+        campaign_id
+        for campaign_id in campaigns.keys() | base_state.campaigns.keys()
+        if campaigns.get(campaign_id, False)
+        != base_state.campaigns.get(campaign_id, False)
+    }
+
+    counts = dict(base_state.counts)
+    touched: set[StixId] = set()
+
+    def adjust(attack_pattern: StixId, count: int, references: int) -> None:
+        old_count, old_references = counts.get(attack_pattern, (0, 0))
+        counts[attack_pattern] = (old_count + count, old_references + references)
+        touched.add(attack_pattern)
+
+    removed = base_state.campaign_uses - campaign_uses
+    added = campaign_uses - base_state.campaign_uses
+    diff.uses_removed = sum(removed.values())
+    diff.uses_added = sum(added.values())
+    for (campaign_id, attack_pattern), number in removed.items():
+        # relationships to revoked or missing campaigns still list the technique, they just do not count
+        was_active = base_state.campaigns.get(campaign_id, False)
+        adjust(attack_pattern, -number * was_active, -number)
+    for (campaign_id, attack_pattern), number in added.items():
+        adjust(attack_pattern, number * campaigns.get(campaign_id, False), number)
+    if flipped:
+        for (campaign_id, attack_pattern), number in campaign_uses.items():
+            if campaign_id in flipped:
+                # the relationships the base already had, the added ones were counted above
+                kept = number - added[(campaign_id, attack_pattern)]
+                if kept:
+                    adjust(
+                        attack_pattern,
+                        kept if campaigns.get(campaign_id, False) else -kept,
+                        0,
+                    )
+    for attack_pattern in [
+        attack_pattern
+        for attack_pattern, (_, references) in counts.items()
+        if references == 0
+    ]:
+        del counts[attack_pattern]
+
+    total_campaigns = len(campaigns)
+    if total_campaigns != len(base_state.campaigns):
+        # every probability is divided by the number of campaigns
+        touched = set(counts) | set(base.probability_mapping)
+    else:
+        # names and ATT&CK IDs can change without the counts changing
+        for attack_pattern, entry in base.probability_mapping.items():
+            pattern = records.attack_patterns.get(attack_pattern)
+            if pattern is None or (pattern.name, pattern.external_id) != (
+                entry.name,
+                entry.ttp,
+            ):
+                touched.add(attack_pattern)
+
+    techniques: dict[StixId, TechniqueProbability] = {}
+    for attack_pattern, (count, _) in counts.items():
+        if attack_pattern in touched:
+            technique = _technique(records, attack_pattern, count, total_campaigns)
+        else:
+            technique = base.probability_mapping.get(attack_pattern)
+        if technique is not None:
+            techniques[attack_pattern] = technique
+    diff.techniques_changed = sorted(
+        attack_pattern
+        for attack_pattern in touched
+        if techniques.get(attack_pattern)
+        != base.probability_mapping.get(attack_pattern)
+    )
+    return techniques, ReleaseState(campaigns, campaign_uses, counts), diff
+
+
+def _release_file_name(release: str) -> str:
+    """
+    Get the file a release is stored in.
+
+    Raises:
+        ValueError: If the name cannot be used as a file name.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", release):
+        raise ValueError(
+            f"Invalid ATT&CK release name {release!r}, use letters, digits, dots, dashes and underscores"
+        )
+    return f"{release}.json"
+
+
+class ReleaseStore:
+    """
+    The probabilities of several ATT&CK releases, see the module docstring.
+
+    Attributes:
+        directory (Path): Where the releases are stored.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        Args:
+            directory (Path): Where the releases are stored, created when the first release is added.
+        """
+        self.directory = Path(directory)
+        self._loaded: dict[str, tuple[ProbabilityDatabase, ReleaseState]] = {}
+
+    def _read_index(self) -> list[dict[str, Any]]:
+        """
+        Read the list of releases, empty if the store does not exist yet.
+        """
+        try:
+            with open(self.directory / INDEX_FILE, "r", encoding="utf-8") as file:
+                return list(json.load(file)["releases"])
+        except FileNotFoundError:
+            return []
+
+    def _write_json(self, file_name: str, data: Any) -> None:
+        """
+        Atomically write one file of the store.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / file_name
+        temp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp_file, path)
+
+    def releases(self) -> list[str]:
+        """
+        List the stored releases.
+
+        Returns:
+            list[str]: The release names, in the order they were added.
+        """
+        return [entry["release"] for entry in self._read_index()]
+
+    def _load(self, release: str) -> tuple[ProbabilityDatabase, ReleaseState]:
+        """
+        Load the probabilities and state of a release, reading its file only once.
+
+        Raises:
+            ValueError: If the release is not stored or was computed by another probability model.
+        """
+        if release in self._loaded:
+            return self._loaded[release]
+        try:
+            with open(
+                self.directory / _release_file_name(release), "r", encoding="utf-8"
+            ) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            known = ", ".join(self.releases()) or "none"
+            raise ValueError(
+                f"ATT&CK release {release} is not stored in {self.directory}, stored releases: {known}"
+            ) from None
+        if data["model_version"] != PROBABILITY_MODEL_VERSION:
+            raise ValueError(
+                f"ATT&CK release {release} was computed by probability model {data['model_version']}, "
+                "add it again from its bundle"
+            )
+        state = ReleaseState(
+            dict(data["campaigns"]),
+            Counter(
+                {
+                    (campaign_id, StixId(attack_pattern)): number
+                    for campaign_id, attack_pattern, number in data["campaign_uses"]
+                }
+            ),
+            {
+                StixId(attack_pattern): (count, references)
+                for attack_pattern, count, references in data["counts"]
+            },
+        )
+        self._loaded[release] = (cache.database_from_data(data), state)
+        return self._loaded[release]
+
+    def load(self, release: str) -> ProbabilityDatabase:
+        """
+        Get the probability database of a stored release, without its bundle.
+
+        Args:
+            release (str): The release name.
+
+        Returns:
+            ProbabilityDatabase: The probability database.
+
+        Raises:
+            ValueError: If the release is not stored or was computed by another probability model.
+        """
+        return self._load(release)[0]
+
+    def add(
+        self, release: str, attack_stix_path: str, base: str | None = None
+    ) -> ReleaseDiff | None:
+        """
+        Store the probabilities of an ATT&CK bundle as a release, computed incrementally from a base release.
+
+        Adding a release again from the same bundle does nothing, from another bundle replaces it.
+
+        Args:
+            release (str): The name to store the release under, e.g. "16.0".
+            attack_stix_path (str): Path to the ATT&CK STIX bundle of the release.
+            base (str | None): The release to compute it from, defaults to the last one added before it. Without
+                any, the release is computed from scratch.
+
+        Returns:
+            ReleaseDiff | None: How the release differs from its base, None if it was already stored from this
+            bundle.
+
+        Raises:
+            ValueError: If a release name is invalid, or the base is not stored.
+        """
+        file_name = _release_file_name(release)
+        with stages.stage("hash_attack_bundle"):
+            attack_sha256 = cache.hash_attack_bundle(attack_stix_path)
+        stored = self._read_index()
+        index = [entry for entry in stored if entry["release"] != release]
+        for entry in stored:
+            if (
+                entry["release"] == release
+                and entry["attack_sha256"] == attack_sha256
+                and entry["model_version"] == PROBABILITY_MODEL_VERSION
+            ):
+                return None
+        if base is None and index:
+            base = index[-1]["release"]
+        if base is not None:
+            base_db, base_state = self._load(base)
+        else:
+            base_db, base_state = (
+                ProbabilityDatabase(probability_mapping={}),
+                ReleaseState(),
+            )
+
+        with stages.stage("attack_load") as counts:
+            records = load_attack_records(attack_stix_path)
+            counts["attack_patterns"] = len(records.attack_patterns)
+        with stages.stage("probability_database") as counts:
+            techniques, state, diff = update_probabilities(
+                base_db, base_state, records, release, base
+            )
+            probability_db = ProbabilityDatabase(
+                probability_mapping=techniques,
+                mitigations=mitigations_from_attack_records(records),
+            )
+            counts["techniques"] = len(techniques)
+            counts["techniques_changed"] = len(diff.techniques_changed)
+
+        data = cache.database_to_data(probability_db)
+        data.update(
+            release=release,
+            base=base,
+            attack_sha256=attack_sha256,
+            campaigns=state.campaigns,
+            campaign_uses=[
+                [campaign_id, attack_pattern, number]
+                for (campaign_id, attack_pattern), number in state.campaign_uses.items()
+            ],
+            counts=[
+                [attack_pattern, count, references]
+                for attack_pattern, (count, references) in state.counts.items()
+            ],
+        )
+        self._write_json(file_name, data)
+        index.append(
+            {
+                "release": release,
+                "base": base,
+                "attack_sha256": attack_sha256,
+                "model_version": PROBABILITY_MODEL_VERSION,
+            }
+        )
+        self._write_json(INDEX_FILE, {"releases": index})
+        self._loaded[release] = (probability_db, state)
+        return diff
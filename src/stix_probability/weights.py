@@ -1,11 +1,41 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
-from typing import NewType, List
-from mitreattack.stix20 import MitreAttackData
-from stix2 import ExternalReference, Campaign
-from stix2.v20.sdo import AttackPattern
+from typing import TYPE_CHECKING, NewType, List
+
+if TYPE_CHECKING:
+    from mitreattack.stix20 import MitreAttackData
+    from stix2 import ExternalReference, Campaign
 
 StixId = NewType("StixId", str)
 
+# Bump this whenever the way probabilities are derived from ATT&CK changes, so that
+# any persisted probability mappings computed by an older model are invalidated.
+PROBABILITY_MODEL_VERSION = "2"
+
+# the probability of techniques not found in the database
+UNKNOWN_TECHNIQUE_PROBABILITY = 0.01
+
+# how ProbabilityDatabase.resolve_technique found an action's technique
+RESOLVED_STIX_ID = "stix_id"
+RESOLVED_EXTERNAL_ID = "external_id"
+RESOLVED_PARENT = "parent"
+UNRESOLVED = "unresolved"
+NO_TECHNIQUE = "no_technique"
+RESOLUTION_LEVELS = (
+    RESOLVED_STIX_ID,
+    RESOLVED_EXTERNAL_ID,
+    RESOLVED_PARENT,
+    UNRESOLVED,
+    NO_TECHNIQUE,
+)
+
+# when a sub-technique (T1059.001) is replaced by its parent technique (T1059)
+ROLLUP_NONE = "none"
+ROLLUP_MISSING = "missing"
+ROLLUP_ALWAYS = "always"
+TECHNIQUE_ROLLUPS = (ROLLUP_NONE, ROLLUP_MISSING, ROLLUP_ALWAYS)
+
 
 @dataclass
 class TechniqueProbability:
@@ -27,17 +57,93 @@ class TechniqueProbability:
     stix_id: StixId
 
 
+@dataclass
+class Mitigation:
+    """
+    Represents an ATT&CK mitigation (course-of-action) and the techniques it mitigates.
+
+    Attributes:
+        name (str): The name of the mitigation.
+        mitigation_id (str): The ATT&CK ID of the mitigation, e.g. M1038.
+        stix_id (str): The STIX identifier of the course-of-action.
+        techniques (list[StixId]): The STIX identifiers of the techniques it mitigates.
+    """
+
+    name: str
+    mitigation_id: str
+    stix_id: str
+    techniques: list[StixId]
+
+
+def parent_technique_id(external_id: str) -> str | None:
+    """
+    Get the ATT&CK ID of a sub-technique's parent technique.
+
+    Args:
+        external_id (str): The ATT&CK ID of a technique, e.g. T1059.001.
+
+    Returns:
+        str | None: The ATT&CK ID of its parent, e.g. T1059, None if it is not a sub-technique.
+    """
+    parent, dot, _ = external_id.partition(".")
+    return parent if dot else None
+
+
 class ProbabilityDatabase:
     """
     Represents a probability database that calculates the probabilities of each technique based on the provided STIX data.
+
+    Techniques are looked up by STIX id in probability_mapping, and by ATT&CK ID in an index built once with the
+    database, which also serves the parent techniques sub-techniques roll up to, see resolve_technique.
     """
 
-    attack_stix_bundle: MitreAttackData
+    attack_stix_bundle: MitreAttackData | None
     probability_mapping: dict[StixId, TechniqueProbability]
+    mitigations: dict[str, Mitigation]
+    technique_rollup: str
+    techniques_by_external_id: dict[str, TechniqueProbability]
+
+    def __init__(
+        self,
+        attack_stix_bundle: MitreAttackData | None = None,
+        probability_mapping: dict[StixId, TechniqueProbability] | None = None,
+        mitigations: dict[str, Mitigation] | None = None,
+        technique_rollup: str = ROLLUP_NONE,
+    ):
+        """
+        Build the database either from ATT&CK STIX data or from an already computed mapping.
+
+        Args:
+            attack_stix_bundle (MitreAttackData | None): The ATT&CK data to compute the probabilities from.
+            probability_mapping (dict[StixId, TechniqueProbability] | None): A previously computed mapping, e.g. loaded from the cache.
+            mitigations (dict[str, Mitigation] | None): The mitigations that go with probability_mapping, by STIX id.
+            technique_rollup (str): When sub-techniques get the probability of their parent technique, one of
+                TECHNIQUE_ROLLUPS, see resolve_technique.
 
-    def __init__(self, attack_stix_bundle: MitreAttackData):
+        Raises:
+            ValueError: If neither or both of the arguments are provided, or the rollup is unknown.
+        """
+        if (attack_stix_bundle is None) == (probability_mapping is None):
+            raise ValueError(
+                "Expected exactly one of attack_stix_bundle or probability_mapping."
+            )
+        if technique_rollup not in TECHNIQUE_ROLLUPS:
+            raise ValueError(
+                f"Unknown technique rollup {technique_rollup}, expected one of {', '.join(TECHNIQUE_ROLLUPS)}"
+            )
         self.attack_stix_bundle = attack_stix_bundle
-        self._probabilities_from_stix_data()
+        self.technique_rollup = technique_rollup
+        if probability_mapping is not None:
+            self.probability_mapping = probability_mapping
+            self.mitigations = mitigations or {}
+        else:
+            self._probabilities_from_stix_data()
+            self._mitigations_from_stix_data()
+        self.techniques_by_external_id = {
+            technique.ttp: technique
+            for technique in self.probability_mapping.values()
+            if technique.ttp
+        }
 
     def _probabilities_from_stix_data(self) -> None:
         """
@@ -50,6 +156,9 @@ class ProbabilityDatabase:
             dict[StixId, TechniqueProbability]: A dictionary mapping each technique's STIX ID to its corresponding TechniqueProbability object.
 
         """
+        from stix2.v20.sdo import AttackPattern
+
+        assert self.attack_stix_bundle is not None
         techniques: dict[StixId, TechniqueProbability] = {}
         # Using the following method, we can go through each attack pattern and find campaigns where it is referenced
         campaign_by_pattern: dict[StixId, List[Campaign]] = (
@@ -86,6 +195,37 @@ class ProbabilityDatabase:
                     pass  # ignoring capec, etc.
         self.probability_mapping = techniques
 
+    def _mitigations_from_stix_data(self) -> None:
+        """
+        Collect the active mitigations and the active techniques each of them mitigates.
+        """
+        assert self.attack_stix_bundle is not None
+        mitigations: dict[str, Mitigation] = {}
+        techniques_by_mitigation = (
+            self.attack_stix_bundle.get_all_techniques_mitigated_by_all_mitigations()
+        )
+        for course_of_action_id, entries in techniques_by_mitigation.items():
+            course_of_action = self.attack_stix_bundle.get_object_by_stix_id(
+                course_of_action_id
+            )
+            if course_of_action.get("revoked", False) or course_of_action.get(
+                "x_mitre_deprecated", False
+            ):
+                continue
+            mitigation_id = ""
+            for reference in course_of_action.get("external_references", []):
+                if reference["source_name"] == "mitre-attack":
+                    mitigation_id = reference["external_id"]
+            techniques = [StixId(entry["object"]["id"]) for entry in entries]
+            if techniques:
+                mitigations[course_of_action_id] = Mitigation(
+                    course_of_action["name"],
+                    mitigation_id,
+                    course_of_action_id,
+                    techniques,
+                )
+        self.mitigations = mitigations
+
     def get_probability_for_technique(self, technique_id: StixId) -> float:
         """
         Get the probability of a technique being used in an attack.
@@ -98,11 +238,75 @@ class ProbabilityDatabase:
         """
         if technique_id not in self.probability_mapping:
             # uh oh, this means this technique was not found in a campaign, just fudge it and say its super unlikely
-            return 0.01
+            return UNKNOWN_TECHNIQUE_PROBABILITY
         # maybe one day...
         # raise ValueError(f"Technique {technique_id} not found in the database.")
         return self.probability_mapping[technique_id].probability
 
+    def resolve_technique(
+        self, technique_ref: str | None, technique_id: str | None = None
+    ) -> tuple[TechniqueProbability | None, str]:
+        """
+        Find the technique of an attack action, by STIX id first and by ATT&CK ID when the STIX id is missing or
+        not in the database (e.g. a flow exported against another ATT&CK release).
+
+        Sub-techniques roll up to their parent technique as technique_rollup says: never with ROLLUP_NONE, when
+        the sub-technique itself is not in the database with ROLLUP_MISSING, and whenever the parent is in the
+        database with ROLLUP_ALWAYS.
+
+        Args:
+            technique_ref (str | None): The technique_ref of the action, the STIX id of the attack pattern.
+            technique_id (str | None): The technique_id of the action, its ATT&CK ID, e.g. T1059.001.
+
+        Returns:
+            tuple[TechniqueProbability | None, str]: The technique, None if it was not found, and how it was found,
+            one of RESOLUTION_LEVELS.
+        """
+        if technique_ref is None and technique_id is None:
+            return None, NO_TECHNIQUE
+        technique, level = None, UNRESOLVED
+        if technique_ref is not None and technique_ref in self.probability_mapping:
+            technique, level = (
+                self.probability_mapping[StixId(technique_ref)],
+                RESOLVED_STIX_ID,
+            )
+        elif (
+            technique_id is not None and technique_id in self.techniques_by_external_id
+        ):
+            technique, level = (
+                self.techniques_by_external_id[technique_id],
+                RESOLVED_EXTERNAL_ID,
+            )
+        if self.technique_rollup == ROLLUP_NONE or (
+            technique is not None and self.technique_rollup == ROLLUP_MISSING
+        ):
+            return technique, level
+        external_id = technique.ttp if technique is not None else technique_id
+        parent_id = parent_technique_id(external_id) if external_id else None
+        if parent_id is not None and parent_id in self.techniques_by_external_id:
+            return self.techniques_by_external_id[parent_id], RESOLVED_PARENT
+        return technique, level
+
+    def get_probability_for_action(
+        self, technique_ref: str | None, technique_id: str | None = None
+    ) -> float:
+        """
+        Get the probability of an attack action's technique, see resolve_technique.
+
+        Args:
+            technique_ref (str | None): The technique_ref of the action.
+            technique_id (str | None): The technique_id of the action.
+
+        Returns:
+            float: The probability of the technique, UNKNOWN_TECHNIQUE_PROBABILITY if it was not found.
+        """
+        technique, _ = self.resolve_technique(technique_ref, technique_id)
+        return (
+            UNKNOWN_TECHNIQUE_PROBABILITY
+            if technique is None
+            else technique.probability
+        )
+
 
 # Example usage
 # mitre_data = MitreAttackData("enterprise-attack.json")
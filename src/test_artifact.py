@@ -0,0 +1,92 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import io
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+import main
+from benchmarks import synthetic
+from flow_network import artifact, assembly, compact
+from hugin_net import writer as hugin_writer
+
+ATTACK = {"bundle": "attack.json", "probability_model": "test"}
+
+
+@pytest.fixture(scope="module")
+def compiled_flow(tmp_path_factory, write_synthetic_flow, synthetic_probability_db):
+    tmp_path = tmp_path_factory.mktemp("artifact")
+    flow_file = tmp_path / "flow.json"
+    write_synthetic_flow(synthetic.FlowShape(nodes=120, depth=8, seed=4), flow_file)
+    [(attack_flow, compact_flow)] = main.build_compact_flows(str(flow_file))
+    probabilities = compact.node_probabilities(compact_flow, synthetic_probability_db)
+    network = assembly.assemble_network(compact_flow, probabilities)
+    path = tmp_path / "flow.atk"
+    with open(path, "wb") as file:
+        artifact.write_artifact(file, network, attack_flow, ATTACK)
+    return str(path), attack_flow, network, probabilities
+
+
+def query(compiled):
+    return main.query_flow_networks(
+        [(compiled.attack_flow, compiled.network)],
+        options=main.QueryOptions("exact"),
+    )
+
+
+def test_mapped_network_matches_the_conversion(compiled_flow):
+    """
+    The mapped arrays are read-only views of the file, the NET file derived from them is the one converting
+    the flow writes, and queries give what they give on the assembled network.
+    """
+    path, attack_flow, network, probabilities = compiled_flow
+    compiled = artifact.CompiledArtifact(path)
+    assert compiled.attack == ATTACK
+    assert compiled.attack_flow.id == attack_flow.id
+    assert compiled.attack_flow.get("name") == attack_flow.get("name")
+    for array in (compiled.network.cpd_values, compiled.network.flow.parents):
+        assert not array.flags.writeable
+        assert not array.flags.owndata
+    assert np.array_equal(compiled.network.cpd_values, network.cpd_values)
+    assert np.array_equal(compiled.network.order, network.order)
+    assert compiled.network.flow.labels == network.flow.labels
+
+    derived, converted = io.StringIO(), io.StringIO()
+    compiled.write_net(derived)
+    hugin_writer.write_compact_net(network.flow, probabilities, converted)
+    assert derived.getvalue() == converted.getvalue()
+    assert query(compiled) == main.query_flow_networks(
+        [(attack_flow, network)], options=main.QueryOptions("exact")
+    )
+
+
+def test_workers_map_the_file_themselves(compiled_flow):
+    """
+    A compiled network is pickled as its path, so worker processes map the file instead of copying arrays.
+    """
+    path = compiled_flow[0]
+    compiled = artifact.CompiledArtifact(path)
+    assert len(pickle.dumps(compiled)) < 200
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(query, compiled).result() == query(compiled)
+
+
+def test_rejects_other_files(compiled_flow, tmp_path):
+    path, attack_flow, network, probabilities = compiled_flow
+    other = tmp_path / "flow.net"
+    other.write_text("net\n{\n}\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="is not a compiled network"):
+        artifact.CompiledArtifact(str(other))
+    newer = tmp_path / "newer.atk"
+    data = bytearray(open(path, "rb").read())
+    data[8] = artifact.FORMAT_VERSION + 1
+    newer.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="format 2"):
+        artifact.CompiledArtifact(str(newer))
+    unvalidated = assembly.FlowNetwork.from_compact_flow(network.flow, probabilities)
+    with pytest.raises(ValueError, match="validated"):
+        artifact.write_artifact(io.BytesIO(), unvalidated, attack_flow, ATTACK)
@@ -0,0 +1,103 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import networkx as nx
+import numpy as np
+import pytest
+
+import main
+from benchmarks import synthetic
+from flow_network import assembly, compact, inference
+
+
+@pytest.fixture(scope="module")
+def flow_inputs(tmp_path_factory, write_synthetic_flow, synthetic_probability_db):
+    flow_file = tmp_path_factory.mktemp("assembly") / "flow.json"
+    write_synthetic_flow(synthetic.FlowShape(nodes=120, depth=8, seed=2), flow_file)
+    [(attack_flow, compact_flow)] = main.build_compact_flows(str(flow_file))
+    return (
+        attack_flow,
+        compact_flow,
+        compact.node_probabilities(compact_flow, synthetic_probability_db),
+        synthetic_probability_db,
+    )
+
+
+def test_bulk_cpds_match_the_pgmpy_network(flow_inputs):
+    """
+    The bulk CPDs are the ones cpd_values gives every node, and the nodes are sorted like NetworkX sorts the
+    pgmpy network, which keeps seeded sampling reproducible.
+    """
+    _, compact_flow, probabilities, _ = flow_inputs
+    network = assembly.assemble_network(compact_flow, probabilities)
+    model = network.to_bayesian_network()
+    for node, name in enumerate(compact_flow.ids):
+        expected = compact.cpd_values(compact_flow, node, probabilities).reshape(2, -1)
+        assert np.array_equal(network.cpd(node), expected)
+        assert np.array_equal(model.get_cpds(name).get_values(), expected)
+    assert [compact_flow.ids[node] for node in network.order] == list(
+        nx.topological_sort(model)
+    )
+    assert model.check_model()
+
+
+def test_validation_rejects_broken_networks(flow_inputs):
+    """
+    Unnormalized columns, values outside [0, 1], CPDs of the wrong size and cycles are all caught.
+    """
+    _, compact_flow, probabilities, _ = flow_inputs
+    network = assembly.FlowNetwork.from_compact_flow(compact_flow, probabilities)
+    network.cpd_values[-1] += 0.5
+    with pytest.raises(ValueError, match="does not sum to 1"):
+        network.validate()
+    network.cpd_values[-1] = 1.5
+    with pytest.raises(ValueError, match="must be probabilities"):
+        network.validate()
+    # the widest CPD allowed is as large as the junction tree compiles
+    assert 2 ** (assembly.MAX_PARENTS + 1) == inference.DEFAULT_MAX_TABLE_ENTRIES
+    with pytest.raises(ValueError, match="exactly one CPD"):
+        assembly.FlowNetwork(
+            compact_flow, network.cpd_offsets[:-1], network.cpd_values
+        ).validate()
+    offsets = network.cpd_offsets.copy()
+    offsets[1] += 2
+    with pytest.raises(ValueError, match="does not match its 0 binary parents"):
+        assembly.FlowNetwork(compact_flow, offsets, network.cpd_values).validate()
+
+    # a -> b -> c -> a
+    looped = compact.CompactFlow(
+        ["a", "b", "c"],
+        *compact.FlowStructure.csr_arrays(3, [0, 1, 2], [1, 2, 0]),
+        np.full(3, compact.KIND_CONDITION, dtype=np.uint8),
+        np.full(3, compact.NO_TECHNIQUE, dtype=np.int32),
+        [],
+        [],
+        ["Condition: a", "Condition: b", "Condition: c"],
+    )
+    with pytest.raises(ValueError, match="has a cycle"):
+        assembly.assemble_network(looped, np.full(3, 0.5))
+
+
+def test_queries_run_without_pgmpy_objects(flow_inputs):
+    """
+    Queries and mitigation rankings on the assembled network give what they give on the pgmpy network,
+    without building it.
+    """
+    attack_flow, compact_flow, probabilities, probability_db = flow_inputs
+    network = assembly.assemble_network(compact_flow, probabilities)
+    model = compact.to_bayesian_network(compact_flow, probabilities)
+    evidence = {compact_flow.ids[0]: 1}
+    for options in (
+        main.QueryOptions("exact"),
+        main.QueryOptions("sampling", max_samples=20_000, seed=1),
+    ):
+        assert main.query_flow_networks(
+            [(attack_flow, network)], evidence=evidence, options=options
+        ) == main.query_flow_networks(
+            [(attack_flow, model)], evidence=evidence, options=options
+        )
+    assert main.rank_flow_mitigations(
+        [(attack_flow, network)], probability_db
+    ) == main.rank_flow_mitigations([(attack_flow, model)], probability_db)
+    assert network._model is None
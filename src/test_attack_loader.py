@@ -0,0 +1,122 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import io
+import json
+
+from stix_probability import loader
+
+PATTERN_ID = "attack-pattern--970a3432-3237-47ad-bcca-7d8cbb217736"
+ACTIVE_CAMPAIGN_ID = "campaign--2d8d4a1a-3a2a-4c5e-9a4e-1e5b3a0b9c11"
+REVOKED_CAMPAIGN_ID = "campaign--8a1f6b1e-6f7d-4b5c-8f6e-2c1d0e9b8a77"
+COURSE_OF_ACTION_ID = "course-of-action--4f6a8c0e-2d3e-4f5a-9b7c-1d3e5f7a9b1c"
+
+
+def make_bundle():
+    """
+    Build a small ATT&CK style bundle with one technique used by an active and a revoked campaign, and
+    mitigated by one mitigation.
+
+    Returns:
+        dict: The bundle.
+    """
+    return {
+        "type": "bundle",
+        "id": "bundle--0b2f1e6c-3c6f-4c47-9a57-2b0a2a1f9b3e",
+        "spec_version": "2.0",
+        "objects": [
+            {
+                "type": "attack-pattern",
+                "id": PATTERN_ID,
+                "name": "PowerShell",
+                "external_references": [
+                    {"source_name": "capec", "external_id": "CAPEC-1"},
+                    {"source_name": "mitre-attack", "external_id": "T1059.001"},
+                ],
+            },
+            {"type": "campaign", "id": ACTIVE_CAMPAIGN_ID, "name": "Active"},
+            {
+                "type": "campaign",
+                "id": REVOKED_CAMPAIGN_ID,
+                "name": "Revoked",
+                "revoked": True,
+            },
+            {
+                "type": "course-of-action",
+                "id": COURSE_OF_ACTION_ID,
+                "name": "Execution Prevention",
+                "external_references": [
+                    {"source_name": "mitre-attack", "external_id": "M1038"}
+                ],
+            },
+            {"type": "malware", "id": "malware--7f1c0f2b-5d9e-4b8a-bb1e-3c6a9d2e4f10"},
+            {
+                "type": "relationship",
+                "id": "relationship--1c3e5f7a-9b2d-4f6e-8a1c-3e5f7a9b2d4f",
+                "relationship_type": "uses",
+                "source_ref": ACTIVE_CAMPAIGN_ID,
+                "target_ref": PATTERN_ID,
+            },
+            {
+                "type": "relationship",
+                "id": "relationship--2d4f6a8c-0e1f-4a3b-9c5d-7e9f1a3b5c7d",
+                "relationship_type": "uses",
+                "source_ref": REVOKED_CAMPAIGN_ID,
+                "target_ref": PATTERN_ID,
+            },
+            {
+                "type": "relationship",
+                "id": "relationship--3e5f7a9b-1c2d-4e6f-8a0b-2c4d6e8f0a1b",
+                "relationship_type": "mitigates",
+                "source_ref": COURSE_OF_ACTION_ID,
+                "target_ref": PATTERN_ID,
+            },
+        ],
+    }
+
+
+def test_iter_bundle_objects_across_chunk_boundaries(monkeypatch):
+    """
+    Objects split across read chunks are decoded exactly as json.load would decode them.
+    """
+    bundle = make_bundle()
+    monkeypatch.setattr(loader, "_READ_CHUNK_SIZE", 5)
+
+    objects = list(loader.iter_bundle_objects(io.StringIO(json.dumps(bundle))))
+
+    assert objects == bundle["objects"]
+
+
+def test_probabilities_from_attack_records(tmp_path):
+    """
+    Only active campaigns count towards a technique, but every campaign counts towards the total.
+    """
+    bundle_file = tmp_path / "enterprise-attack.json"
+    bundle_file.write_text(json.dumps(make_bundle()), encoding="utf-8")
+
+    records = loader.load_attack_records(str(bundle_file))
+    probabilities = loader.probabilities_from_attack_records(records)
+
+    assert len(records.campaign_uses) == 2
+    technique = probabilities[PATTERN_ID]
+    assert technique.ttp == "T1059.001"
+    assert technique.count == 1
+    assert technique.probability == 0.5
+
+
+def test_mitigations_from_attack_records(tmp_path):
+    """
+    Mitigates relationships are collected per course-of-action with its ATT&CK ID.
+    """
+    bundle_file = tmp_path / "enterprise-attack.json"
+    bundle_file.write_text(json.dumps(make_bundle()), encoding="utf-8")
+
+    records = loader.load_attack_records(str(bundle_file))
+    mitigations = loader.mitigations_from_attack_records(records)
+
+    assert list(mitigations) == [COURSE_OF_ACTION_ID]
+    mitigation = mitigations[COURSE_OF_ACTION_ID]
+    assert mitigation.mitigation_id == "M1038"
+    assert mitigation.name == "Execution Prevention"
+    assert mitigation.techniques == [PATTERN_ID]
@@ -0,0 +1,122 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+from attack_flow_extension import flow
+from flow_network import compact, divorce
+from hugin_net import writer
+from flow_service import server, watch
+from main import (
+    build_compact_flows,
+    ConversionOptions,
+    convert_attack_flow_to_nx,
+    convert_flow_file,
+    flow_nx_to_pgmpy,
+    make_nx_graph_more_readable,
+    QueryOptions,
+    read_flow_file,
+)
+from stix_probability import weights
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "examples",
+    "flow_exports",
+    "Cobalt Kitty Campaign.json",
+)
+
+
+def test_csr_arrays_sort_and_deduplicate():
+    """
+    Parents and children are grouped per node, sorted by index, with duplicate edges dropped.
+    """
+    offsets, parents, child_offsets, children = compact.FlowStructure.csr_arrays(
+        4, [2, 0, 1, 0, 2], [3, 3, 3, 1, 3]
+    )
+    structure = compact.FlowStructure(
+        ["a", "b", "c", "d"], offsets, parents, child_offsets, children
+    )
+
+    assert structure.parents_of(3).tolist() == [0, 1, 2]
+    assert structure.children_of(0).tolist() == [1, 3]
+    assert structure.in_degrees().tolist() == [0, 1, 0, 3]
+    assert structure.num_edges == 4
+
+
+@pytest.mark.parametrize("max_fan_in", [None, 2])
+def test_compact_pipeline_matches_networkx(max_fan_in):
+    """
+    Converting, divorcing, laying out and writing a compact flow gives the text of the NetworkX pipeline.
+    """
+    probability_db = weights.ProbabilityDatabase(probability_mapping={})
+    flow_bundle = read_flow_file(EXAMPLE)
+    [attack_flow] = flow.get_flows_from_stix_bundle(flow_bundle)
+    graph = convert_attack_flow_to_nx(attack_flow, flow_bundle)
+    if max_fan_in is not None:
+        graph = divorce.divorce_parents(graph, max_fan_in)
+    expected = io.StringIO()
+    writer.write_unbbayes_net(
+        flow_nx_to_pgmpy(make_nx_graph_more_readable(graph), probability_db),
+        expected,
+    )
+
+    [(_, compact_flow)] = build_compact_flows(
+        EXAMPLE, ConversionOptions(max_fan_in=max_fan_in)
+    )
+    probabilities = compact.node_probabilities(compact_flow, probability_db)
+    written = io.StringIO()
+    writer.write_compact_net(compact_flow, probabilities, written)
+
+    assert written.getvalue() == expected.getvalue()
+    model = compact.to_bayesian_network(compact_flow, probabilities)
+    reference = flow_nx_to_pgmpy(graph, probability_db)
+    for cpd in model.get_cpds():
+        other = reference.get_cpds(cpd.variable)
+        assert cpd.variables == other.variables
+        assert np.array_equal(cpd.values, other.values)
+
+
+def test_cyclic_flows_are_refused(tmp_path):
+    """
+    A flow whose effect_refs lead back to where it starts has no network UnBBayes can load, so no NET text is
+    written for it on the command line, in the scoring service or in watch mode.
+    """
+    with open(EXAMPLE, "r", encoding="utf-8") as file:
+        flow_bundle = json.load(file)
+    objects = {obj["id"]: obj for obj in flow_bundle["objects"]}
+    [flow_obj] = [obj for obj in objects.values() if obj["type"] == "attack-flow"]
+    start = flow_obj["start_refs"][0]
+    last = next(
+        obj
+        for obj in objects.values()
+        if obj["type"] == "attack-action" and obj["id"] != start
+    )
+    last.setdefault("effect_refs", []).append(start)
+    flow_file = tmp_path / "cycle.json"
+    flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+    probability_db = weights.ProbabilityDatabase(probability_mapping={})
+
+    output_file = tmp_path / "cycle.net"
+    with pytest.raises(ValueError, match="has a cycle"):
+        convert_flow_file(str(flow_file), str(output_file), probability_db)
+    assert not output_file.exists()
+    with pytest.raises(ValueError, match="has a cycle"):
+        server.score_request(
+            server.ScoreRequest.from_json(flow_bundle),
+            probability_db,
+            ConversionOptions(),
+            QueryOptions(),
+        )
+    [(_, compact_flow)] = build_compact_flows(str(flow_file))
+    with pytest.raises(ValueError, match="has a cycle"):
+        watch.IncrementalNet().update(
+            compact_flow, compact.node_probabilities(compact_flow, probability_db)
+        )
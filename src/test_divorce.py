@@ -0,0 +1,58 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import networkx as nx
+import pytest
+from pgmpy.inference import VariableElimination
+
+from attack_flow_extension import flow
+from flow_network import divorce
+from main import flow_nx_to_pgmpy
+from stix_probability import weights
+
+
+def make_wide_flow(operator):
+    """
+    Build a flow graph where seven actions feed one operator, which feeds an action.
+
+    Args:
+        operator (str): "AND" or "OR".
+
+    Returns:
+        tuple[nx.DiGraph, str, str]: The graph, the operator node and the final action node.
+    """
+    graph = nx.DiGraph()
+    operator_obj = flow.AttackOperator(operator=operator)
+    final_obj = flow.AttackAction(name="Exfiltration")
+    graph.add_node(operator_obj.id, object=operator_obj)
+    graph.add_node(final_obj.id, object=final_obj)
+    for position in range(7):
+        action = flow.AttackAction(name=f"Step {position}")
+        graph.add_node(action.id, object=action)
+        graph.add_edge(action.id, operator_obj.id)
+        graph.add_edge(action.id, final_obj.id)
+    graph.add_edge(operator_obj.id, final_obj.id)
+    return graph, operator_obj.id, final_obj.id
+
+
+@pytest.mark.parametrize("operator", ["AND", "OR"])
+def test_divorce_parents_is_exact(operator):
+    """
+    Divorcing bounds the number of parents without changing any marginal of the original nodes.
+    """
+    probability_db = weights.ProbabilityDatabase(probability_mapping={})
+    graph, operator_node, final_node = make_wide_flow(operator)
+    original_nodes = list(graph.nodes)
+    expected = VariableElimination(flow_nx_to_pgmpy(graph, probability_db))
+
+    divorced = divorce.divorce_parents(graph.copy(), max_fan_in=2)
+    model = flow_nx_to_pgmpy(divorced, probability_db)
+
+    assert max(len(model.get_parents(node)) for node in model.nodes) <= 2
+    assert len(model.nodes) > len(original_nodes)
+    inference = VariableElimination(model)
+    for node in (operator_node, final_node):
+        assert inference.query([node]).values == pytest.approx(
+            expected.query([node]).values
+        )
@@ -0,0 +1,71 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+import os
+
+import pytest
+
+from attack_flow_extension import flow, records
+from main import convert_attack_flow_to_nx, read_flow_file
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "examples",
+    "flow_exports",
+    "Cobalt Kitty Campaign.json",
+)
+
+
+def test_records_match_strict_parsing(tmp_path):
+    """
+    The records give the same graph, with the same fields on every node, as the validated stix2 objects.
+    """
+    with open(EXAMPLE, "r", encoding="utf-8") as file:
+        bundle = json.load(file)
+    # a bundle level spec_version makes stix2 treat the export as STIX 2.0
+    bundle.pop("spec_version")
+    flow_file = tmp_path / "cobalt.json"
+    flow_file.write_text(json.dumps(bundle), encoding="utf-8")
+
+    graphs = []
+    for strict in (True, False):
+        flow_bundle = read_flow_file(str(flow_file), strict)
+        [attack_flow] = flow.get_flows_from_stix_bundle(flow_bundle)
+        graphs.append(convert_attack_flow_to_nx(attack_flow, flow_bundle))
+
+    strict_graph, light_graph = graphs
+    assert list(light_graph.nodes) == list(strict_graph.nodes)
+    assert set(light_graph.edges) == set(strict_graph.edges)
+    for node, node_data in light_graph.nodes(data=True):
+        record = node_data["object"]
+        expected = strict_graph.nodes[node]["object"]
+        assert isinstance(record, records.FlowRecord)
+        assert record.type == expected.type
+        for field in ("name", "description", "operator", "technique_ref"):
+            assert record.get(field) == expected.get(field)
+
+
+def test_other_objects_are_skipped_and_required_fields_checked():
+    """
+    Objects the converter never reads are dropped, attack flow objects missing a required field are rejected.
+    """
+    data = {
+        "type": "bundle",
+        "id": "bundle--1",
+        "objects": [
+            {"type": "attack-operator", "id": "attack-operator--1", "operator": "OR"},
+            {"type": "attack-asset", "id": "attack-asset--1", "name": "Laptop"},
+            {"type": "note", "id": "note--1", "content": "unused"},
+        ],
+    }
+
+    bundle = records.parse_flow_bundle(data)
+
+    [operator] = bundle.objects
+    assert operator.is_or() and "effect_refs" not in operator
+    data["objects"].append({"type": "attack-action", "id": "attack-action--1"})
+    with pytest.raises(ValueError, match="name"):
+        records.parse_flow_bundle(data)
@@ -0,0 +1,131 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import asyncio
+import io
+import json
+import os
+
+import pytest
+
+import main
+from flow_network import compact
+from flow_service import server
+from hugin_net import writer as hugin_writer
+from stix_probability import weights
+
+EXAMPLE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "examples",
+    "flow_exports",
+    "Uber Breach.json",
+)
+
+
+def load_example() -> dict:
+    with open(EXAMPLE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_score_request_matches_the_command_line():
+    """
+    The service returns the NET text main.py writes and the posteriors --query prints.
+    """
+    probability_db = weights.ProbabilityDatabase(probability_mapping={})
+    options = main.ConversionOptions()
+    results = server.score_request(
+        server.ScoreRequest.from_json(load_example()),
+        probability_db,
+        options,
+        main.QueryOptions(),
+    )
+
+    compact_flows = main.build_compact_flows(EXAMPLE, options)
+    networks = [
+        (
+            attack_flow,
+            compact.to_bayesian_network(
+                compact_flow, compact.node_probabilities(compact_flow, probability_db)
+            ),
+        )
+        for attack_flow, compact_flow in compact_flows
+    ]
+    expected = main.query_flow_networks(networks)
+    assert len(results) == len(compact_flows) == len(expected)
+    for result, (_, compact_flow), posterior in zip(results, compact_flows, expected):
+        buffer = io.StringIO()
+        hugin_writer.write_compact_net(
+            compact_flow,
+            compact.node_probabilities(compact_flow, probability_db),
+            buffer,
+        )
+        assert result.pop("net") == buffer.getvalue()
+        assert result == posterior
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        [],
+        {"bundle": {}, "net": False, "posteriors": False},
+        {"bundle": {}, "variables": "node"},
+        {"bundle": {}, "evidence": {"node": 2}},
+    ],
+)
+def test_score_request_rejects_malformed_bodies(payload):
+    """
+    Malformed requests are refused before any conversion.
+    """
+    with pytest.raises(ValueError):
+        server.ScoreRequest.from_json(payload)
+
+
+def test_service_refuses_requests_beyond_its_queue():
+    """
+    With one worker and no queue, a request arriving while another is converted gets 503, and the stats
+    account for both.
+    """
+
+    async def post(port: int, body: bytes) -> tuple[int, dict]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"POST /score HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(payload)
+
+    async def run() -> tuple[list[tuple[int, dict]], dict]:
+        service = server.ScoringService(
+            weights.ProbabilityDatabase(probability_mapping={}),
+            jobs=1,
+            max_pending=0,
+        )
+        tcp_server = await asyncio.start_server(
+            lambda reader, writer: server.handle_connection(service, reader, writer),
+            "127.0.0.1",
+            0,
+        )
+        port = tcp_server.sockets[0].getsockname()[1]
+        body = json.dumps({"bundle": load_example(), "posteriors": False}).encode()
+        try:
+            responses = await asyncio.gather(post(port, body), post(port, body))
+            _, stats = await service.handle("GET", "/stats", b"")
+        finally:
+            tcp_server.close()
+            service.close()
+        return responses, stats
+
+    responses, stats = asyncio.run(run())
+
+    assert sorted(status for status, _ in responses) == [200, 503]
+    flows = next(payload for status, payload in responses if status == 200)["flows"]
+    assert flows[0]["net"].startswith("net")
+    assert stats["rejected"] == 1
+    assert stats["endpoints"]["/score"]["requests"] == 2
+    assert stats["endpoints"]["/score"]["errors"] == 1
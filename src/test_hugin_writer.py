@@ -0,0 +1,79 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import io
+
+import numpy as np
+from pgmpy.factors.discrete import TabularCPD
+from pgmpy.models import BayesianNetwork
+from pgmpy.readwrite import NETWriter
+
+from hugin_net import writer
+
+
+def make_model():
+    """
+    Build a small network with an AND node over two parents and the attributes the converter attaches.
+
+    Returns:
+        BayesianNetwork: The model.
+    """
+    model = BayesianNetwork([("a", "c"), ("b", "c")])
+    for node in model.nodes:
+        model.nodes[node]["object"] = {"id": node, "type": "attack-action"}
+        model.nodes[node]["label"] = f'"Action: {node}"'
+        model.nodes[node]["position"] = "(0,0)"
+    and_values = np.zeros((2, 4))
+    and_values[0, :-1] = 1
+    and_values[1, -1] = 1
+    model.add_cpds(
+        TabularCPD("a", 2, [[0.99], [0.01]]),
+        TabularCPD("b", 2, [[0.5], [0.5]]),
+        TabularCPD("c", 2, and_values, evidence=["a", "b"], evidence_card=[2, 2]),
+    )
+    return model
+
+
+def legacy_unbbayes_hugin(model):
+    """
+    The NETWriter output with the string fixes that were applied before the streaming writer.
+
+    Args:
+        model (BayesianNetwork): The model.
+
+    Returns:
+        str: The NET file.
+    """
+    raw_hugin_file = str(NETWriter(model))
+    for line in iter(raw_hugin_file.splitlines()):
+        if "object" in line:
+            raw_hugin_file = raw_hugin_file.replace(line, "")
+        elif "weight" in line:
+            raw_hugin_file = raw_hugin_file.replace(line, "")
+    return raw_hugin_file.replace("{", "\n{")
+
+
+def test_streaming_writer_matches_legacy_output():
+    """
+    The streaming writer produces exactly the file the NETWriter post-processing produced.
+    """
+    model = make_model()
+    buffer = io.StringIO()
+
+    writer.write_unbbayes_net(model, buffer)
+
+    assert buffer.getvalue() == legacy_unbbayes_hugin(model)
+    assert "object" not in buffer.getvalue()
+
+
+def test_large_potentials_are_not_summarised():
+    """
+    Tables with more than numpy's print threshold of entries are written in full.
+    """
+    values = np.full((2, 2**10), 0.5)
+
+    potential = writer.format_potential(values.reshape((2,) * 11))
+
+    assert "..." not in potential
+    assert potential.count("0.5") == 2**11
@@ -0,0 +1,127 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+
+import pytest
+
+from benchmarks import synthetic
+from stix_probability import cache, incidence, loader
+
+
+@pytest.fixture
+def attack_file(tmp_path):
+    bundle = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=6))
+    # a revoked campaign and group still show up in the totals of the original model only
+    next(obj for obj in bundle["objects"] if obj["type"] == "campaign")[
+        "revoked"
+    ] = True
+    next(obj for obj in bundle["objects"] if obj["type"] == "intrusion-set")[
+        "revoked"
+    ] = True
+    path = tmp_path / "attack.json"
+    path.write_text(json.dumps(bundle), encoding="utf-8")
+    return str(path)
+
+
+def test_estimators_match_a_walk_over_the_records(attack_file):
+    """
+    Every estimator gives what a straightforward loop over the ATT&CK records gives.
+    """
+    records = loader.load_attack_records(attack_file)
+    matrix = incidence.IncidenceMatrix.from_attack_records(records)
+    assert incidence.estimate_probabilities(
+        matrix
+    ) == loader.probabilities_from_attack_records(records)
+
+    def users(actors, relationships):
+        used = {}
+        for actor, attack_pattern in relationships:
+            if actors[actor].active:
+                used.setdefault(attack_pattern, set()).add(actor)
+        return used
+
+    campaigns = users(records.campaigns, records.campaign_uses)
+    groups = users(records.groups, records.group_uses)
+    active_campaigns = [c for c in records.campaigns.values() if c.active]
+    active_groups = sum(group.active for group in records.groups.values())
+
+    laplace = incidence.estimate_probabilities(matrix, "laplace")
+    assert len(laplace) == len(records.attack_patterns)
+    for attack_pattern, technique in laplace.items():
+        count = len(campaigns.get(attack_pattern, ()))
+        assert technique.count == count
+        assert technique.probability == pytest.approx(
+            (count + 1) / (len(active_campaigns) + 2)
+        )
+
+    group_frequency = incidence.estimate_probabilities(matrix, "group-frequency")
+    assert group_frequency.keys() == {
+        attack_pattern for _, attack_pattern in records.group_uses
+    }
+    for attack_pattern, technique in group_frequency.items():
+        assert technique.probability == pytest.approx(
+            len(groups.get(attack_pattern, ())) / active_groups
+        )
+
+    def year(campaign):
+        return int(campaign.last_seen[:4]) + (int(campaign.last_seen[5:7]) - 1) / 12
+
+    latest = max(year(campaign) for campaign in active_campaigns)
+    weights = {
+        campaign.stix_id: 0.5 ** ((latest - year(campaign)) / 3)
+        for campaign in active_campaigns
+    }
+    recency = incidence.estimate_probabilities(matrix, "recency")
+    for attack_pattern, technique in recency.items():
+        assert technique.probability == pytest.approx(
+            sum(weights[c] for c in campaigns.get(attack_pattern, ()))
+            / sum(weights.values())
+        )
+
+
+def test_polars_frame_holds_every_entry(attack_file):
+    """
+    The Polars frame has one row per technique and actor using it, with the number of relationships.
+    """
+    pl = pytest.importorskip("polars")
+    records = loader.load_attack_records(attack_file)
+    frame = incidence.IncidenceMatrix.from_attack_records(records).to_polars()
+    relationships = (
+        len(records.campaign_uses)
+        + len(records.group_uses)
+        + len(records.software_uses)
+    )
+    assert frame["uses"].sum() == relationships
+    by_kind = dict(frame.group_by("actor_kind").agg(pl.col("uses").sum()).iter_rows())
+    assert by_kind == {
+        "campaign": len(records.campaign_uses),
+        "group": len(records.group_uses),
+        "software": len(records.software_uses),
+    }
+
+
+def test_estimator_is_part_of_the_cache_key(attack_file, tmp_path):
+    """
+    Each estimator gets its own cache entry, the original one keeping its key, and the mitreattack loader
+    refuses the others.
+    """
+    keys = {
+        estimator: cache.cache_key(attack_file, estimator)
+        for estimator in incidence.ESTIMATORS
+    }
+    assert keys[incidence.DEFAULT_ESTIMATOR] == cache.cache_key(attack_file)
+    assert len(set(keys.values())) == len(keys)
+
+    smoothed = cache.load_probability_database(
+        attack_file, tmp_path / "cache", estimator="laplace"
+    )
+    assert (
+        cache.load_probability_database(
+            attack_file, tmp_path / "cache", estimator="laplace"
+        ).probability_mapping
+        == smoothed.probability_mapping
+    )
+    with pytest.raises(ValueError, match="only implements"):
+        cache.compute_probability_database(attack_file, "mitreattack", "laplace")
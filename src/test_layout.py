@@ -0,0 +1,37 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import networkx as nx
+
+from flow_network import layout
+
+
+def test_edges_point_down_and_positions_are_distinct():
+    """
+    Every edge goes to a lower layer, even past a shortcut, and no two nodes share a position.
+    """
+    graph = nx.DiGraph(
+        [("a", "c"), ("b", "c"), ("c", "d"), ("a", "d"), ("d", "e"), ("b", "f")]
+    )
+
+    positions = layout.layered_layout(graph)
+
+    for parent, child in graph.edges:
+        assert positions[parent][1] < positions[child][1]
+    assert len(set(positions.values())) == len(positions)
+    assert all(x >= 0 and y >= 0 for x, y in positions.values())
+    assert positions["d"][1] == 2 * layout.LAYER_SPACING
+
+
+def test_layout_is_deterministic():
+    """
+    The positions depend on the graph only, not on the order nodes and edges were added in.
+    """
+    edges = [(f"n{i}", f"n{(i * 7) % 40 + 40}") for i in range(40)]
+    edges += [(f"n{i + 40}", f"n{i // 2 + 80}") for i in range(40)]
+
+    first = layout.layered_layout(nx.DiGraph(edges))
+    second = layout.layered_layout(nx.DiGraph(list(reversed(edges))))
+
+    assert first == second
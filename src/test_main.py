@@ -2,11 +2,24 @@ import sys
 
 # add local directory to system path
 sys.path.append("./")
+import json
+import os
+import subprocess
+
 import pytest
 import networkx as nx
 from stix2 import Bundle
-from main import convert_attack_flow_to_nx
+from main import (
+    convert_attack_flow_to_nx,
+    convert_flow_directory,
+    flow_output_files,
+)
 from attack_flow_extension import flow
+from stix_probability import weights
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "examples", "flow_exports"
+)
 
 
 # Mock classes and functions
@@ -25,6 +38,13 @@ class MockAttackFlow:
 class MockBundle:
     """A class representing a mock bundle."""
 
+    objects = [
+        {"id": "node1", "effect_refs": ["node2", "node3"]},
+        {"id": "node2", "on_true_refs": ["node4"]},
+        {"id": "node3"},
+        {"id": "node4"},
+    ]
+
     def get_obj(self, node_id):
         """
         Retrieve the object associated with the given node ID.
@@ -35,22 +55,17 @@ class MockBundle:
         Returns:
             list: The object associated with the node ID, or an empty list if not found.
         """
-        mock_objects = {
-            "node1": [{"effect_refs": ["node2", "node3"]}],
-            "node2": [{"on_true_refs": ["node4"]}],
-            "node3": [{}],
-            "node4": [{}],
-        }
-        return mock_objects.get(node_id, [])
+        return [obj for obj in self.objects if obj["id"] == node_id]
 
 
-def mock_get_single_flow_object_by_id(node_id, bundle):
+def mock_get_single_flow_object_by_id(node_id, bundle, object_index=None):
     """
     Mock function to get a single flow object by its ID.
 
     Args:
         node_id (int): The ID of the flow object.
         bundle (dict): The bundle containing flow objects.
+        object_index (dict): The id index of the bundle.
 
     Returns:
         dict: The flow object with the specified ID.
@@ -59,7 +74,7 @@ def mock_get_single_flow_object_by_id(node_id, bundle):
 
 
 # Test function
-def test_convert_attack_flow_to_nx():
+def test_convert_attack_flow_to_nx(monkeypatch):
     """
     Test case for the convert_attack_flow_to_nx function.
 
@@ -73,7 +88,9 @@ def test_convert_attack_flow_to_nx():
     mock_bundle = MockBundle()
 
     # Monkey patch the flow.get_single_flow_object_by_id function
-    flow.get_single_flow_object_by_id = mock_get_single_flow_object_by_id
+    monkeypatch.setattr(
+        flow, "get_single_flow_object_by_id", mock_get_single_flow_object_by_id
+    )
 
     # Act
     result = convert_attack_flow_to_nx(mock_attack_flow, mock_bundle)
@@ -116,6 +133,8 @@ def test_convert_attack_flow_to_nx_value_error():
     class ErrorBundle:
         """Represents a bundle of errors."""
 
+        objects = []
+
         def get_obj(self, node_id):
             """
             Retrieves the object associated with the given node ID.
@@ -129,6 +148,8 @@ def test_convert_attack_flow_to_nx_value_error():
             return []
 
     class ErrorBundle:
+        objects = []
+
         def get_obj(self, node_id):
             return []  # Return an empty list to trigger ValueError
 
@@ -136,3 +157,97 @@ def test_convert_attack_flow_to_nx_value_error():
         ValueError, match="Expected to find exactly one object with id node1"
     ):
         convert_attack_flow_to_nx(MockAttackFlow(), ErrorBundle())
+
+
+def test_convert_flow_directory_reports_failures(tmp_path):
+    """
+    Batch mode converts every flow in a directory and reports a broken file without aborting the batch.
+    """
+    example = os.path.join(EXAMPLES_DIR, "Uber Breach.json")
+    with open(example, "r", encoding="utf-8") as file:
+        bundle = json.load(file)
+    # a bundle level spec_version makes stix2 treat the export as STIX 2.0
+    bundle.pop("spec_version")
+    (tmp_path / "uber.json").write_text(json.dumps(bundle), encoding="utf-8")
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+    probability_db = weights.ProbabilityDatabase(probability_mapping={})
+
+    results = convert_flow_directory(
+        str(tmp_path), str(tmp_path / "out"), probability_db
+    )
+
+    assert [result.flow_file for result in results] == [
+        str(tmp_path / "broken.json"),
+        str(tmp_path / "uber.json"),
+    ]
+    assert results[0].error is not None
+    assert results[1].error is None
+    assert (tmp_path / "out" / "uber.net").read_text(encoding="utf-8").startswith("net")
+
+
+def test_flow_output_files_one_file_per_flow():
+    """
+    A single flow keeps the requested output file, several flows get distinct files named after the flows.
+    """
+    assert flow_output_files("out/net.net", [{"name": "Uber Breach"}]) == [
+        "out/net.net"
+    ]
+    flows = [{"name": "Uber Breach"}, {"name": "Cobalt Kitty"}, {"name": "Uber Breach"}]
+    assert flow_output_files("out/net.net", flows) == [
+        "out/net-uber-breach.net",
+        "out/net-cobalt-kitty.net",
+        "out/net-uber-breach-3.net",
+    ]
+
+
+def test_convert_attack_flow_to_nx_expands_shared_nodes_once(monkeypatch):
+    """
+    In a diamond (node1 -> node2, node3 -> node4) the shared node is looked up and expanded only once.
+    """
+
+    class DiamondBundle:
+        """A bundle whose flow is a diamond."""
+
+        objects = [
+            {"id": "node1", "effect_refs": ["node2", "node3"]},
+            {"id": "node2", "effect_refs": ["node4"]},
+            {"id": "node3", "effect_refs": ["node4"]},
+            {"id": "node4"},
+        ]
+
+    lookups = []
+
+    def counting_lookup(node_id, bundle, object_index=None):
+        lookups.append(node_id)
+        return {"id": node_id}
+
+    monkeypatch.setattr(flow, "get_single_flow_object_by_id", counting_lookup)
+
+    result = convert_attack_flow_to_nx(MockAttackFlow(), DiamondBundle())
+
+    assert sorted(lookups) == ["node1", "node2", "node3", "node4"]
+    assert set(result.edges) == {
+        ("node1", "node2"),
+        ("node1", "node3"),
+        ("node2", "node4"),
+        ("node3", "node4"),
+    }
+
+
+def test_main_imports_heavy_dependencies_on_demand():
+    """
+    Importing main, as every mode does before parsing its arguments, loads none of the heavy dependencies.
+    """
+    heavy = ["pgmpy", "networkx", "stix2", "mitreattack"]
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, main; print([m for m in {heavy!r} if m in sys.modules])",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert loaded.strip() == "[]"
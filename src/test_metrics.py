@@ -0,0 +1,112 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+
+import pytest
+
+import main
+from benchmarks import synthetic
+from instrumentation import metrics, stages
+from stix_probability import cache
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    """
+    Install a metrics recorder writing to a file in tmp_path for the duration of a test.
+    """
+    metrics_recorder = metrics.MetricsRecorder(
+        str(tmp_path / "metrics.jsonl"), {"attack_stix": "attack.json"}
+    )
+    stages.install(metrics_recorder)
+    yield metrics_recorder
+    stages.uninstall(metrics_recorder)
+    metrics_recorder.close()
+
+
+def read_lines(recorder):
+    recorder.close()
+    with open(recorder.path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def write_flows(write_synthetic_flow, tmp_path, flows=1):
+    flow_dir = tmp_path / "flows"
+    flow_dir.mkdir()
+    for seed in range(flows):
+        write_synthetic_flow(
+            synthetic.FlowShape(nodes=40, depth=4, seed=seed),
+            flow_dir / f"flow-{seed}.json",
+        )
+    return flow_dir
+
+
+def test_every_stage_of_a_conversion_is_recorded(
+    tmp_path, recorder, synthetic_attack_file, write_synthetic_flow
+):
+    """
+    Loading ATT&CK and converting a flow write one line per stage, with the context, labels and sizes.
+    """
+    flow_dir = write_flows(write_synthetic_flow, tmp_path)
+    probability_db = cache.load_probability_database(
+        str(synthetic_attack_file), tmp_path / "cache"
+    )
+    flow_file = str(flow_dir / "flow-0.json")
+    with stages.labelled(flow_file=flow_file):
+        main.convert_flow_file(flow_file, str(tmp_path / "flow.net"), probability_db)
+
+    lines = read_lines(recorder)
+    assert [line["stage"] for line in lines] == [
+        "hash_attack_bundle",
+        "read_probability_cache",
+        "attack_load",
+        "probability_database",
+        "write_probability_cache",
+        "read_flow",
+        "traverse",
+        "layout",
+        "write_net",
+    ]
+    for line in lines:
+        assert line["attack_stix"] == "attack.json"
+        assert line["wall_s"] >= 0 and line["cpu_s"] >= 0 and line["peak_bytes"] >= 0
+    assert lines[1]["hit"] is False
+    assert lines[3]["techniques"] == len(probability_db.probability_mapping)
+    write_net = lines[-1]
+    assert write_net["flow_file"] == flow_file
+    assert write_net["flow"].startswith("attack-flow--")
+    assert write_net["nodes"] == 40
+    assert write_net["edges"] > 0 and write_net["cpd_cells"] >= 2 * 40
+    assert write_net["bytes"] == (tmp_path / "flow.net").stat().st_size
+
+
+def test_batch_workers_record_their_stages(
+    synthetic_probability_db, write_synthetic_flow, tmp_path, recorder
+):
+    """
+    Worker processes of a batch append their stages to the same file, labelled with their flow file.
+    """
+    flow_dir = write_flows(write_synthetic_flow, tmp_path, flows=2)
+    results = main.convert_flow_directory(
+        str(flow_dir), str(tmp_path / "out"), synthetic_probability_db, jobs=2
+    )
+    assert all(result.error is None for result in results)
+
+    write_nets = [line for line in read_lines(recorder) if line["stage"] == "write_net"]
+    assert sorted(line["flow_file"] for line in write_nets) == [
+        str(flow_dir / "flow-0.json"),
+        str(flow_dir / "flow-1.json"),
+    ]
+
+
+def test_failed_stages_are_recorded(tmp_path, recorder):
+    """
+    A stage that raises is still written, with the exception type.
+    """
+    with pytest.raises(ValueError):
+        with stages.stage("failing"):
+            raise ValueError("boom")
+    [line] = read_lines(recorder)
+    assert line["stage"] == "failing" and line["error"] == "ValueError"
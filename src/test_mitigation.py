@@ -0,0 +1,67 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import numpy as np
+import pytest
+from pgmpy.factors.discrete import TabularCPD
+
+from flow_network import inference, mitigation
+from stix_probability.weights import Mitigation, ProbabilityDatabase
+from test_inference import make_model
+
+
+def dampened(model, nodes, efficacy):
+    """
+    Copy a model with the probability of some root nodes lowered by the efficacy.
+    """
+    copy = model.copy()
+    for node in nodes:
+        values = model.get_cpds(node).get_values().copy()
+        values[1] *= 1 - efficacy
+        values[0] = 1 - values[1]
+        copy.remove_cpds(copy.get_cpds(node))
+        copy.add_cpds(TabularCPD(node, 2, values))
+    return copy
+
+
+def test_sweep_matches_rebuilt_networks(monkeypatch):
+    """
+    Every mitigation gets the probability a network rebuilt with the dampened CPDs gives, largest drop first.
+    """
+    model = make_model()
+    monkeypatch.setattr(
+        mitigation,
+        "actions_by_technique",
+        lambda *_: {"t-a": ["a"], "t-b": ["b"], "t-c": ["c"]},
+    )
+    probability_db = ProbabilityDatabase(
+        probability_mapping={},
+        mitigations={
+            "m1": Mitigation("Small", "M1", "m1", ["t-b"]),
+            "m2": Mitigation("Large", "M2", "m2", ["t-a", "t-c"]),
+            "m3": Mitigation("Unused", "M3", "m3", ["t-x"]),
+        },
+    )
+
+    baseline, impacts = mitigation.rank_mitigations(model, probability_db, efficacy=0.4)
+
+    assert [impact.mitigation.mitigation_id for impact in impacts] == ["M2", "M1"]
+    assert np.isclose(
+        baseline["d"], inference.CompiledNetwork(model).marginals(["d"])["d"][1]
+    )
+    for impact in impacts:
+        rebuilt = inference.CompiledNetwork(dampened(model, impact.actions, 0.4))
+        expected = rebuilt.marginals(["d"])["d"][1]
+        assert np.isclose(impact.probabilities["d"], expected)
+        assert np.isclose(impact.drop, baseline["d"] - expected)
+
+
+def test_invalid_efficacy():
+    """
+    Efficacies outside [0, 1] are rejected.
+    """
+    probability_db = ProbabilityDatabase(probability_mapping={}, mitigations={})
+
+    with pytest.raises(ValueError):
+        mitigation.rank_mitigations(make_model(), probability_db, efficacy=1.5)
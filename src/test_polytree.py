@@ -0,0 +1,89 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import numpy as np
+from pgmpy.factors.discrete import TabularCPD
+from pgmpy.models import BayesianNetwork
+
+from flow_network import inference, polytree
+
+
+def gate_cpd(node, parents, is_and):
+    """
+    Build the deterministic AND/OR CPD flow_nx_to_pgmpy uses for operators.
+    """
+    values = np.zeros((2, 2 ** len(parents)))
+    if is_and:
+        values[1, -1] = 1
+    else:
+        values[1, 1:] = 1
+    values[0] = 1 - values[1]
+    return TabularCPD(
+        node, 2, values, evidence=parents, evidence_card=[2] * len(parents)
+    )
+
+
+def action_cpd(node, parents, probability):
+    """
+    Build the constant CPD flow_nx_to_pgmpy uses for actions.
+    """
+    values = np.tile([[1 - probability], [probability]], 2 ** len(parents))
+    return TabularCPD(
+        node,
+        2,
+        values,
+        evidence=parents or None,
+        evidence_card=[2] * len(parents) or None,
+    )
+
+
+def test_polytree_matches_junction_tree():
+    """
+    Nested gates and actions downstream of gates get the exact marginals.
+    """
+    model = BayesianNetwork(
+        [
+            ("a", "or"),
+            ("b", "or"),
+            ("or", "and"),
+            ("c", "and"),
+            ("and", "d"),
+            ("d", "e"),
+        ]
+    )
+    model.add_cpds(
+        action_cpd("a", [], 0.3),
+        action_cpd("b", [], 0.1),
+        action_cpd("c", [], 0.6),
+        gate_cpd("or", ["a", "b"], is_and=False),
+        gate_cpd("and", ["or", "c"], is_and=True),
+        action_cpd("d", ["and"], 0.2),
+        action_cpd("e", ["d"], 0.5),
+    )
+
+    evaluator = polytree.PolytreeEvaluator.compile(model)
+
+    assert evaluator is not None
+    expected = inference.CompiledNetwork(model).marginals()
+    for node, distribution in evaluator.marginals().items():
+        assert np.allclose(distribution, expected[node])
+    assert np.isclose(evaluator.marginals(["and"])["and"][1], (1 - 0.7 * 0.9) * 0.6)
+
+
+def test_shared_ancestor_is_not_a_polytree():
+    """
+    Gate inputs that share an ancestor are dependent, so the evaluator refuses the network.
+    """
+    model = BayesianNetwork(
+        [("a", "or"), ("a", "and"), ("b", "and"), ("or", "top"), ("and", "top")]
+    )
+    model.add_cpds(
+        action_cpd("a", [], 0.3),
+        action_cpd("b", [], 0.1),
+        gate_cpd("or", ["a"], is_and=False),
+        gate_cpd("and", ["a", "b"], is_and=True),
+        gate_cpd("top", ["or", "and"], is_and=False),
+    )
+
+    assert polytree.PolytreeEvaluator.compile(model) is None
@@ -0,0 +1,81 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+from stix_probability import cache
+from stix_probability.weights import (
+    Mitigation,
+    ProbabilityDatabase,
+    StixId,
+    TechniqueProbability,
+)
+
+
+def make_mapping():
+    """
+    Build a small probability mapping without loading any ATT&CK data.
+
+    Returns:
+        dict: A mapping of STIX id to TechniqueProbability.
+    """
+    stix_id = StixId("attack-pattern--970a3432-3237-47ad-bcca-7d8cbb217736")
+    return {stix_id: TechniqueProbability("PowerShell", "T1059.001", 3, 0.25, stix_id)}
+
+
+def test_cached_database_round_trip(tmp_path):
+    """
+    A database written to the cache is read back unchanged, without any ATT&CK data behind it.
+    """
+    mapping = make_mapping()
+    stix_id = next(iter(mapping))
+    mitigation = Mitigation(
+        "Execution Prevention",
+        "M1038",
+        "course-of-action--b045d015-6bed-4490-bd38-56b41ece59a0",
+        [stix_id],
+    )
+    cache_file = tmp_path / "entry.json"
+
+    cache.write_cached_database(
+        cache_file,
+        ProbabilityDatabase(
+            probability_mapping=mapping,
+            mitigations={mitigation.stix_id: mitigation},
+        ),
+    )
+    database = cache.read_cached_database(cache_file)
+
+    assert database is not None
+    assert database.probability_mapping == mapping
+    assert database.mitigations == {mitigation.stix_id: mitigation}
+    assert database.attack_stix_bundle is None
+    assert database.get_probability_for_technique(stix_id) == 0.25
+
+
+def test_corrupt_cache_entry_is_a_miss(tmp_path):
+    """
+    A truncated or missing cache entry is treated as a miss instead of an error.
+    """
+    cache_file = tmp_path / "entry.json"
+    cache_file.write_text('{"model_version": ', encoding="utf-8")
+
+    assert cache.read_cached_database(cache_file) is None
+    assert cache.read_cached_database(tmp_path / "missing.json") is None
+
+
+def test_cache_key_tracks_bundle_and_model_version(tmp_path, monkeypatch):
+    """
+    The cache key changes when the bundle content or the probability model version changes.
+    """
+    bundle = tmp_path / "enterprise-attack.json"
+    bundle.write_text('{"type": "bundle", "objects": []}', encoding="utf-8")
+    original_key = cache.cache_key(str(bundle))
+
+    assert cache.cache_key(str(bundle)) == original_key
+
+    monkeypatch.setattr(cache, "PROBABILITY_MODEL_VERSION", "test")
+    assert cache.cache_key(str(bundle)) != original_key
+    monkeypatch.undo()
+
+    bundle.write_text('{"type": "bundle", "objects": [{}]}', encoding="utf-8")
+    assert cache.cache_key(str(bundle)) != original_key
@@ -0,0 +1,93 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import cProfile
+import pstats
+
+from instrumentation import profiling, stages
+
+
+def leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def branch(n):
+    return leaf(n) + leaf(n // 2)
+
+
+def recurse(depth):
+    return leaf(1000) if depth == 0 else recurse(depth - 1)
+
+
+def test_profiles_are_written_per_stage_and_flow(tmp_path):
+    """
+    Every stage gets a pstats file and collapsed stacks named after the stage and its labels.
+    """
+    recorder = profiling.ProfileRecorder(str(tmp_path / "profiles"))
+    stages.install(recorder)
+    try:
+        with stages.labelled(
+            flow_file="/data/flows/uber-breach.json",
+            flow="attack-flow--8ccfd5ad-9b4c-4014-8da1-e81863e3bf69",
+        ):
+            with stages.stage("layout"):
+                branch(20_000)
+        with stages.stage("attack_load"):
+            leaf(10)
+    finally:
+        stages.uninstall(recorder)
+
+    names = sorted(path.name for path in (tmp_path / "profiles").iterdir())
+    prefix = f"{names[0].split('-')[0]}-"
+    assert names == [
+        f"{prefix}001-layout-uber-breach-attack-flow-8ccfd5ad.collapsed",
+        f"{prefix}001-layout-uber-breach-attack-flow-8ccfd5ad.pstats",
+        f"{prefix}002-attack_load.collapsed",
+        f"{prefix}002-attack_load.pstats",
+    ]
+    stats = pstats.Stats(
+        str(
+            tmp_path
+            / "profiles"
+            / f"{prefix}001-layout-uber-breach-attack-flow-8ccfd5ad.pstats"
+        )
+    )
+    assert any(name == "leaf" for _, _, name in stats.stats)
+    lines = (
+        (
+            tmp_path
+            / "profiles"
+            / f"{prefix}001-layout-uber-breach-attack-flow-8ccfd5ad.collapsed"
+        )
+        .read_text(encoding="utf-8")
+        .splitlines()
+    )
+    stacks = {line.rpartition(" ")[0]: int(line.rpartition(" ")[2]) for line in lines}
+    assert any(
+        stack.split(";")[:2]
+        == [
+            f"branch (test_profiling.py:{branch.__code__.co_firstlineno})",
+            f"leaf (test_profiling.py:{leaf.__code__.co_firstlineno})",
+        ]
+        for stack in stacks
+    )
+    assert all(microseconds > 0 for microseconds in stacks.values())
+
+
+def test_collapsed_stacks_keep_the_profiled_time():
+    """
+    The rebuilt stacks add up to the own time of the profiled functions, recursion included.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    branch(50_000)
+    recurse(20)
+    profile.disable()
+    stats = pstats.Stats(profile)
+
+    stacks = profiling.collapse_stats(stats)
+    total = sum(own for _, _, own, _, _ in stats.stats.values()) * 1e6
+    assert abs(sum(stacks.values()) - total) <= 0.05 * total
+    recursive = [stack for stack in stacks if stack.startswith("recurse")]
+    assert recursive and all(stack.count("recurse") == 1 for stack in recursive)
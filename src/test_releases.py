@@ -0,0 +1,110 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import copy
+import json
+
+import pytest
+
+from benchmarks import synthetic
+from stix_probability import cache, releases
+
+
+def edit_release(bundle):
+    """
+    Make the next "release" of a synthetic ATT&CK bundle: a campaign revoked, one removed, one added, some
+    "uses" relationships dropped and a technique renamed.
+    """
+    bundle = copy.deepcopy(bundle)
+    objects = bundle["objects"]
+    campaigns = [obj for obj in objects if obj["type"] == "campaign"]
+    campaigns[0]["revoked"] = True
+    removed = campaigns[1]["id"]
+    objects.remove(campaigns[1])
+    added = dict(campaigns[2], id="campaign--00000000-0000-4000-8000-000000000001")
+    objects.append(added)
+    uses = [
+        obj
+        for obj in objects
+        if obj["type"] == "relationship" and obj["relationship_type"] == "uses"
+    ]
+    for relationship in uses[:7]:
+        objects.remove(relationship)
+    objects.extend(
+        dict(relationship, id=f"relationship--00000000-0000-4000-8000-{n:012d}")
+        | {"source_ref": added["id"]}
+        for n, relationship in enumerate(uses[20:25])
+    )
+    # relationships of the removed campaign stay, they just stop counting
+    assert any(relationship["source_ref"] == removed for relationship in uses[7:])
+    next(obj for obj in objects if obj["type"] == "attack-pattern")["name"] = "Renamed"
+    return bundle
+
+
+def write_bundle(path, bundle):
+    path.write_text(json.dumps(bundle), encoding="utf-8")
+    return str(path)
+
+
+def test_incremental_release_matches_full_computation(tmp_path):
+    """
+    A release computed from the previous one has the same probabilities as one computed from scratch, and the
+    store serves both releases by name afterwards.
+    """
+    first = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=4))
+    second = edit_release(first)
+    first_file = write_bundle(tmp_path / "first.json", first)
+    second_file = write_bundle(tmp_path / "second.json", second)
+
+    store = releases.ReleaseStore(tmp_path / "releases")
+    initial = store.add("15.1", first_file)
+    assert initial.base is None
+    diff = store.add("16.0", second_file)
+    assert diff.base == "15.1"
+    assert (diff.campaigns_added, diff.campaigns_removed, diff.campaigns_changed) == (
+        1,
+        1,
+        1,
+    )
+    assert (diff.uses_added, diff.uses_removed) == (5, 7)
+    assert diff.techniques_changed
+
+    # a fresh store reads both releases back from disk
+    reopened = releases.ReleaseStore(tmp_path / "releases")
+    assert reopened.releases() == ["15.1", "16.0"]
+    for release, attack_file in (("15.1", first_file), ("16.0", second_file)):
+        expected = cache.compute_probability_database(attack_file)
+        stored = reopened.load(release)
+        assert stored.probability_mapping == expected.probability_mapping
+        assert stored.mitigations == expected.mitigations
+
+
+def test_adding_a_release_again(tmp_path):
+    """
+    Adding a release from the same bundle is a no-op, from another bundle replaces it.
+    """
+    first = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=5))
+    first_file = write_bundle(tmp_path / "first.json", first)
+    second_file = write_bundle(tmp_path / "second.json", edit_release(first))
+    store = releases.ReleaseStore(tmp_path / "releases")
+    store.add("15.1", first_file)
+    assert store.add("15.1", first_file) is None
+
+    store.add("15.1", second_file)
+    assert store.releases() == ["15.1"]
+    assert (
+        store.load("15.1").probability_mapping
+        == cache.compute_probability_database(second_file).probability_mapping
+    )
+
+
+def test_unknown_and_invalid_releases(tmp_path):
+    """
+    Loading a release that is not stored or naming one with path characters fails with the stored releases.
+    """
+    store = releases.ReleaseStore(tmp_path / "releases")
+    with pytest.raises(ValueError, match="stored releases: none"):
+        store.load("15.1")
+    with pytest.raises(ValueError, match="Invalid ATT&CK release name"):
+        store.load("../15.1")
@@ -0,0 +1,56 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import numpy as np
+import pytest
+
+from flow_network import inference, sampling
+from test_inference import make_model
+
+
+def test_estimates_cover_exact_marginals():
+    """
+    With evidence weighted in, the intervals cover the exact posteriors and reach the requested precision.
+    """
+    model = make_model()
+    evidence = {"d": 1}
+    exact = inference.CompiledNetwork(model).marginals(evidence=evidence)
+
+    result = sampling.ForwardSampler(model).estimate(
+        evidence=evidence, precision=0.01, batch_size=20_000, seed=7
+    )
+
+    assert result.converged
+    assert result.samples < 10_000_000
+    for node, estimate in result.estimates.items():
+        assert estimate.upper - estimate.probability <= 0.01
+        assert abs(estimate.probability - exact[node][1]) < 0.02
+    assert np.isclose(result.estimates["d"].probability, 1)
+
+
+def test_impossible_evidence():
+    """
+    Evidence that no sample can produce is reported instead of dividing by a zero weight.
+    """
+    sampler = sampling.ForwardSampler(make_model())
+
+    with pytest.raises(ValueError):
+        sampler.estimate(evidence={"and": 1, "c": 0}, max_samples=5000, seed=1)
+
+
+def test_seeded_estimates_do_not_depend_on_the_workers():
+    """
+    The same seed gives the same samples and estimates however many processes draw the batches.
+    """
+    sampler = sampling.ForwardSampler(make_model())
+    results = [
+        sampler.estimate(
+            evidence={"d": 1}, precision=0.002, batch_size=5_000, seed=3, jobs=jobs
+        )
+        for jobs in (1, 2, 3)
+    ]
+
+    assert results[0].samples > 5_000
+    assert results[1] == results[0]
+    assert results[2] == results[0]
@@ -0,0 +1,71 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+
+import numpy as np
+import stix2
+
+import main
+from attack_flow_extension import flow
+from benchmarks import synthetic
+from flow_network import compact
+from stix_probability import cache
+
+
+def test_generated_flows_have_the_requested_shape(tmp_path):
+    """
+    A generated flow is deterministic, valid STIX, and every node is reachable with a bounded fan-in.
+    """
+    shape = synthetic.FlowShape(
+        nodes=300, depth=10, max_fan_in=3, operator_fraction=0.2, seed=7
+    )
+    bundle = synthetic.generate_flow_bundle(shape)
+    assert json.dumps(bundle) == json.dumps(synthetic.generate_flow_bundle(shape))
+    parsed = stix2.parse(bundle, allow_custom=True)
+    assert isinstance(parsed.objects[0], flow.AttackFlow)
+
+    flow_file = tmp_path / "flow.json"
+    flow_file.write_text(json.dumps(bundle), encoding="utf-8")
+    [(_, compact_flow)] = main.build_compact_flows(str(flow_file))
+    assert compact_flow.num_nodes == shape.nodes
+    in_degrees = compact_flow.in_degrees()
+    assert in_degrees.max() <= shape.max_fan_in
+    # only the start layer has no parents, operators have at least two
+    assert np.count_nonzero(in_degrees == 0) == shape.nodes // shape.depth
+    operators = np.isin(compact_flow.kinds, [compact.KIND_AND, compact.KIND_OR])
+    assert operators.any() and in_degrees[operators].min() >= 2
+
+
+def test_generated_attack_bundle_loads_the_same_with_both_loaders(tmp_path):
+    """
+    Both ATT&CK loaders compute the same probabilities and mitigations from the synthetic bundle, and flows
+    only use its techniques.
+    """
+    attack_bundle = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=3))
+    attack_file = tmp_path / "attack.json"
+    attack_file.write_text(json.dumps(attack_bundle), encoding="utf-8")
+
+    streaming = cache.compute_probability_database(str(attack_file), "streaming")
+    mitreattack = cache.compute_probability_database(str(attack_file), "mitreattack")
+    assert streaming.probability_mapping
+    assert {
+        technique: entry.probability
+        for technique, entry in streaming.probability_mapping.items()
+    } == {
+        technique: entry.probability
+        for technique, entry in mitreattack.probability_mapping.items()
+    }
+    assert streaming.mitigations.keys() == mitreattack.mitigations.keys()
+
+    techniques = synthetic.attack_techniques(attack_bundle)
+    flow_bundle = synthetic.generate_flow_bundle(
+        synthetic.FlowShape(nodes=50, depth=5), techniques
+    )
+    used = {
+        (obj["technique_ref"], obj["technique_id"])
+        for obj in flow_bundle["objects"]
+        if obj["type"] == "attack-action"
+    }
+    assert used <= set(techniques)
@@ -0,0 +1,137 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import json
+
+import numpy as np
+import pytest
+
+import main
+from benchmarks import synthetic
+from flow_network import assembly, compact
+from stix_probability import cache, weights
+
+
+def technique(name, ttp, probability):
+    return weights.TechniqueProbability(
+        name, ttp, 1, probability, weights.StixId(f"attack-pattern--{ttp}")
+    )
+
+
+def database(rollup):
+    techniques = [
+        technique("Command and Scripting Interpreter", "T1059", 0.5),
+        technique("PowerShell", "T1059.001", 0.25),
+        technique("OS Credential Dumping", "T1003", 0.125),
+    ]
+    return weights.ProbabilityDatabase(
+        probability_mapping={t.stix_id: t for t in techniques},
+        technique_rollup=rollup,
+    )
+
+
+@pytest.mark.parametrize(
+    "rollup, technique_ref, technique_id, expected",
+    [
+        # found by STIX id, whatever the ATT&CK ID says
+        ("none", "attack-pattern--T1059.001", "T1003", (0.25, "stix_id")),
+        # a STIX id from another release falls back to the ATT&CK ID
+        ("none", "attack-pattern--stale", "T1059.001", (0.25, "external_id")),
+        ("none", None, "T1003", (0.125, "external_id")),
+        ("none", None, "T1059.002", (None, "unresolved")),
+        ("missing", None, "T1059.002", (0.5, "parent")),
+        ("missing", None, "T1059.001", (0.25, "external_id")),
+        ("always", None, "T1059.001", (0.5, "parent")),
+        ("always", "attack-pattern--T1059.001", None, (0.5, "parent")),
+        # parents and techniques without a parent in the database stay as they are
+        ("always", None, "T1059", (0.5, "external_id")),
+        ("always", None, "T1098.001", (None, "unresolved")),
+        ("always", None, None, (None, "no_technique")),
+    ],
+)
+def test_resolve_technique(rollup, technique_ref, technique_id, expected):
+    """
+    Techniques are found by STIX id, then ATT&CK ID, then parent technique as the rollup allows.
+    """
+    found, level = database(rollup).resolve_technique(technique_ref, technique_id)
+    assert (None if found is None else found.probability, level) == expected
+
+
+def test_unknown_rollup():
+    with pytest.raises(ValueError, match="Unknown technique rollup"):
+        database("sometimes")
+
+
+def test_actions_exported_with_only_an_attack_id(tmp_path):
+    """
+    Actions without a technique_ref, or with the technique_ref of another release, get the probability of
+    their technique_id, and the coverage counts them at that level.
+    """
+    attack_bundle = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=8))
+    attack_file = tmp_path / "attack.json"
+    attack_file.write_text(json.dumps(attack_bundle), encoding="utf-8")
+    probability_db = cache.load_probability_database(str(attack_file), None)
+    flow_bundle = synthetic.generate_flow_bundle(
+        synthetic.FlowShape(nodes=80, depth=6, seed=8),
+        synthetic.attack_techniques(attack_bundle),
+    )
+    flow_file = tmp_path / "flow.json"
+    flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+    [(_, original)] = main.build_compact_flows(str(flow_file))
+
+    actions = [obj for obj in flow_bundle["objects"] if obj["type"] == "attack-action"]
+    known = [
+        action
+        for action in actions
+        if action["technique_ref"] in probability_db.probability_mapping
+    ]
+    del known[0]["technique_ref"]
+    known[1]["technique_ref"] = "attack-pattern--00000000-0000-4000-8000-000000000001"
+    del actions[-1]["technique_ref"], actions[-1]["technique_id"]
+    flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+    [(_, edited)] = main.build_compact_flows(str(flow_file))
+
+    expected = compact.node_probabilities(original, probability_db)
+    expected[edited.ids.index(actions[-1]["id"])] = (
+        weights.UNKNOWN_TECHNIQUE_PROBABILITY
+    )
+    assert np.array_equal(compact.node_probabilities(edited, probability_db), expected)
+    coverage = compact.technique_coverage(edited, probability_db)
+    assert coverage[weights.RESOLVED_EXTERNAL_ID] == 2
+    assert coverage[weights.NO_TECHNIQUE] == 1
+    assert sum(coverage.values()) == len(actions)
+    assert compact.technique_coverage(original, probability_db)[
+        weights.RESOLVED_STIX_ID
+    ] == len(known)
+
+
+def test_actions_exported_with_only_an_attack_id_are_mitigated(tmp_path):
+    """
+    Mitigations cover the actions found by ATT&CK ID like they cover the same actions found by STIX id.
+    """
+    attack_bundle = synthetic.generate_attack_bundle(synthetic.AttackShape(seed=9))
+    attack_file = tmp_path / "attack.json"
+    attack_file.write_text(json.dumps(attack_bundle), encoding="utf-8")
+    probability_db = cache.load_probability_database(str(attack_file), None)
+    flow_bundle = synthetic.generate_flow_bundle(
+        synthetic.FlowShape(nodes=60, depth=5, seed=9),
+        synthetic.attack_techniques(attack_bundle),
+    )
+    flow_file = tmp_path / "flow.json"
+
+    def rank_mitigations():
+        flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+        [(attack_flow, compact_flow)] = main.build_compact_flows(str(flow_file))
+        network = assembly.assemble_network(
+            compact_flow, compact.node_probabilities(compact_flow, probability_db)
+        )
+        return main.rank_flow_mitigations([(attack_flow, network)], probability_db)
+
+    expected = rank_mitigations()
+    for action in flow_bundle["objects"]:
+        if action.get("technique_ref") in probability_db.probability_mapping:
+            del action["technique_ref"]
+    [result] = rank_mitigations()
+    assert result["mitigations"]
+    assert [result] == expected
@@ -0,0 +1,103 @@
+import sys
+
+# add local directory to system path
+sys.path.append("./")
+import io
+import json
+import os
+
+import main
+from benchmarks import synthetic
+from flow_network import compact
+from flow_service import watch
+from hugin_net import writer as hugin_writer
+
+FLOW_SHAPE = synthetic.FlowShape(nodes=60, depth=6, seed=1)
+
+
+def save(flow_file, flow_bundle):
+    flow_file.write_text(json.dumps(flow_bundle), encoding="utf-8")
+    # make sure the save is seen even on file systems with coarse timestamps
+    stat = os.stat(flow_file)
+    os.utime(flow_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_first_conversion_matches_main(
+    tmp_path, write_synthetic_flow, synthetic_probability_db
+):
+    """
+    The watcher first writes what main.py writes, and does nothing when the export is saved unchanged.
+    """
+    flow_file = tmp_path / "flow.json"
+    flow_bundle = write_synthetic_flow(FLOW_SHAPE, flow_file)
+    main.convert_flow_file(
+        str(flow_file), str(tmp_path / "main.net"), synthetic_probability_db
+    )
+    watcher = watch.FlowWatcher(
+        str(flow_file), str(tmp_path / "watch.net"), synthetic_probability_db
+    )
+    assert watcher.changed()
+    [update] = watcher.convert().values()
+    assert len(update.added) == len(update.rebuilt_cpds) == 60
+    assert (tmp_path / "watch.net").read_text(encoding="utf-8") == (
+        tmp_path / "main.net"
+    ).read_text(encoding="utf-8")
+
+    assert not watcher.changed()
+    save(flow_file, flow_bundle)
+    assert watcher.changed() and watcher.convert() is None
+
+
+def test_edits_only_rebuild_what_changed(
+    tmp_path, write_synthetic_flow, synthetic_probability_db
+):
+    """
+    After an edit only the CPDs of changed nodes are formatted again, existing nodes keep their positions,
+    and the file is the one the edited flow gives with those positions.
+    """
+    flow_file = tmp_path / "flow.json"
+    flow_bundle = write_synthetic_flow(FLOW_SHAPE, flow_file)
+    output_file = tmp_path / "watch.net"
+    watcher = watch.FlowWatcher(
+        str(flow_file), str(output_file), synthetic_probability_db
+    )
+    watcher.convert()
+    [net] = watcher.nets.values()
+    positions = dict(net.positions)
+
+    objects = flow_bundle["objects"]
+    actions = [obj for obj in objects if obj["type"] == "attack-action"]
+    retargeted, parent = actions[3], actions[-1]
+    other = next(
+        obj
+        for obj in actions
+        if obj["technique_ref"] != retargeted["technique_ref"]
+        and synthetic_probability_db.get_probability_for_technique(obj["technique_ref"])
+        != synthetic_probability_db.get_probability_for_technique(
+            retargeted["technique_ref"]
+        )
+    )
+    retargeted["technique_ref"] = other["technique_ref"]
+    added = dict(parent, id="attack-action--00000000-0000-4000-8000-000000000001")
+    added.pop("effect_refs", None)
+    parent.setdefault("effect_refs", []).append(added["id"])
+    objects.append(added)
+    save(flow_file, flow_bundle)
+
+    [update] = watcher.convert().values()
+    assert update.added == [added["id"]] and update.removed == []
+    assert sorted(update.rebuilt_cpds) == sorted([retargeted["id"], added["id"]])
+    assert all(net.positions[node] == position for node, position in positions.items())
+    assert len(set(net.positions.values())) == len(net.positions)
+
+    [(_, compact_flow)] = main.build_compact_flows(
+        str(flow_file), main.ConversionOptions(layout=False)
+    )
+    compact_flow.positions = [net.positions[node] for node in compact_flow.ids]
+    expected = io.StringIO()
+    hugin_writer.write_compact_net(
+        compact_flow,
+        compact.node_probabilities(compact_flow, synthetic_probability_db),
+        expected,
+    )
+    assert output_file.read_text(encoding="utf-8") == expected.getvalue()